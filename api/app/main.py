@@ -2,7 +2,10 @@
 Point d'entrée FastAPI pour l'API Langgraph-RAG.
 CORS + garde frontend (Origin/Referer + option clé API) pour limiter l'accès au front.
 """
+import asyncio
+import logging
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -15,12 +18,70 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.middleware.frontend_guard import FrontendGuardMiddleware
+from app.middleware.upload_limit import UploadLimitMiddleware
 from app.routes import health, rag, settings
+from app.services import upload_spool
+
+_log = logging.getLogger(__name__)
+
+
+def _warmup() -> None:
+    """Ouvre les ressources partagées (client Chroma, embeddings, tokenizer) hors du thread principal."""
+    from app.services import conversion_service, document_store, vector_map, vector_store
+    from app.services.embedding_pipeline import warm_encoding
+    from app.services.settings_service import get_settings
+
+    vector_store.open_store()
+    document_store.ensure_catalog()
+    document_store.ensure_keyword_index()
+    if vector_store.is_available():
+        vector_map.schedule_refresh()
+    settings = get_settings()
+    # Tokenizer du modèle de chat (contexte) et par défaut (lots d'embeddings) : un
+    # téléchargement éventuel se fait ici plutôt qu'à la première question
+    warm_encoding(settings.get("chat", {}).get("model"))
+    warm_encoding()
+    conversion_service.preload(settings.get("docling", {}))
+
+
+async def _start_ingest_workers(warmup: asyncio.Future) -> None:
+    """Démarre les workers d'ingestion (reprise des jobs interrompus) une fois les services ouverts."""
+    try:
+        await warmup
+    except Exception:
+        pass  # journalisé à l'arrêt ; les workers ouvrent eux-mêmes ce qui leur manque
+    from app.services import batch_ingest
+
+    batch_ingest.start_workers()
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Ouverture en tâche de fond : le port s'ouvre immédiatement (health check Render)
+    warmup = asyncio.get_running_loop().run_in_executor(None, _warmup)
+    workers = asyncio.ensure_future(_start_ingest_workers(warmup))
+    try:
+        yield
+    finally:
+        try:
+            await warmup
+        except Exception as e:
+            _log.warning("Initialisation des services échouée: %s", e)
+        await workers
+        from app.services import batch_ingest, conversion_service, document_store, vector_store
+
+        await batch_ingest.shutdown()
+        batch_ingest.close_queue()
+        conversion_service.shutdown()
+        document_store.close_keyword_indexes()
+        vector_store.close_store()
+
 
 app = FastAPI(
     title="Langgraph-RAG API",
     description="API RAG avec Langgraph et Docling",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Origines autorisées : dev local + GitHub Pages (à personnaliser selon votre compte)
@@ -30,12 +91,25 @@ if origin := os.getenv("GITHUB_PAGES_ORIGIN"):
     _front_origins.append(origin.strip())
 _front_origins = [o.strip() for o in _front_origins if o.strip()]
 
+# Taille des envois bornée pendant la réception, avant que Starlette ne lise le corps
+# (ajouté avant CORS : la réponse 413 garde les en-têtes CORS)
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={
+        "/api/rag/ingest": upload_spool.max_request_bytes,
+        "/api/rag/ingest-stream": upload_spool.max_request_bytes,
+        "/api/rag/ingest-batch": lambda: upload_spool.max_request_bytes(batch=True),
+        "/api/rag/documents/{doc_id}/reingest": upload_spool.max_request_bytes,
+    },
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=_front_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Job-Id"],
 )
 
 # Garde frontend : rejette les requêtes sans Origin/Referer autorisé (curl, Postman, etc.)
@@ -0,0 +1,111 @@
+"""
+Middleware limitant la taille du corps des requêtes d'envoi de fichiers.
+
+Starlette lit tout le corps multipart (copié dans ses propres fichiers temporaires) avant
+d'appeler la route : la limite appliquée ensuite par spool_upload arriverait trop tard.
+Ici, un Content-Length trop grand est refusé (413) sans lire le corps, et sinon
+(transfert par morceaux, en-tête absent ou faux) les octets sont comptés à chaque bloc
+reçu : la réception s'arrête dès que la limite est dépassée.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import Callable, List, Optional, Pattern, Tuple
+
+# Limite (octets) par chemin, lue à chaque requête ; None : illimitée
+LimitGetter = Callable[[], Optional[int]]
+
+
+def _compile_path(path: str) -> Pattern[str]:
+    """Chemin de route ("/documents/{doc_id}/reingest") -> expression régulière du chemin complet."""
+    parts = re.split(r"(\{[^}/]+\})", path.rstrip("/"))
+    return re.compile("".join("[^/]+" if p.startswith("{") else re.escape(p) for p in parts))
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+async def _reject(send, limit: int) -> None:
+    body = json.dumps(
+        {"detail": f"Fichier trop volumineux (maximum {limit // (1024 * 1024)} Mo)"}
+    ).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"connection", b"close"),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class UploadLimitMiddleware:
+    """
+    Middleware ASGI : limits associe un chemin de route (sans slash final, paramètres
+    {nom} acceptés comme dans les routes) à sa limite.
+    """
+
+    def __init__(self, app, limits: dict[str, LimitGetter]):
+        self.app = app
+        self.limits: List[Tuple[Pattern[str], LimitGetter]] = [
+            (_compile_path(path), get_limit) for path, get_limit in limits.items()
+        ]
+
+    def _limit_for(self, path: str) -> Optional[int]:
+        path = path.rstrip("/")
+        for pattern, get_limit in self.limits:
+            if pattern.fullmatch(path):
+                return get_limit()
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST":
+            return await self.app(scope, receive, send)
+        limit = self._limit_for(scope["path"])
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b""))
+        except ValueError:
+            declared = None
+        if declared is not None and declared > limit:
+            return await _reject(send, limit)
+
+        received = 0
+        exceeded = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal rejected
+            # FastAPI transforme l'erreur de lecture du corps en 400 : remplacée par le 413
+            if exceeded:
+                if message["type"] == "http.response.start" and not rejected:
+                    rejected = True
+                    await _reject(send, limit)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            if not rejected:
+                rejected = True
+                await _reject(send, limit)
@@ -5,11 +5,12 @@ le temps de démarrage (port ouvert rapidement pour Render, health check immédi
 """
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
-from typing import Optional
+from typing import Any, List, Optional
 
-from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi import APIRouter, File, Query, Request, Response, UploadFile, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
@@ -24,6 +25,11 @@ class QueryRequest(BaseModel):
 class RetrievedChunk(BaseModel):
     text: str
     score: Optional[float] = None
+    # Scores par source en mode hybride (distance vectorielle, score BM25)
+    vector_score: Optional[float] = None
+    keyword_score: Optional[float] = None
+    # Score du reranker (second étage), si le chunk a été scoré
+    rerank_score: Optional[float] = None
 
 
 class QueryResponse(BaseModel):
@@ -31,60 +37,229 @@ class QueryResponse(BaseModel):
     sources: list[str] = []
     retrieved_chunks: list[RetrievedChunk] = []
     retrieval_method: str = "keyword"
+    # Taille du contexte envoyé au LLM (tokens, après fusion des chunks voisins)
+    context_tokens: int = 0
+    # Second étage du retrieval : backend, candidats, scorés, timed_out (None si désactivé)
+    rerank: Optional[dict[str, Any]] = None
+    # Durée de chaque étape (ms) : cache_ms, retrieve_ms, rerank_ms, generate_ms
+    timings: dict[str, float] = {}
+    # True si la réponse vient du cache sémantique (pas d'appel au LLM)
+    cached: bool = False
+
+
+async def _receive_upload(file: UploadFile, allow_archive: bool = False):
+    """
+    Copie l'envoi reçu par Starlette dans le spool (limite docling.max_file_size -> 413).
+    La taille du corps de la requête est déjà bornée pendant la réception (UploadLimitMiddleware).
+    allow_archive : les archives zip / tar sont limitées par INGEST_MAX_ARCHIVE_MB.
+    """
+    from app.services.upload_spool import (
+        FileTooLargeError,
+        is_archive,
+        max_archive_bytes,
+        max_upload_bytes,
+        spool_upload,
+    )
+
+    if not file.filename:
+        raise HTTPException(400, "Nom de fichier manquant")
+    archive = allow_archive and is_archive(file.filename)
+    try:
+        return await spool_upload(file, file.filename, max_archive_bytes() if archive else max_upload_bytes())
+    except FileTooLargeError as e:
+        raise HTTPException(413, str(e)) from e
 
 
 @router.post("/ingest", status_code=201)
 async def ingest(file: UploadFile = File(...)):
     """Ingère un document (PDF, etc.) via Docling et l'ajoute au contexte RAG."""
-    from app.services.docling_ingest import ingest_document
+    from app.services.docling_ingest import ingest_file
 
-    if not file.filename:
-        raise HTTPException(400, "Nom de fichier manquant")
-    content = await file.read()
+    upload = await _receive_upload(file)
     try:
-        doc_id, chunks = await ingest_document(content, filename=file.filename)
-        return {"id": doc_id, "filename": file.filename, "chunks": len(chunks)}
+        doc_id, chunks = await ingest_file(upload)
+        return {"id": doc_id, "filename": upload.filename, "chunks": len(chunks)}
     except Exception as e:
         _log.exception("Erreur d'ingestion: %s", e)
         raise HTTPException(422, "Erreur d'ingestion du document") from e
+    finally:
+        upload.cleanup()
+
+
+def _sse(events, job_id: Optional[str] = None) -> StreamingResponse:
+    async def event_stream():
+        async for event in events:
+            yield f"data: {json.dumps(event)}\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if job_id is not None:
+        headers["X-Job-Id"] = job_id
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
 
 
 @router.post("/ingest-stream")
 async def ingest_stream(file: UploadFile = File(...)):
-    """Ingère un document en streamant les statuts (SSE)."""
-    from app.services.docling_ingest import ingest_document_stream
+    """
+    Ingère un document en streamant les statuts (SSE). L'ingestion est un job de la file
+    durable : elle continue si le client se déconnecte (suivi via /jobs/{job_id}).
+    """
+    from app.services import batch_ingest
+
+    upload = await _receive_upload(file)
+    job_id = await batch_ingest.enqueue([upload])
+
+    async def file_events():
+        async for event in batch_ingest.follow_job(job_id):
+            if event["step"] not in ("batch_start", "batch_done"):
+                yield event
+
+    return _sse(file_events(), job_id)
+
+
+@router.post("/ingest-batch")
+async def ingest_batch(
+    files: List[UploadFile] = File(...),
+    stream: bool = Query(True, description="false : répond 202 avec le job_id sans attendre"),
+):
+    """
+    Ingère plusieurs fichiers et/ou archives (zip, tar, tar.gz…) dans un seul job de la file.
+    stream=true : statuts SSE par fichier (format de /ingest-stream, plus job_id, file_index,
+    filename ; batch_start / batch_done encadrent le job). Le job continue si le client se
+    déconnecte ; son état reste consultable via GET /jobs/{job_id}.
+    """
+    from app.services import batch_ingest
+    from app.services.upload_spool import FileTooLargeError
+
+    received = []
+    try:
+        for file in files:
+            received.append(await _receive_upload(file, allow_archive=True))
+        uploads = await batch_ingest.expand_uploads(received)
+    except HTTPException:
+        for upload in received:
+            upload.cleanup()
+        raise
+    except FileTooLargeError as e:
+        raise HTTPException(413, str(e)) from e
+    except ValueError as e:
+        raise HTTPException(400, str(e)) from e
+    if not uploads:
+        raise HTTPException(400, "Aucun fichier à importer")
+
+    job_id = await batch_ingest.enqueue(uploads)
+    if not stream:
+        return Response(
+            content=json.dumps({"job_id": job_id, "files": [u.filename for u in uploads]}),
+            status_code=202,
+            media_type="application/json",
+        )
+    return _sse(batch_ingest.follow_job(job_id), job_id)
 
-    if not file.filename:
-        raise HTTPException(400, "Nom de fichier manquant")
-    content = await file.read()
 
-    async def event_stream():
-        async for event in ingest_document_stream(content, filename=file.filename):
-            yield f"data: {json.dumps(event)}\n\n"
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    État d'un job d'ingestion : statut global et, par fichier, statut (queued, running, done,
+    error), dernière étape terminée (received, converted, split, stored) et chunks embeddés.
+    """
+    from app.services import batch_ingest
 
-    return StreamingResponse(
-        event_stream(),
-        media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
-    )
+    job = await asyncio.to_thread(batch_ingest.get_job, job_id)
+    if job is None:
+        raise HTTPException(404, "Job introuvable")
+    return job
+
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """Progression d'un job en SSE (événements déjà émis puis suivi jusqu'à batch_done)."""
+    from app.services import batch_ingest
+
+    if await asyncio.to_thread(batch_ingest.get_job, job_id) is None:
+        raise HTTPException(404, "Job introuvable")
+    return _sse(batch_ingest.follow_job(job_id), job_id)
+
+
+@router.get("/metrics")
+async def metrics():
+    """Métriques internes (file de conversion Docling, cache de réponses)."""
+    from app.services import answer_cache, conversion_service
+
+    return {"conversion": conversion_service.stats(), "answer_cache": answer_cache.stats()}
+
+
+def _parse_bbox(bbox: Optional[str]) -> Optional[tuple]:
+    if bbox is None:
+        return None
+    try:
+        xmin, ymin, xmax, ymax = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(400, "bbox attendu : xmin,ymin,xmax,ymax")
+    if xmin > xmax or ymin > ymax:
+        raise HTTPException(400, "bbox invalide (min > max)")
+    return (xmin, ymin, xmax, ymax)
 
 
 @router.get("/vector-map")
-async def vector_map():
-    """Retourne les points pour la carte 2D des vecteurs (t-SNE)."""
-    from app.services import vector_store
+async def vector_map(
+    bbox: Optional[str] = Query(None, description="xmin,ymin,xmax,ymax"),
+    zoom: int = Query(0, ge=0, le=12),
+    max_points: int = Query(5000, ge=1, le=200000),
+    snippets: bool = False,
+    format: str = Query("json", pattern="^(json|columnar|binary)$"),
+):
+    """
+    Retourne la carte 2D des vecteurs précalculée (sans calcul pendant la requête).
+    stale = la carte ne reflète pas encore la dernière version du corpus (mise à jour en cours).
+    bbox restreint la zone ; au-delà de max_points, les zones denses sont agrégées (count > 1)
+    avec une finesse croissante selon zoom. Extraits de texte : snippets=true ou
+    /vector-map/points/{index}. format=columnar (tableaux) ou binary (colonnes float32/uint32).
+    """
+    from app.services import vector_map as vector_map_service
+
+    result = await asyncio.to_thread(
+        vector_map_service.get_map,
+        bbox=_parse_bbox(bbox),
+        zoom=zoom,
+        max_points=max_points,
+        snippets=snippets,
+        columnar=format != "json",
+    )
+    if format == "binary":
+        return Response(
+            content=vector_map_service.encode_binary(result),
+            media_type="application/octet-stream",
+        )
+    return result
 
-    available = vector_store.is_available()
-    points = vector_store.get_vector_map_points() if available else []
-    return {"available": available, "points": points}
 
+@router.get("/vector-map/points/{index}")
+async def vector_map_point(index: int, version: Optional[int] = None):
+    """Détail d'un point de la carte (extrait de texte) ; 404 si la carte a changé depuis `version`."""
+    from app.services import vector_map as vector_map_service
+
+    point = vector_map_service.get_point(index, version)
+    if point is None:
+        raise HTTPException(404, "Point inconnu")
+    return point
 
-@router.get("/documents")
-async def documents_list():
-    """Liste les documents ingérés (id, filename, chunk_count)."""
-    from app.services.docling_ingest import list_documents
 
-    return list_documents()
+@router.get("/documents")
+async def documents_list(
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    sort: str = Query("ingested_at", pattern="^(ingested_at|filename|chunk_count)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+):
+    """
+    Liste les documents ingérés (id, filename, chunk_count, ingested_at…) depuis le catalogue.
+    Pagination par offset / limit ; le nombre total est renvoyé dans l'en-tête X-Total-Count.
+    """
+    from app.services.docling_ingest import count_documents, list_documents
+
+    response.headers["X-Total-Count"] = str(count_documents())
+    return list_documents(offset=offset, limit=limit, sort=sort, descending=order == "desc")
 
 
 @router.get("/documents/{doc_id}/chunks")
@@ -111,22 +286,21 @@ async def documents_delete(doc_id: str):
 @router.post("/documents/{doc_id}/reingest", status_code=200)
 async def documents_reingest(doc_id: str, file: UploadFile = File(...)):
     """Ré-ingère un document avec les paramètres actuels (remplace l'existant)."""
-    from app.services.docling_ingest import (
-        get_chunks_by_document_id,
-        ingest_document_with_id,
-    )
+    from app.services.docling_ingest import document_exists, ingest_file
 
     if not file.filename:
         raise HTTPException(400, "Nom de fichier manquant")
-    if get_chunks_by_document_id(doc_id) is None:
+    if not document_exists(doc_id):
         raise HTTPException(404, "Document non trouvé")
-    content = await file.read()
+    upload = await _receive_upload(file)
     try:
-        _, chunks = await ingest_document_with_id(content, file.filename, doc_id)
-        return {"id": doc_id, "filename": file.filename, "chunks": len(chunks)}
+        _, chunks = await ingest_file(upload, doc_id)
+        return {"id": doc_id, "filename": upload.filename, "chunks": len(chunks)}
     except Exception as e:
         _log.exception("Erreur de ré-ingestion: %s", e)
         raise HTTPException(422, "Erreur de ré-ingestion du document") from e
+    finally:
+        upload.cleanup()
 
 
 @router.post("/query", response_model=QueryResponse)
@@ -143,7 +317,48 @@ async def query(req: QueryRequest):
             sources=result.get("sources", []),
             retrieved_chunks=result.get("retrieved_chunks", []),
             retrieval_method=result.get("retrieval_method", "keyword"),
+            context_tokens=result.get("context_tokens", 0),
+            rerank=result.get("rerank"),
+            timings=result.get("timings", {}),
+            cached=result.get("cached", False),
         )
     except Exception as e:
         _log.exception("Erreur RAG: %s", e)
         raise HTTPException(500, "Erreur lors de la requête RAG") from e
+
+
+@router.post("/query-stream")
+async def query_stream(req: QueryRequest, request: Request):
+    """
+    Pose une question au RAG en streamant la réponse (SSE) : "retrieved" (chunks et scores),
+    puis "token" au fil de la génération, puis "done" (réponse complète et sources).
+    """
+    from app.services.rag_graph import stream_rag
+
+    if not req.question.strip():
+        raise HTTPException(400, "Question vide")
+
+    async def event_stream():
+        stream = stream_rag(req.question)
+        try:
+            async for event in stream:
+                if await request.is_disconnected():
+                    _log.info("Client déconnecté, génération annulée")
+                    break
+                if event["step"] == "retrieved":
+                    event["retrieved_chunks"] = [
+                        RetrievedChunk(**c).model_dump() for c in event["retrieved_chunks"]
+                    ]
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            _log.exception("Erreur RAG (stream): %s", e)
+            yield f"data: {json.dumps({'step': 'error', 'message': 'Erreur lors de la requête RAG'})}\n\n"
+        finally:
+            # Ferme le générateur : interrompt l'appel LLM en cours si le client est parti
+            await stream.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -4,6 +4,7 @@ import logging
 from fastapi import APIRouter, HTTPException
 from pydantic import ValidationError
 
+from app.services import settings_service
 from app.services.settings_service import get_settings, update_settings
 
 router = APIRouter()
@@ -16,9 +17,46 @@ async def settings_get():
     return get_settings()
 
 
+def _changed(settings: dict, section: str, key: str) -> bool:
+    """True si le PUT modifie section.key (le front renvoie toutes les sections à chaque sauvegarde)."""
+    value = settings.get(section)
+    if not isinstance(value, dict) or not isinstance(value.get(key), str):
+        return False
+    current = settings_service.get_snapshot().data.get(section, {})
+    return value[key] != current.get(key)
+
+
+def _check_registered(settings: dict) -> None:
+    """
+    Les backends choisis doivent exister dans le registre du service (422 sinon). Seules les
+    valeurs modifiées sont vérifiées : une valeur déjà enregistrée (fournisseur openai sans
+    clé API, mode mots-clés) n'empêche pas de sauvegarder les autres paramètres.
+    """
+    rerank = settings.get("rerank")
+    if _changed(settings, "rerank", "backend"):
+        from app.services import reranker
+
+        if rerank["backend"] not in reranker.backend_names():
+            raise HTTPException(422, f"Backend de rerank inconnu : {rerank['backend']}")
+    embeddings = settings.get("embeddings")
+    if _changed(settings, "embeddings", "provider"):
+        from app.services import embedding_providers
+
+        if embeddings["provider"] not in embedding_providers.provider_names():
+            raise HTTPException(422, f"Fournisseur d'embeddings inconnu : {embeddings['provider']}")
+        # Sinon le vector store serait désactivé sans autre signe (recherche par mots-clés)
+        if not embedding_providers.is_available(embeddings["provider"]):
+            raise HTTPException(
+                422,
+                f"Fournisseur d'embeddings indisponible : {embeddings['provider']} "
+                "(paquet non installé ou clé API manquante)",
+            )
+
+
 @router.put("")
 async def settings_update(settings: dict):
     """Met à jour les paramètres (fusion partielle avec la config actuelle)."""
+    _check_registered(settings)
     try:
         return update_settings(settings)
     except ValidationError as e:
@@ -1,5 +1,6 @@
 """
-Schéma Pydantic pour la configuration (chunks, Docling, retriever, chat).
+Schéma Pydantic pour la configuration (chunks, Docling, ingestion, retriever, chat,
+cache de réponses).
 Seules les clés définies ici sont acceptées et persistées.
 """
 from typing import List, Optional
@@ -11,6 +12,8 @@ class ChunksSettings(BaseModel):
     chunk_size: int = Field(default=1000, ge=100, le=10000)
     chunk_overlap: int = Field(default=200, ge=0, le=2000)
     separators: List[str] = Field(default=["\n\n", "\n", " ", ""], min_length=1)
+    # recursive : séparateurs ci-dessus ; structure : titres, tableaux et pages (Docling)
+    strategy: str = Field(default="recursive", pattern="^(recursive|structure)$")
 
 
 class DoclingSettings(BaseModel):
@@ -21,15 +24,61 @@ class DoclingSettings(BaseModel):
     table_former_mode: str = Field(default="ACCURATE", pattern="^(ACCURATE|FAST)$")
     enable_remote_services: bool = False
     artifacts_path: Optional[str] = None
+    # PDF d'au moins parallel_min_pages pages : conversion parallèle par plages de page_range_size pages
+    parallel_min_pages: int = Field(default=64, ge=2, le=10000)
+    page_range_size: int = Field(default=32, ge=1, le=1000)
 
 
 class RetrieverSettings(BaseModel):
     k: int = Field(default=5, ge=1, le=20)
+    # auto : sémantique si le vector store est disponible, sinon mots-clés
+    mode: str = Field(default="auto", pattern="^(auto|similarity|keyword|hybrid)$")
+
+
+class RerankSettings(BaseModel):
+    # Second étage : les `candidates` premiers résultats sont réordonnés, les k meilleurs gardés
+    enabled: bool = False
+    # auto : cross-encoder si sentence-transformers est installé, sinon lexical (BM25 sur les candidats) ;
+    # cross_encoder, onnx, lexical ou backend ajouté par reranker.register_backend (vérifié par PUT /settings)
+    backend: str = Field(default="auto", pattern="^[a-z0-9_]+$")
+    model: str = Field(default="cross-encoder/ms-marco-MiniLM-L-6-v2", min_length=1)
+    candidates: int = Field(default=30, ge=1, le=100)
+    batch_size: int = Field(default=16, ge=1, le=256)
+    timeout_ms: int = Field(default=800, ge=50, le=30000)
+
+
+class EmbeddingsSettings(BaseModel):
+    # openai : API OpenAI (OPENAI_API_KEY) ; fastembed : modèle ONNX local sur CPU, hors ligne ;
+    # ou fournisseur ajouté par embedding_providers.register_provider (vérifié par PUT /settings)
+    provider: str = Field(default="openai", pattern="^[a-z0-9_]+$")
+    # Modèle du fournisseur (vide = modèle par défaut) ; chaque modèle a sa collection Chroma
+    model: Optional[str] = Field(default=None, min_length=1)
+    # Modèle local : textes par inférence et threads ONNX Runtime (vide = tous les cœurs)
+    batch_size: int = Field(default=64, ge=1, le=1024)
+    threads: Optional[int] = Field(default=None, ge=1, le=64)
+
+
+class IngestionSettings(BaseModel):
+    # Lots d'embeddings : budget en tokens et nombre maximal de chunks par requête
+    embed_batch_tokens: int = Field(default=8000, ge=500, le=300000)
+    embed_batch_size: int = Field(default=256, ge=1, le=2048)
+    embed_concurrency: int = Field(default=4, ge=1, le=16)
+    embed_max_retries: int = Field(default=3, ge=0, le=10)
 
 
 class ChatSettings(BaseModel):
     model: str = Field(default="gpt-4o-mini", min_length=1)
     temperature: float = Field(default=0.0, ge=0.0, le=2.0)
+    # Budget de tokens du contexte envoyé au modèle (passages retrouvés, sans la question)
+    max_context_tokens: int = Field(default=3000, ge=100, le=200000)
+
+
+class AnswerCacheSettings(BaseModel):
+    enabled: bool = True
+    # Similarité cosinus minimale entre deux questions pour réutiliser une réponse
+    similarity_threshold: float = Field(default=0.95, ge=0.5, le=1.0)
+    ttl_seconds: int = Field(default=3600, ge=0, le=604800)  # 0 = sans expiration
+    max_entries: int = Field(default=512, ge=1, le=100000)
 
 
 class AppSettings(BaseModel):
@@ -37,5 +86,9 @@ class AppSettings(BaseModel):
 
     chunks: ChunksSettings = Field(default_factory=ChunksSettings)
     docling: DoclingSettings = Field(default_factory=DoclingSettings)
+    embeddings: EmbeddingsSettings = Field(default_factory=EmbeddingsSettings)
+    ingestion: IngestionSettings = Field(default_factory=IngestionSettings)
     retriever: RetrieverSettings = Field(default_factory=RetrieverSettings)
+    rerank: RerankSettings = Field(default_factory=RerankSettings)
     chat: ChatSettings = Field(default_factory=ChatSettings)
+    answer_cache: AnswerCacheSettings = Field(default_factory=AnswerCacheSettings)
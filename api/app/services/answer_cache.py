@@ -0,0 +1,191 @@
+"""
+Cache sémantique des réponses RAG.
+Clé : embedding de la question (normalisé) ; une question dont la similarité cosinus avec
+une entrée dépasse le seuil configuré réutilise sa réponse sans appel au LLM. Chaque entrée
+garde les ids des chunks récupérés et la version du corpus au moment de la réponse :
+toute ingestion / suppression de document change la version et vide le cache.
+Éviction par TTL et LRU (nombre maximal d'entrées).
+Avec numpy, les vecteurs forment une matrice (reconstruite après chaque modification) et
+une recherche est un seul produit matrice-vecteur ; sinon, parcours Python des entrées.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
+_DEFAULT_THRESHOLD = 0.95
+_DEFAULT_TTL_SECONDS = 3600
+_DEFAULT_MAX_ENTRIES = 512
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    vector: List[float]
+    result: dict[str, Any]
+    chunk_ids: List[str]
+    corpus_version: int
+    created_at: float
+
+
+def _normalize(vector: Sequence[float]) -> Optional[List[float]]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm == 0:
+        return None
+    return [x / norm for x in vector]
+
+
+def _dot(a: Sequence[float], b: Sequence[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+class AnswerCache:
+    """Cache LRU + TTL thread-safe, recherche par similarité cosinus."""
+
+    def __init__(
+        self,
+        threshold: float = _DEFAULT_THRESHOLD,
+        ttl_seconds: float = _DEFAULT_TTL_SECONDS,
+        max_entries: int = _DEFAULT_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_key = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        # (dimension, clés, matrice des vecteurs, versions, dates) ; None après modification
+        self._index: Optional[Tuple[int, List[int], Any, Any, Any]] = None
+
+    def configure(self, threshold: float, ttl_seconds: float, max_entries: int) -> None:
+        with self._lock:
+            self.threshold = threshold
+            self.ttl_seconds = ttl_seconds
+            self.max_entries = max_entries
+            self._evict_locked(time.monotonic())
+
+    def _expired(self, entry: CachedAnswer, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def _evict_locked(self, now: float) -> None:
+        size = len(self._entries)
+        for key in [k for k, e in self._entries.items() if self._expired(e, now)]:
+            del self._entries[key]
+            self._evictions += 1
+        while len(self._entries) > max(0, self.max_entries):
+            self._entries.popitem(last=False)
+            self._evictions += 1
+        if len(self._entries) != size:
+            self._index = None
+
+    def _index_locked(self, dim: int) -> Tuple[int, List[int], Any, Any, Any]:
+        # Entrées de même dimension que la question (les autres viennent d'un autre modèle)
+        if self._index is None or self._index[0] != dim:
+            keys = [k for k, e in self._entries.items() if len(e.vector) == dim]
+            entries = [self._entries[k] for k in keys]
+            self._index = (
+                dim,
+                keys,
+                np.asarray([e.vector for e in entries], dtype=np.float32).reshape(len(keys), dim),
+                np.asarray([e.corpus_version for e in entries], dtype=np.int64),
+                np.asarray([e.created_at for e in entries], dtype=np.float64),
+            )
+        return self._index
+
+    def _best_key_locked(self, query: List[float], corpus_version: int, now: float) -> Optional[int]:
+        if np is not None:
+            _, keys, matrix, versions, created = self._index_locked(len(query))
+            if not keys:
+                return None
+            valid = versions == corpus_version
+            if self.ttl_seconds > 0:
+                valid &= now - created <= self.ttl_seconds
+            sims = np.where(valid, matrix @ np.asarray(query, dtype=np.float32), -np.inf)
+            best = int(np.argmax(sims))
+            return keys[best] if sims[best] >= self.threshold else None
+        best_key, best_sim = None, self.threshold
+        for key, entry in self._entries.items():
+            if entry.corpus_version != corpus_version or self._expired(entry, now):
+                continue
+            sim = _dot(query, entry.vector)
+            if sim >= best_sim:
+                best_key, best_sim = key, sim
+        return best_key
+
+    def lookup(self, vector: Sequence[float], corpus_version: int) -> Optional[CachedAnswer]:
+        """
+        Meilleure entrée au-dessus du seuil pour cette version du corpus, sinon None.
+        Bloquant (calcul sous verrou) : à appeler hors de la boucle d'événements.
+        """
+        query = _normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            best_key = self._best_key_locked(query, corpus_version, now) if query is not None else None
+            if best_key is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._hits += 1
+            return self._entries[best_key]
+
+    def store(
+        self,
+        question: str,
+        vector: Sequence[float],
+        result: dict[str, Any],
+        chunk_ids: Sequence[str],
+        corpus_version: int,
+    ) -> None:
+        normalized = _normalize(vector)
+        if normalized is None or self.max_entries <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._entries[self._next_key] = CachedAnswer(
+                question, normalized, result, list(chunk_ids), corpus_version, now
+            )
+            self._next_key += 1
+            self._index = None
+            self._evict_locked(now)
+
+    def invalidate(self) -> None:
+        """Vide le cache (corpus modifié, paramètres de retrieval / LLM modifiés)."""
+        with self._lock:
+            self._entries.clear()
+            self._index = None
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / total, 4) if total else 0.0,
+            }
+
+
+_cache = AnswerCache()
+
+
+def get_cache() -> AnswerCache:
+    return _cache
+
+
+def invalidate() -> None:
+    _cache.invalidate()
+
+
+def stats() -> dict[str, Any]:
+    return _cache.stats()
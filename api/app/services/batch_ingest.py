@@ -0,0 +1,449 @@
+"""
+Ingestion en tâche de fond : file durable de jobs (job_queue, SQLite à côté de data/chroma)
+traitée par des workers asyncio démarrés avec l'application. Un job regroupe un ou plusieurs
+fichiers (archives zip / tar dépliées) ; chaque fichier avance en pipeline : conversion
+bornée par conversion_service (pool Docling), découpage, puis enregistrement (embeddings +
+écriture) borné par un sémaphore commun aux workers.
+Les fichiers reçus et les résultats intermédiaires (texte converti, chunks) sont gardés dans
+data/ingest_jobs/<job_id>/ jusqu'à la fin du fichier : après un redémarrage, un fichier
+interrompu reprend à sa dernière étape terminée, et les lots d'embeddings déjà calculés sont
+relus dans le cache d'embeddings. Les événements (format de ingest_file_stream, plus job_id /
+file_index / filename) sont diffusés en direct aux clients qui suivent le job ; le job continue
+si le client se déconnecte et son état reste consultable par son id.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, List, Optional
+
+from app.services import document_store, vector_store
+from app.services.docling_ingest import IngestCheckpoint
+from app.services.job_queue import JobQueue
+from app.services.upload_spool import (
+    SpooledUpload,
+    expand_archive,
+    is_archive,
+    max_upload_bytes,
+)
+
+_log = logging.getLogger(__name__)
+
+_JOBS_DIR = "ingest_jobs"
+_QUEUE_FILE = "ingest_jobs.sqlite3"
+_DEFAULT_WORKERS = 4
+_DEFAULT_STORE_CONCURRENCY = 2
+# Tentatives d'un fichier interrompu (arrêt du processus) avant de le passer en erreur
+_DEFAULT_MAX_ATTEMPTS = 3
+# Jobs terminés conservés pour consultation (les plus anciens sont oubliés)
+_MAX_FINISHED_JOBS = 100
+# Relecture de la file quand aucun job n'est signalé (jobs ajoutés par un autre processus)
+_IDLE_POLL_SECONDS = 5.0
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name, "").strip()
+    try:
+        return max(1, int(raw)) if raw else default
+    except ValueError:
+        return default
+
+
+def _worker_count() -> int:
+    """Fichiers traités simultanément (INGEST_BATCH_CONCURRENCY)."""
+    return _env_int("INGEST_BATCH_CONCURRENCY", _DEFAULT_WORKERS)
+
+
+def _store_concurrency() -> int:
+    """Enregistrements (embeddings) simultanés (INGEST_STORE_CONCURRENCY)."""
+    return _env_int("INGEST_STORE_CONCURRENCY", _DEFAULT_STORE_CONCURRENCY)
+
+
+def _max_attempts() -> int:
+    """Tentatives maximales d'un fichier dont le traitement est interrompu (INGEST_MAX_ATTEMPTS)."""
+    return _env_int("INGEST_MAX_ATTEMPTS", _DEFAULT_MAX_ATTEMPTS)
+
+
+def _jobs_directory() -> str:
+    return os.path.join(vector_store.get_data_directory(), _JOBS_DIR)
+
+
+# --- File durable ------------------------------------------------------------------
+
+_queue_lock = threading.Lock()
+_queue: Optional[JobQueue] = None
+
+
+def _get_queue() -> JobQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            directory = _jobs_directory()
+            os.makedirs(directory, exist_ok=True)
+            _queue = JobQueue(os.path.join(directory, _QUEUE_FILE))
+        return _queue
+
+
+def close_queue() -> None:
+    """Ferme la file (arrêt de l'application)."""
+    global _queue, _recovery
+    with _queue_lock:
+        if _queue is not None:
+            _queue.close()
+            _queue = None
+        _recovery = None
+
+
+def _job_directory(job_id: str) -> str:
+    return os.path.join(_jobs_directory(), job_id)
+
+
+class _FileCheckpoint(IngestCheckpoint):
+    """Texte converti et chunks d'un fichier de job, écrits dans le dossier du job."""
+
+    def __init__(self, queue: JobQueue, job_file: dict[str, Any]):
+        self.queue = queue
+        self.job_id = job_file["job_id"]
+        self.index = job_file["index"]
+        base = os.path.join(_job_directory(self.job_id), str(self.index))
+        self.text_path = base + ".md"
+        self.chunks_path = base + ".chunks.json"
+
+    @staticmethod
+    def _write(path: str, content: str) -> None:
+        tmp_path = path + ".tmp"
+        Path(tmp_path).write_text(content, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def load_text(self) -> Optional[str]:
+        try:
+            return Path(self.text_path).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def save_text(self, text: str) -> None:
+        self._write(self.text_path, text)
+        self.queue.update_file(self.job_id, self.index, stage="converted")
+
+    def load_chunks(self) -> Optional[tuple[List[str], str, Optional[List[dict[str, Any]]]]]:
+        try:
+            saved = json.loads(Path(self.chunks_path).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        return saved["chunks"], saved["settings_hash"], saved.get("metadatas")
+
+    def save_chunks(
+        self, chunks: List[str], settings_hash: str, metadatas: Optional[List[dict[str, Any]]] = None
+    ) -> None:
+        saved = {"settings_hash": settings_hash, "chunks": chunks, "metadatas": metadatas}
+        self._write(self.chunks_path, json.dumps(saved))
+        Path(self.text_path).unlink(missing_ok=True)
+        self.queue.update_file(self.job_id, self.index, stage="split", chunks=len(chunks))
+
+    def cleanup(self, source_path: str) -> None:
+        for path in (source_path, self.text_path, self.chunks_path):
+            Path(path).unlink(missing_ok=True)
+
+
+# --- Diffusion des événements ------------------------------------------------------
+
+
+class _JobFeed:
+    """Événements d'un job émis par ce processus, suivis en direct par les clients."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.events: List[dict[str, Any]] = []
+        self.finished = False
+        self._wakeup = asyncio.Event()
+
+    def emit(self, event: dict[str, Any]) -> None:
+        self.events.append({"job_id": self.job_id, **event})
+        if event.get("step") == "batch_done":
+            self.finished = True
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    async def follow(self, start: int = 0) -> AsyncIterator[dict[str, Any]]:
+        """Rejoue les événements depuis `start` puis suit le job jusqu'à sa fin."""
+        position = start
+        while True:
+            wakeup = self._wakeup
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.finished:
+                return
+            await wakeup.wait()
+
+
+_feeds: dict[str, _JobFeed] = {}
+
+
+def _feed(job_id: str) -> _JobFeed:
+    feed = _feeds.get(job_id)
+    if feed is None:
+        feed = _feeds[job_id] = _JobFeed(job_id)
+    return feed
+
+
+# --- Workers -----------------------------------------------------------------------
+
+_workers: List[asyncio.Task] = []
+_workers_loop: Optional[asyncio.AbstractEventLoop] = None
+_work_available: Optional[asyncio.Event] = None
+_store_slots: Optional[asyncio.Semaphore] = None
+# Reprise des fichiers « running » d'un processus précédent (une fois par processus)
+_recovery: Optional[asyncio.Future] = None
+
+
+def start_workers() -> None:
+    """Démarre les workers sur la boucle courante (démarrage de l'application ou premier job)."""
+    global _workers, _workers_loop, _work_available, _store_slots
+    loop = asyncio.get_running_loop()
+    if _workers_loop is loop and _workers:
+        return
+    _workers_loop = loop
+    _work_available = asyncio.Event()
+    _store_slots = asyncio.Semaphore(_store_concurrency())
+    _workers = [asyncio.ensure_future(_worker_loop()) for _ in range(_worker_count())]
+
+
+async def shutdown() -> None:
+    """Arrête les workers ; les fichiers en cours restent « running » et seront repris."""
+    global _workers, _workers_loop
+    workers, _workers, _workers_loop = _workers, [], None
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def _recover_interrupted(queue: JobQueue) -> None:
+    """
+    Fichiers « running » d'un processus précédent : remis en file, sauf ceux qui ont épuisé
+    leurs tentatives (le fichier fait sans doute tomber le processus), passés en erreur.
+    """
+    try:
+        for job_file in await asyncio.to_thread(queue.abandon_running, _max_attempts()):
+            _log.warning("Fichier %s du job %s abandonné: %s", job_file["filename"], job_file["job_id"], job_file["message"])
+            _feed(job_file["job_id"]).emit(
+                {
+                    "step": "error",
+                    "message": job_file["message"],
+                    "file_index": job_file["index"],
+                    "filename": job_file["filename"],
+                }
+            )
+            await _settle(queue, job_file, "error")
+        resumed = await asyncio.to_thread(queue.requeue_running)
+        if resumed:
+            _log.info("Reprise de %d fichier(s) d'ingestion interrompu(s)", resumed)
+    except Exception as e:
+        _log.exception("Reprise des fichiers d'ingestion interrompus échouée: %s", e)
+
+
+async def _worker_loop() -> None:
+    global _recovery
+    queue = _get_queue()
+    if _recovery is None:
+        _recovery = asyncio.ensure_future(_recover_interrupted(queue))
+    # Aucun fichier n'est pris avant la fin de la reprise : elle remet en file les « running »
+    if not _recovery.done():
+        await asyncio.shield(_recovery)
+    while True:
+        _work_available.clear()
+        try:
+            job_file = await asyncio.to_thread(queue.claim_next)
+        except Exception as e:
+            _log.warning("Lecture de la file d'ingestion échouée: %s", e)
+            job_file = None
+        if job_file is None:
+            try:
+                await asyncio.wait_for(_work_available.wait(), timeout=_IDLE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await _process(queue, job_file)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _log.exception("Worker d'ingestion: %s", e)
+
+
+async def _process(queue: JobQueue, job_file: dict[str, Any]) -> None:
+    """Ingère un fichier du job (avec reprise) et publie ses événements."""
+    from app.services.docling_ingest import ingest_file_stream
+
+    job_id, index, doc_id = job_file["job_id"], job_file["index"], job_file["doc_id"]
+    feed = _feed(job_id)
+    checkpoint = _FileCheckpoint(queue, job_file)
+    upload = SpooledUpload(
+        path=job_file["path"],
+        filename=job_file["filename"],
+        size=0,
+        content_hash=job_file["content_hash"] or "",
+    )
+    status = "error"
+
+    def publish(event: dict[str, Any]) -> None:
+        feed.emit({**event, "file_index": index, "filename": job_file["filename"]})
+
+    try:
+        async for event in ingest_file_stream(upload, doc_id, store_slots=_store_slots, checkpoint=checkpoint):
+            step = event["step"]
+            if step == "embed":
+                await asyncio.to_thread(queue.update_file, job_id, index, embedded=event["done"])
+            elif step == "done":
+                status = "done"
+                await asyncio.to_thread(
+                    queue.update_file,
+                    job_id,
+                    index,
+                    status="done",
+                    stage="stored",
+                    message=event["message"],
+                    doc_id=event["doc_id"],
+                    chunks=event["chunks"],
+                )
+            elif step == "error":
+                await asyncio.to_thread(queue.update_file, job_id, index, status="error", message=event["message"])
+            publish(event)
+    except Exception as e:
+        _log.exception("Ingestion %s, fichier %s: %s", job_id, job_file["filename"], e)
+        await asyncio.to_thread(queue.update_file, job_id, index, status="error", message=str(e))
+        publish({"step": "error", "message": str(e)})
+    await _settle(queue, job_file, status)
+
+
+async def _settle(queue: JobQueue, job_file: dict[str, Any], status: str) -> None:
+    """Fin du traitement d'un fichier : nettoyage (chunks partiels, fichiers du job) et fin du job."""
+    job_id, doc_id = job_file["job_id"], job_file["doc_id"]
+    checkpoint = _FileCheckpoint(queue, job_file)
+    if status == "error" and not await asyncio.to_thread(document_store.document_exists, doc_id):
+        # Nouveau document en échec : retirer les chunks partiellement écrits
+        await asyncio.to_thread(document_store.delete_document, doc_id)
+    await asyncio.to_thread(checkpoint.cleanup, job_file["path"])
+    if await asyncio.to_thread(queue.finish_job_if_complete, job_id):
+        _finish_job(queue, job_id)
+
+
+def _finish_job(queue: JobQueue, job_id: str) -> None:
+    snapshot = queue.get_job(job_id) or {"done": 0, "error": 0}
+    _feed(job_id).emit(
+        {
+            "step": "batch_done",
+            "message": f"Import terminé : {snapshot['done']} réussi(s), {snapshot['error']} échec(s)",
+            "succeeded": snapshot["done"],
+            "failed": snapshot["error"],
+        }
+    )
+    shutil.rmtree(_job_directory(job_id), ignore_errors=True)
+    for forgotten in queue.forget_finished(_MAX_FINISHED_JOBS):
+        _feeds.pop(forgotten, None)
+        shutil.rmtree(_job_directory(forgotten), ignore_errors=True)
+
+
+# --- API ---------------------------------------------------------------------------
+
+
+async def expand_uploads(uploads: List[SpooledUpload]) -> List[SpooledUpload]:
+    """
+    Remplace les archives par leurs fichiers (dépliés hors de la boucle d'événements).
+    Les archives sont supprimées du disque une fois dépliées ; en cas d'erreur, tous les
+    fichiers reçus sont supprimés.
+    """
+    expanded: List[SpooledUpload] = []
+    try:
+        for upload in uploads:
+            if not is_archive(upload.filename):
+                expanded.append(upload)
+                continue
+            members = await asyncio.to_thread(expand_archive, upload, max_upload_bytes())
+            upload.cleanup()
+            expanded.extend(members)
+    except BaseException:
+        for upload in uploads + expanded:
+            upload.cleanup()
+        raise
+    return expanded
+
+
+def _persist_uploads(job_id: str, uploads: List[SpooledUpload]) -> List[dict[str, Any]]:
+    """Déplace les fichiers reçus dans le dossier du job (survit au redémarrage)."""
+    directory = _job_directory(job_id)
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for i, upload in enumerate(uploads):
+        path = os.path.join(directory, f"{i}{Path(upload.filename).suffix or '.bin'}")
+        shutil.move(upload.path, path)
+        files.append(
+            {
+                "filename": upload.filename,
+                "path": path,
+                "content_hash": upload.content_hash,
+                "doc_id": str(uuid.uuid4()),
+            }
+        )
+    return files
+
+
+async def enqueue(uploads: List[SpooledUpload]) -> str:
+    """Met en file un job pour des fichiers reçus (archives dépliées) et retourne son id."""
+    job_id = uuid.uuid4().hex
+    queue = _get_queue()
+    try:
+        files = await asyncio.to_thread(_persist_uploads, job_id, uploads)
+        await asyncio.to_thread(queue.create_job, job_id, files)
+    except BaseException:
+        for upload in uploads:
+            upload.cleanup()
+        shutil.rmtree(_job_directory(job_id), ignore_errors=True)
+        raise
+    _feed(job_id).emit(
+        {
+            "step": "batch_start",
+            "message": f"Import de {len(files)} fichier(s)…",
+            "files": [f["filename"] for f in files],
+        }
+    )
+    start_workers()
+    _work_available.set()
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[dict[str, Any]]:
+    """État durable du job (statut global et par fichier), None si inconnu."""
+    snapshot = _get_queue().get_job(job_id)
+    if snapshot is None:
+        return None
+    for job_file in snapshot["files"]:
+        del job_file["path"]
+        del job_file["job_id"]
+    return snapshot
+
+
+async def follow_job(job_id: str) -> AsyncIterator[dict[str, Any]]:
+    """
+    Événements du job : historique émis par ce processus puis suivi en direct. Un job terminé
+    avant le dernier redémarrage ne rend qu'un événement "batch_done" (bilan durable).
+    """
+    snapshot = await asyncio.to_thread(get_job, job_id)
+    if snapshot is None:
+        return
+    feed = _feeds.get(job_id)
+    if feed is None and snapshot["status"] == "done":
+        yield {
+            "job_id": job_id,
+            "step": "batch_done",
+            "message": f"Import terminé : {snapshot['done']} réussi(s), {snapshot['error']} échec(s)",
+            "succeeded": snapshot["done"],
+            "failed": snapshot["error"],
+        }
+        return
+    async for event in _feed(job_id).follow():
+        yield event
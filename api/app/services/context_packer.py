@@ -0,0 +1,121 @@
+"""
+Assemblage du contexte envoyé au LLM à partir des chunks retrouvés.
+Les chunks voisins d'un même document (chunk_index consécutifs) sont fusionnés en un seul
+passage, sans répéter le texte de recouvrement (chunk_overlap) ; les passages sont ensuite
+ajoutés par ordre de pertinence tant qu'ils tiennent dans le budget de tokens du modèle
+(tokenizer local tiktoken, estimation sinon).
+"""
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from app.services.embedding_pipeline import estimate_tokens, truncate_to_tokens
+
+PASSAGE_SEPARATOR = "\n\n"
+
+# Recouvrement minimal (caractères) pour retirer le début d'un chunk voisin : en dessous,
+# une coïncidence (mot ou ponctuation commune) est plus probable qu'un vrai recouvrement.
+_MIN_OVERLAP_CHARS = 8
+
+
+@dataclass
+class Passage:
+    """Chunks consécutifs d'un document fusionnés ; rank = meilleur rang de ses chunks."""
+
+    text: str
+    rank: int
+    doc_id: str = ""
+    chunk_indexes: List[int] = field(default_factory=list)
+    tokens: int = 0
+
+
+def overlap_length(before: str, after: str, max_overlap: Optional[int] = None) -> int:
+    """
+    Longueur du plus long suffixe de `before` qui est aussi un préfixe de `after`, bornée
+    par max_overlap (chunk_overlap ; 0 : chunks sans recouvrement, aucune recherche).
+    """
+    if max_overlap is not None and max_overlap <= 0:
+        return 0
+    limit = min(len(before), len(after))
+    if max_overlap is not None:
+        limit = min(limit, max_overlap)
+    for length in range(limit, _MIN_OVERLAP_CHARS - 1, -1):
+        if before.endswith(after[:length]):
+            return length
+    return 0
+
+
+def _join_neighbours(before: str, after: str, max_overlap: Optional[int]) -> str:
+    overlap = overlap_length(before, after, max_overlap)
+    if overlap:
+        return before + after[overlap:]
+    return before + PASSAGE_SEPARATOR + after
+
+
+def merge_neighbours(hits: List[dict[str, Any]], max_overlap: Optional[int] = None) -> List[Passage]:
+    """
+    Passages dans l'ordre des hits (du plus pertinent au moins pertinent) : les hits d'un même
+    document aux chunk_index consécutifs forment un passage, lu dans l'ordre du document.
+    Les doublons (même texte) sont ignorés.
+    """
+    passages: List[Passage] = []
+    by_doc: dict[str, List[tuple[int, int, str]]] = {}
+    seen: set[str] = set()
+    for rank, hit in enumerate(hits):
+        text = hit.get("text") or ""
+        if not text or text in seen:
+            continue
+        seen.add(text)
+        doc_id, chunk_index = hit.get("doc_id"), hit.get("chunk_index")
+        if doc_id and isinstance(chunk_index, int):
+            by_doc.setdefault(doc_id, []).append((chunk_index, rank, text))
+        else:
+            passages.append(Passage(text=text, rank=rank))
+
+    for doc_id, chunks in by_doc.items():
+        chunks.sort()
+        current: Optional[Passage] = None
+        for chunk_index, rank, text in chunks:
+            if current is not None and chunk_index == current.chunk_indexes[-1] + 1:
+                current.text = _join_neighbours(current.text, text, max_overlap)
+                current.rank = min(current.rank, rank)
+                current.chunk_indexes.append(chunk_index)
+                continue
+            if current is not None:
+                passages.append(current)
+            current = Passage(text=text, rank=rank, doc_id=doc_id, chunk_indexes=[chunk_index])
+        if current is not None:
+            passages.append(current)
+    passages.sort(key=lambda p: p.rank)
+    return passages
+
+
+def pack_context(
+    hits: List[dict[str, Any]],
+    max_tokens: int,
+    model: Optional[str] = None,
+    max_overlap: Optional[int] = None,
+) -> List[Passage]:
+    """
+    Passages retenus pour le prompt, par ordre de pertinence, dont le total (séparateurs
+    compris) tient dans max_tokens. Un passage trop long pour la place restante est sauté au
+    profit des suivants ; si même le plus pertinent dépasse le budget, il est tronqué.
+    """
+    packed: List[Passage] = []
+    used = 0
+    separator_tokens = estimate_tokens(PASSAGE_SEPARATOR, model) if max_tokens > 0 else 0
+    for passage in merge_neighbours(hits, max_overlap):
+        passage.tokens = estimate_tokens(passage.text, model)
+        cost = passage.tokens + (separator_tokens if packed else 0)
+        if used + cost <= max_tokens:
+            packed.append(passage)
+            used += cost
+        elif not packed and max_tokens > 0:
+            passage.text = truncate_to_tokens(passage.text, max_tokens, model)
+            passage.tokens = estimate_tokens(passage.text, model)
+            packed.append(passage)
+            used = passage.tokens
+    return packed
+
+
+def context_text(passages: List[Passage]) -> str:
+    return PASSAGE_SEPARATOR.join(p.text for p in passages)
@@ -0,0 +1,479 @@
+"""
+Service de conversion Docling hors de la boucle d'événements.
+Les conversions (modèles de layout, TableFormer : CPU intensif) s'exécutent dans un
+pool de processus (DOCLING_WORKERS) avec une limite de conversions simultanées
+(DOCLING_MAX_IN_FLIGHT). Chaque worker garde son DocumentConverter chaud entre deux
+documents (cache indexé par le hash des options de pipeline Docling) ; DOCLING_PRELOAD=1
+charge les modèles dès le démarrage. DOCLING_WORKERS=0 exécute les conversions dans un
+thread du processus API.
+Les gros PDF (docling.parallel_min_pages pages et plus) sont découpés en plages de
+docling.page_range_size pages converties en parallèle par les workers, puis le markdown
+des plages est recousu dans l'ordre (tableaux et paragraphes coupés à une jonction).
+Avec chunks.strategy = "structure", le worker exporte le document élément par élément avec
+des marqueurs de page (voir structure_chunker) au lieu du markdown global.
+"""
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+# Docling peut être lourd ; import conditionnel pour éviter erreurs si non installé
+try:
+    from docling.datamodel.base_models import InputFormat
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+    from docling.datamodel.pipeline_options import PdfPipelineOptions, TableFormerMode
+except ImportError:
+    DocumentConverter = None  # type: ignore
+    PdfFormatOption = None  # type: ignore
+    PdfPipelineOptions = None  # type: ignore
+    TableFormerMode = None  # type: ignore
+    InputFormat = None  # type: ignore
+
+# Nombre de pages d'un PDF sans le convertir (pypdfium2 est une dépendance de Docling)
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None  # type: ignore
+
+from app.services import settings_service
+from app.services.structure_chunker import page_marker
+
+_log = logging.getLogger(__name__)
+
+_DEFAULT_MAX_WORKERS = 2
+
+# Options qui déterminent le pipeline (et donc les modèles chargés) ; max_num_pages et
+# max_file_size ne sont que des paramètres d'appel et ne reconstruisent pas le converter.
+_PIPELINE_KEYS = (
+    "do_table_structure",
+    "do_cell_matching",
+    "table_former_mode",
+    "enable_remote_services",
+    "artifacts_path",
+)
+
+# --- Côté worker : converter chaud par processus, indexé par hash des options ------
+
+_converter_lock = threading.Lock()
+_converter: Any = None
+_converter_hash: Optional[str] = None
+
+
+def is_docling_available() -> bool:
+    return DocumentConverter is not None
+
+
+def _build_document_converter(docling_cfg: dict[str, Any]):
+    """Construit le DocumentConverter avec les options Docling configurées."""
+    if DocumentConverter is None:
+        return None
+
+    format_options = {}
+    try:
+        if PdfFormatOption is not None and PdfPipelineOptions is not None and InputFormat is not None:
+            pipeline_opts = PdfPipelineOptions(
+                do_table_structure=docling_cfg.get("do_table_structure", True),
+                enable_remote_services=docling_cfg.get("enable_remote_services", False),
+                artifacts_path=docling_cfg.get("artifacts_path") or None,
+            )
+            if hasattr(pipeline_opts, "table_structure_options"):
+                pipeline_opts.table_structure_options.do_cell_matching = docling_cfg.get(
+                    "do_cell_matching", True
+                )
+                mode_str = docling_cfg.get("table_former_mode", "ACCURATE")
+                if TableFormerMode is not None and hasattr(TableFormerMode, mode_str):
+                    pipeline_opts.table_structure_options.mode = getattr(
+                        TableFormerMode, mode_str, TableFormerMode.ACCURATE
+                    )
+            format_options[InputFormat.PDF] = PdfFormatOption(pipeline_options=pipeline_opts)
+    except Exception:
+        pass  # Fallback au converter par défaut
+
+    if format_options:
+        return DocumentConverter(format_options=format_options)
+    return DocumentConverter()
+
+
+def docling_settings_hash(docling_cfg: dict[str, Any]) -> str:
+    """Empreinte des options de pipeline Docling (clé du cache de converters)."""
+    relevant = {k: docling_cfg.get(k) for k in _PIPELINE_KEYS}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _get_converter(docling_cfg: dict[str, Any]):
+    """
+    Converter chaud du processus courant. Reconstruit (modèles réinitialisés) seulement
+    si le hash des options de pipeline change ; l'ancien est alors libéré.
+    """
+    global _converter, _converter_hash
+    key = docling_settings_hash(docling_cfg)
+    if _converter is not None and _converter_hash == key:
+        return _converter
+    with _converter_lock:
+        if _converter is None or _converter_hash != key:
+            _converter = None
+            _converter = _build_document_converter(docling_cfg)
+            _converter_hash = key
+        return _converter
+
+
+def _warm_converter(docling_cfg: dict[str, Any]) -> str:
+    """Construit le converter du processus (préchargement) ; retourne son hash."""
+    _get_converter(docling_cfg)
+    return docling_settings_hash(docling_cfg)
+
+
+def invalidate_converters() -> None:
+    """
+    Libère le converter du processus API. Les workers du pool reconstruisent le leur
+    au prochain document, le hash des options ayant changé.
+    """
+    global _converter, _converter_hash
+    with _converter_lock:
+        _converter, _converter_hash = None, None
+
+
+def _on_settings_changed(old: dict[str, Any], new: dict[str, Any]) -> None:
+    """Options de pipeline Docling modifiées : le converter chaud n'est plus valide."""
+    if docling_settings_hash(old.get("docling", {})) != docling_settings_hash(new.get("docling", {})):
+        invalidate_converters()
+
+
+settings_service.subscribe(_on_settings_changed)
+
+
+def _item_markdown(item: Any, doc: Any) -> str:
+    """Markdown d'un élément du DoclingDocument (titre, tableau, liste, texte)."""
+    label = str(getattr(getattr(item, "label", None), "value", getattr(item, "label", "")))
+    if label == "table":
+        try:
+            return item.export_to_markdown(doc=doc)
+        except TypeError:  # anciennes versions de docling-core
+            return item.export_to_markdown()
+    text = (getattr(item, "text", None) or "").strip()
+    if not text or label in ("page_header", "page_footer"):
+        return ""
+    if label == "title":
+        return f"# {text}"
+    if label == "section_header":
+        level = int(getattr(item, "level", 1) or 1)
+        return f"{'#' * min(level + 1, 6)} {text}"
+    if label == "list_item":
+        return f"- {text}"
+    return text
+
+
+def export_structured(doc: Any) -> str:
+    """
+    Markdown élément par élément, dans l'ordre de lecture, avec un marqueur de page à chaque
+    changement de page (provenance Docling). Repli sur export_to_markdown sans iterate_items.
+    """
+    if not hasattr(doc, "iterate_items"):
+        return doc.export_to_markdown()
+    blocks: List[str] = []
+    page: Optional[int] = None
+    for item, _level in doc.iterate_items():
+        prov = getattr(item, "prov", None) or []
+        page_no = getattr(prov[0], "page_no", None) if prov else None
+        if page_no is not None and page_no != page:
+            blocks.append(page_marker(page_no))
+            page = page_no
+        text = _item_markdown(item, doc)
+        if text:
+            blocks.append(text)
+    return "\n\n".join(blocks)
+
+
+def convert_file(
+    path: str,
+    docling_cfg: dict[str, Any],
+    page_range: Optional[Tuple[int, int]] = None,
+    structured: bool = False,
+) -> str:
+    """
+    Convertit un fichier en markdown via Docling (exécuté dans un worker).
+    page_range : pages (début, fin) incluses, numérotées à partir de 1 ; le fichier entier sinon.
+    structured : export élément par élément avec marqueurs de page (export_structured).
+    Fonction de module pour être sérialisable vers le pool de processus.
+    """
+    converter = _get_converter(docling_cfg)
+    max_num_pages = docling_cfg.get("max_num_pages")
+    max_file_size = docling_cfg.get("max_file_size")
+    convert_kwargs: dict[str, Any] = {}
+    if page_range is not None:
+        convert_kwargs["page_range"] = page_range
+    elif max_num_pages is not None:
+        convert_kwargs["max_num_pages"] = max_num_pages
+    if max_file_size is not None:
+        convert_kwargs["max_file_size"] = int(max_file_size) * 1024 * 1024  # Mo -> octets
+
+    result = converter.convert(path, **convert_kwargs)
+    doc = result.document
+    if structured:
+        return export_structured(doc)
+    return doc.export_to_markdown() or (
+        getattr(doc, "export_to_text", lambda: None)() or ""
+    )
+
+
+# --- Découpage en plages de pages et recollage du markdown ------------------------
+
+_TABLE_ROW_RE = re.compile(r"^\s*\|.*\|\s*$")
+_TABLE_SEPARATOR_RE = re.compile(r"^\s*\|(\s*:?-{3,}:?\s*\|)+\s*$")
+_SENTENCE_END = tuple(".!?:;…)»\"'")
+
+
+def pdf_page_count(path: str) -> Optional[int]:
+    """Nombre de pages d'un PDF (lecture de l'en-tête seulement), None si inconnu."""
+    if pypdfium2 is None or Path(path).suffix.lower() != ".pdf":
+        return None
+    try:
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    except Exception as e:
+        _log.debug("Nombre de pages illisible (%s): %s", path, e)
+        return None
+
+
+def plan_page_ranges(
+    page_count: int, range_size: int, max_num_pages: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """Plages (début, fin) incluses de range_size pages couvrant le document (borné à max_num_pages)."""
+    if max_num_pages is not None:
+        page_count = min(page_count, max_num_pages)
+    range_size = max(1, range_size)
+    return [(start, min(start + range_size - 1, page_count)) for start in range(1, page_count + 1, range_size)]
+
+
+def _column_count(row: str) -> int:
+    return row.strip().strip("|").count("|") + 1
+
+
+def _join_tables(before: List[str], after: List[str]) -> Optional[List[str]]:
+    """
+    Tableau coupé par la jonction : la fin de `before` et le début de `after` sont des
+    tableaux de même largeur. La ligne d'en-tête de la suite est en réalité une ligne de
+    données ; seul son séparateur est retiré.
+    """
+    if not before or not after or not _TABLE_ROW_RE.match(before[-1]):
+        return None
+    if len(after) < 2 or not _TABLE_ROW_RE.match(after[0]) or not _TABLE_SEPARATOR_RE.match(after[1]):
+        return None
+    if _column_count(before[-1]) != _column_count(after[0]):
+        return None
+    return before + [after[0]] + after[2:]
+
+
+def _join_paragraphs(before: List[str], after: List[str]) -> Optional[List[str]]:
+    """Phrase coupée par la jonction : texte sans ponctuation finale suivi d'une minuscule."""
+    if not before or not after:
+        return None
+    last, first = before[-1].rstrip(), after[0].lstrip()
+    if not last or not first or last.endswith(_SENTENCE_END):
+        return None
+    if last.startswith(("#", "|", "<!--", "-", "*", ">")) or first.startswith(("#", "|", "<!--", "-", "*", ">")):
+        return None
+    if not first[0].islower():
+        return None
+    return before[:-1] + [f"{last} {first}"] + after[1:]
+
+
+def stitch_markdown(parts: List[str]) -> str:
+    """
+    Recolle le markdown de plages de pages consécutives, dans l'ordre. Chaque jonction
+    sépare les blocs par une ligne vide (un titre commence toujours une ligne), sauf un
+    tableau ou une phrase coupés entre deux plages, qui sont rejoints.
+    """
+    lines: List[str] = []
+    for part in parts:
+        part_lines = part.strip("\n").splitlines()
+        if not part_lines:
+            continue
+        if not lines:
+            lines = part_lines
+            continue
+        joined = _join_tables(lines, part_lines) or _join_paragraphs(lines, part_lines)
+        lines = joined if joined is not None else lines + [""] + part_lines
+    return "\n".join(lines)
+
+
+def _page_ranges_supported() -> bool:
+    """La version de Docling installée accepte-t-elle page_range ?"""
+    if DocumentConverter is None:
+        return False
+    try:
+        return "page_range" in inspect.signature(DocumentConverter.convert).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+# --- Côté API : pool de processus, limite de concurrence, métriques -----------------
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_semaphore: Optional[asyncio.Semaphore] = None
+_stats = {"queued": 0, "in_flight": 0, "completed": 0, "failed": 0}
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name, "").strip()
+    try:
+        return max(0, int(raw)) if raw else default
+    except ValueError:
+        return default
+
+
+def _max_workers() -> int:
+    return _env_int("DOCLING_WORKERS", min(_DEFAULT_MAX_WORKERS, os.cpu_count() or 1))
+
+
+def _max_in_flight() -> int:
+    return max(1, _env_int("DOCLING_MAX_IN_FLIGHT", max(1, _max_workers())))
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    """Pool de processus partagé, créé au premier usage ; None si DOCLING_WORKERS=0."""
+    global _pool
+    workers = _max_workers()
+    if workers == 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn : pas de fork d'un processus qui a déjà des threads (uvicorn, Chroma)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _log.info("Pool de conversion Docling démarré (%d worker(s))", workers)
+        return _pool
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(_max_in_flight())
+    return _semaphore
+
+
+async def _convert_slot(
+    path: str,
+    docling_cfg: dict[str, Any],
+    page_range: Optional[Tuple[int, int]] = None,
+    structured: bool = False,
+) -> str:
+    """Une conversion (fichier ou plage) dans le pool, sous la limite DOCLING_MAX_IN_FLIGHT."""
+    loop = asyncio.get_running_loop()
+    _stats["queued"] += 1
+    try:
+        await _get_semaphore().acquire()
+    finally:
+        _stats["queued"] -= 1
+    _stats["in_flight"] += 1
+    try:
+        text = await loop.run_in_executor(_get_pool(), convert_file, path, docling_cfg, page_range, structured)
+        _stats["completed"] += 1
+        return text
+    except Exception:
+        _stats["failed"] += 1
+        raise
+    finally:
+        _stats["in_flight"] -= 1
+        _get_semaphore().release()
+
+
+def _page_ranges_for(path: str, docling_cfg: dict[str, Any]) -> Optional[List[Tuple[int, int]]]:
+    """Plages à convertir en parallèle, ou None si le fichier se convertit d'un bloc."""
+    if not _page_ranges_supported():
+        return None
+    page_count = pdf_page_count(path)
+    if page_count is None or page_count < int(docling_cfg.get("parallel_min_pages") or 64):
+        return None
+    ranges = plan_page_ranges(page_count, int(docling_cfg.get("page_range_size") or 32), docling_cfg.get("max_num_pages"))
+    return ranges if len(ranges) > 1 else None
+
+
+async def convert(
+    path: str,
+    docling_cfg: dict[str, Any],
+    on_pages: Optional[Callable[[int, int], None]] = None,
+    structured: bool = False,
+) -> str:
+    """
+    Convertit `path` en markdown sans bloquer la boucle d'événements.
+    Les appels au-delà de DOCLING_MAX_IN_FLIGHT attendent leur tour (comptés dans "queued").
+    Un gros PDF est converti par plages de pages en parallèle (chaque plage occupe une place) ;
+    on_pages(pages converties, total) est appelé à la fin de chaque plage.
+    structured : export avec marqueurs de page pour le découpage par structure.
+    """
+    ranges = await asyncio.to_thread(_page_ranges_for, path, docling_cfg)
+    if ranges is None:
+        return await _convert_slot(path, docling_cfg, structured=structured)
+
+    total = ranges[-1][1] - ranges[0][0] + 1
+    done = 0
+
+    async def convert_range(page_range: Tuple[int, int]) -> str:
+        nonlocal done
+        text = await _convert_slot(path, docling_cfg, page_range, structured)
+        done += page_range[1] - page_range[0] + 1
+        if on_pages is not None:
+            on_pages(done, total)
+        return text
+
+    _log.info("Conversion de %s en %d plages de pages (%d pages)", path, len(ranges), total)
+    tasks = [asyncio.ensure_future(convert_range(page_range)) for page_range in ranges]
+    try:
+        parts = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return stitch_markdown(parts)
+
+
+def preload(docling_cfg: dict[str, Any]) -> None:
+    """
+    Précharge les modèles Docling si DOCLING_PRELOAD est activé : une tâche de
+    préchauffage par worker (ou dans le processus API si DOCLING_WORKERS=0).
+    Bloquant : à appeler hors de la boucle d'événements.
+    """
+    if not is_docling_available():
+        return
+    if os.getenv("DOCLING_PRELOAD", "").strip().lower() not in ("1", "true", "yes"):
+        return
+    pool = _get_pool()
+    if pool is None:
+        _warm_converter(docling_cfg)
+    else:
+        futures = [pool.submit(_warm_converter, docling_cfg) for _ in range(_max_workers())]
+        for future in futures:
+            future.result()
+    _log.info("Modèles Docling préchargés")
+
+
+def stats() -> dict[str, Any]:
+    """Métriques du service de conversion (profondeur de file, conversions en cours)."""
+    return {
+        "workers": _max_workers(),
+        "max_in_flight": _max_in_flight(),
+        **_stats,
+    }
+
+
+def shutdown() -> None:
+    """Arrête le pool de processus (arrêt de l'application)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
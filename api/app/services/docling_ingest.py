@@ -1,35 +1,34 @@
 """
 Ingestion de documents avec Docling (PDF, Word, etc.).
 Produit des chunks de texte pour le RAG. Stockage via document_store.
+Les fonctions *_file travaillent sur un fichier déjà sur disque (envoi reçu par
+upload_spool) ; les variantes en bytes l'écrivent d'abord dans un fichier temporaire.
 """
-import tempfile
+import asyncio
+import hashlib
+import json
 import uuid
 from pathlib import Path
-from typing import Any, AsyncIterator, List, Optional
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
 
+from app.services import conversion_service, settings_service
 from app.services.document_store import (
     add_document,
+    add_document_stream,
+    count_documents,
+    document_exists,
+    find_unchanged_document,
     list_documents,
     get_chunks_by_doc_id,
     delete_document,
 )
 from app.services.settings_service import get_settings
+from app.services.structure_chunker import chunk_markdown
+from app.services.upload_spool import SpooledUpload, spool_bytes
 
 # Ré-exports pour les routes qui importent depuis docling_ingest
 get_chunks_by_document_id = get_chunks_by_doc_id
 
-# Docling peut être lourd ; import conditionnel pour éviter erreurs si non installé
-try:
-    from docling.datamodel.base_models import InputFormat
-    from docling.document_converter import DocumentConverter, PdfFormatOption
-    from docling.datamodel.pipeline_options import PdfPipelineOptions, TableFormerMode
-except ImportError:
-    DocumentConverter = None  # type: ignore
-    PdfFormatOption = None  # type: ignore
-    PdfPipelineOptions = None  # type: ignore
-    TableFormerMode = None  # type: ignore
-    InputFormat = None  # type: ignore
-
 try:
     from langchain_text_splitters import RecursiveCharacterTextSplitter
 except ImportError:
@@ -37,15 +36,33 @@ except ImportError:
 
 
 def get_ingested_chunks() -> List[str]:
-    """Retourne tous les chunks de tous les documents (pour le retrieval fallback sans embeddings)."""
+    """Retourne tous les chunks de tous les documents (matérialisés ; voir document_store.iter_chunks)."""
     from app.services.document_store import get_all_chunks
     return get_all_chunks()
 
 
-def _split_text(text: str) -> List[str]:
-    """Découpe le texte en chunks selon la configuration."""
-    settings = get_settings()
-    chunk_cfg = settings.get("chunks", {})
+# Splitter construit à partir de la section "chunks" ; réinitialisé quand elle change
+_splitter: Any = None
+
+
+def _on_settings_changed(old: dict[str, Any], new: dict[str, Any]) -> None:
+    global _splitter
+    if old.get("chunks") != new.get("chunks"):
+        _splitter = None
+
+
+settings_service.subscribe(_on_settings_changed)
+
+
+def _get_splitter():
+    """Retourne le splitter configuré (mis en cache), ou None si langchain est absent."""
+    global _splitter
+    if RecursiveCharacterTextSplitter is None:
+        return None
+    splitter = _splitter
+    if splitter is not None:
+        return splitter
+    chunk_cfg = get_settings().get("chunks", {})
     chunk_size = chunk_cfg.get("chunk_size", 1000)
     chunk_overlap = chunk_cfg.get("chunk_overlap", 200)
     separators = chunk_cfg.get("separators", ["\n\n", "\n", " ", ""])
@@ -53,98 +70,122 @@ def _split_text(text: str) -> List[str]:
     if not isinstance(separators, list) or len(separators) == 0:
         separators = ["\n\n", "\n", " ", ""]
 
-    if RecursiveCharacterTextSplitter is not None:
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=separators,
-        )
-        chunks = splitter.split_text(text)
-    else:
-        chunks = [p.strip() for p in text.split("\n\n") if p.strip()]
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=separators,
+    )
+    _splitter = splitter
+    return splitter
 
-    return chunks
 
+def _split_text(text: str) -> List[str]:
+    """Découpe le texte en chunks selon la configuration."""
+    splitter = _get_splitter()
+    if splitter is not None:
+        return splitter.split_text(text)
+    return [p.strip() for p in text.split("\n\n") if p.strip()]
 
-def _build_document_converter():
-    """Construit le DocumentConverter avec les options Docling configurées."""
-    if DocumentConverter is None:
-        return None
 
-    settings = get_settings()
-    docling_cfg = settings.get("docling", {})
+def _uses_structure_strategy() -> bool:
+    return get_settings().get("chunks", {}).get("strategy", "recursive") == "structure"
 
-    format_options = {}
-    try:
-        if PdfFormatOption is not None and PdfPipelineOptions is not None and InputFormat is not None:
-            pipeline_opts = PdfPipelineOptions(
-                do_table_structure=docling_cfg.get("do_table_structure", True),
-                enable_remote_services=docling_cfg.get("enable_remote_services", False),
-                artifacts_path=docling_cfg.get("artifacts_path") or None,
-            )
-            if hasattr(pipeline_opts, "table_structure_options"):
-                pipeline_opts.table_structure_options.do_cell_matching = docling_cfg.get(
-                    "do_cell_matching", True
-                )
-                mode_str = docling_cfg.get("table_former_mode", "ACCURATE")
-                if TableFormerMode is not None and hasattr(TableFormerMode, mode_str):
-                    pipeline_opts.table_structure_options.mode = getattr(
-                        TableFormerMode, mode_str, TableFormerMode.ACCURATE
-                    )
-            format_options[InputFormat.PDF] = PdfFormatOption(pipeline_options=pipeline_opts)
-    except Exception:
-        pass  # Fallback au converter par défaut
-
-    if format_options:
-        return DocumentConverter(format_options=format_options)
-    return DocumentConverter()
-
-
-async def _convert_to_text(content: bytes, filename: str) -> str:
-    """Convertit le document en texte markdown via Docling."""
-    suffix = Path(filename).suffix or ".bin"
-    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-        tmp.write(content)
-        tmp_path = tmp.name
-    try:
-        converter = _build_document_converter()
-        if converter is None:
-            return content.decode("utf-8", errors="replace")
-
-        settings = get_settings()
-        docling_cfg = settings.get("docling", {})
-        max_num_pages = docling_cfg.get("max_num_pages")
-        max_file_size = docling_cfg.get("max_file_size")
-        convert_kwargs = {}
-        if max_num_pages is not None:
-            convert_kwargs["max_num_pages"] = max_num_pages
-        if max_file_size is not None:
-            convert_kwargs["max_file_size"] = int(max_file_size) * 1024 * 1024  # Mo -> octets
-
-        result = converter.convert(tmp_path, **convert_kwargs)
-        doc = result.document
-        return doc.export_to_markdown() or (
-            getattr(doc, "export_to_text", lambda: None)() or ""
-        )
-    finally:
-        Path(tmp_path).unlink(missing_ok=True)
 
+def _structure_chunks(text: str) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Chunks (texte, métadonnées : section, pages) de la stratégie "structure", au fil du découpage."""
+    chunk_cfg = get_settings().get("chunks", {})
+    return chunk_markdown(text, chunk_cfg.get("chunk_size", 1000), chunk_cfg.get("chunk_overlap", 200))
 
-async def ingest_document(
-    content: bytes, filename: str = "document", doc_id: Optional[str] = None
-) -> tuple[str, List[str]]:
-    """Parse le document avec Docling et enregistre via document_store (add ou replace atomique)."""
+
+async def _convert_to_text(path: str, on_pages: Optional[Callable[[int, int], None]] = None) -> str:
+    """
+    Convertit le fichier en texte markdown via Docling (pool de conversion), sans copie.
+    on_pages(pages converties, total) : progression d'un gros PDF converti par plages.
+    """
+    if not conversion_service.is_docling_available():
+        return await asyncio.to_thread(Path(path).read_text, encoding="utf-8", errors="replace")
+    docling_cfg = get_settings().get("docling", {})
+    return await conversion_service.convert(
+        path, docling_cfg, on_pages=on_pages, structured=_uses_structure_strategy()
+    )
+
+
+def ingestion_settings_hash(settings: Optional[dict[str, Any]] = None) -> str:
+    """
+    Empreinte des paramètres qui déterminent les chunks stockés (sections chunks, docling
+    et embeddings : un autre fournisseur écrit dans une autre collection).
+    """
+    settings = settings if settings is not None else get_settings()
+    embeddings = settings.get("embeddings", {})
+    relevant = {
+        "chunks": settings.get("chunks", {}),
+        "docling": settings.get("docling", {}),
+        "embeddings": {"provider": embeddings.get("provider"), "model": embeddings.get("model")},
+    }
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+async def _unchanged_document(
+    upload: SpooledUpload, doc_id: Optional[str], settings_hash: str
+) -> Optional[dict[str, Any]]:
+    """Document déjà ingéré depuis un fichier identique avec les mêmes paramètres (rien à refaire)."""
+    return await asyncio.to_thread(find_unchanged_document, doc_id, upload.content_hash, settings_hash)
+
+
+async def ingest_file(upload: SpooledUpload, doc_id: Optional[str] = None) -> tuple[str, List[str]]:
+    """
+    Parse le fichier reçu avec Docling et enregistre via document_store (add ou replace atomique).
+    Un fichier identique déjà ingéré avec les mêmes paramètres n'est ni converti ni ré-embeddé :
+    l'id du document existant est retourné.
+    """
+    settings_hash = ingestion_settings_hash()
+    unchanged = await _unchanged_document(upload, doc_id, settings_hash)
+    if unchanged is not None:
+        chunks = await asyncio.to_thread(get_chunks_by_doc_id, unchanged["id"])
+        return unchanged["id"], chunks or []
     if doc_id is None:
         doc_id = str(uuid.uuid4())
 
-    text = await _convert_to_text(content, filename)
-    chunks = _split_text(text)
+    text = await _convert_to_text(upload.path)
 
-    if not add_document(doc_id, filename, chunks):
+    # Embeddings + écriture Chroma hors de la boucle d'événements
+    if _uses_structure_strategy():
+        # Nouveau document : chunks embeddés au fil du découpage (voir add_document_stream)
+        chunks = await asyncio.to_thread(
+            add_document_stream,
+            doc_id,
+            upload.filename,
+            _structure_chunks(text),
+            settings_hash=settings_hash,
+            content_hash=upload.content_hash,
+        )
+    else:
+        chunks = _split_text(text)
+        if not await asyncio.to_thread(
+            add_document,
+            doc_id,
+            upload.filename,
+            chunks,
+            settings_hash=settings_hash,
+            content_hash=upload.content_hash,
+        ):
+            chunks = None
+    if chunks is None:
         raise RuntimeError("Échec de l'enregistrement des chunks")
     return doc_id, chunks
 
 
+async def ingest_document(
+    content: bytes, filename: str = "document", doc_id: Optional[str] = None
+) -> tuple[str, List[str]]:
+    """Variante de ingest_file pour un contenu en mémoire."""
+    upload = await asyncio.to_thread(spool_bytes, content, filename)
+    try:
+        return await ingest_file(upload, doc_id)
+    finally:
+        upload.cleanup()
+
+
 async def ingest_document_with_id(
     content: bytes, filename: str, doc_id: str
 ) -> tuple[str, List[str]]:
@@ -152,25 +193,180 @@ async def ingest_document_with_id(
     return await ingest_document(content, filename, doc_id)
 
 
-async def ingest_document_stream(
-    content: bytes, filename: str = "document", doc_id: Optional[str] = None
+async def _relay_progress(task: asyncio.Future, queue: asyncio.Queue) -> AsyncIterator[dict[str, Any]]:
+    """Relaie les événements déposés dans `queue` jusqu'à la fin de `task` (et les derniers restants)."""
+    while not task.done() or not queue.empty():
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+        if getter.done():
+            yield getter.result()
+        else:
+            getter.cancel()
+
+
+async def _convert_with_progress(path: str, result: List[str]) -> AsyncIterator[dict[str, Any]]:
+    """
+    Convertit le fichier en relayant la progression par pages (événements "convert_pages",
+    gros PDF convertis par plages) ; le texte est ajouté à `result`.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def on_pages(done: int, total: int) -> None:
+        queue.put_nowait(
+            {"step": "convert_pages", "message": f"Conversion : {done}/{total} pages", "done": done, "total": total}
+        )
+
+    task = asyncio.ensure_future(_convert_to_text(path, on_pages))
+    async for event in _relay_progress(task, queue):
+        yield event
+    result.append(task.result())
+
+
+async def _store_with_progress(
+    store: Callable[[Callable[[int, int], None]], Any], result: List[Any]
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    Exécute store(on_progress) (embeddings + écriture) dans un thread et relaie la progression
+    des lots d'embeddings (événements "embed") ; son résultat est ajouté à `result`, suivi
+    d'un événement "error" s'il est faux ou None (échec de l'enregistrement).
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def on_progress(done: int, total: int) -> None:
+        loop.call_soon_threadsafe(
+            queue.put_nowait,
+            {"step": "embed", "message": f"Embeddings {done}/{total}", "done": done, "total": total},
+        )
+
+    task = asyncio.ensure_future(asyncio.to_thread(store, on_progress))
+    async for event in _relay_progress(task, queue):
+        yield event
+    result.append(task.result())
+    if not result[-1]:
+        yield {"step": "error", "message": "Échec de l'enregistrement des chunks"}
+
+
+class IngestCheckpoint:
+    """
+    Points de contrôle d'une ingestion reprenable (file de jobs) : une étape dont le résultat
+    a été enregistré n'est pas refaite à la reprise. L'implémentation de base ne garde rien.
+    Les lots d'embeddings déjà calculés sont retrouvés dans le cache d'embeddings.
+    """
+
+    def load_text(self) -> Optional[str]:
+        return None
+
+    def save_text(self, text: str) -> None:
+        pass
+
+    def load_chunks(self) -> Optional[tuple[List[str], str, Optional[List[dict[str, Any]]]]]:
+        """(chunks, empreinte des paramètres d'ingestion, métadonnées) si le découpage est déjà fait."""
+        return None
+
+    def save_chunks(
+        self, chunks: List[str], settings_hash: str, metadatas: Optional[List[dict[str, Any]]] = None
+    ) -> None:
+        pass
+
+
+async def ingest_file_stream(
+    upload: SpooledUpload,
+    doc_id: Optional[str] = None,
+    store_slots: Optional[asyncio.Semaphore] = None,
+    checkpoint: Optional[IngestCheckpoint] = None,
 ) -> AsyncIterator[dict[str, Any]]:
     """
-    Ingère un document en émettant des statuts intermédiaires (step, message).
+    Ingère un fichier reçu en émettant des statuts intermédiaires (step, message).
     Yield des dicts avec au moins "step" et "message"; le dernier a "step": "done" et "doc_id", "chunks".
+    store_slots borne les enregistrements (embeddings + écriture) simultanés d'un import groupé ;
+    la conversion est déjà bornée par conversion_service. checkpoint : reprise après
+    interruption (les étapes reprises sont signalées par "resumed": True).
     """
-    if doc_id is None:
-        doc_id = str(uuid.uuid4())
+    checkpoint = checkpoint or IngestCheckpoint()
     try:
-        yield {"step": "convert", "message": "Conversion du document (Docling)…"}
-        text = await _convert_to_text(content, filename)
-        yield {"step": "split", "message": "Découpage en chunks…"}
-        chunks = _split_text(text)
-        yield {"step": "split_done", "message": f"Découpage terminé ({len(chunks)} chunk(s))"}
-        yield {"step": "store", "message": "Enregistrement…"}
-        if not add_document(doc_id, filename, chunks):
-            yield {"step": "error", "message": "Échec de l'enregistrement des chunks"}
+        unchanged = await _unchanged_document(upload, doc_id, ingestion_settings_hash())
+        if unchanged is not None:
+            yield {
+                "step": "done",
+                "message": "Document inchangé (déjà importé avec les mêmes paramètres)",
+                "doc_id": unchanged["id"],
+                "chunks": unchanged["chunk_count"],
+                "unchanged": True,
+            }
             return
+        if doc_id is None:
+            doc_id = str(uuid.uuid4())
+        saved = await asyncio.to_thread(checkpoint.load_chunks)
+        items: Optional[Iterator[tuple[str, dict[str, Any]]]] = None
+        if saved is not None:
+            chunks, settings_hash, metadatas = saved
+            yield {
+                "step": "split_done",
+                "message": f"Reprise : découpage déjà fait ({len(chunks)} chunk(s))",
+                "resumed": True,
+            }
+        else:
+            settings_hash = ingestion_settings_hash()
+            text = await asyncio.to_thread(checkpoint.load_text)
+            if text is None:
+                yield {"step": "convert", "message": "Conversion du document (Docling)…"}
+                converted: List[str] = []
+                async for event in _convert_with_progress(upload.path, converted):
+                    yield event
+                text = converted.pop()
+                await asyncio.to_thread(checkpoint.save_text, text)
+            else:
+                yield {"step": "convert", "message": "Reprise : conversion déjà faite", "resumed": True}
+            if _uses_structure_strategy():
+                # Découpage pendant l'enregistrement (voir add_document_stream) ; une reprise
+                # repart du texte converti
+                yield {"step": "split", "message": "Découpage en chunks (embeddés au fil du découpage)…"}
+                items = _structure_chunks(text)
+            else:
+                yield {"step": "split", "message": "Découpage en chunks…"}
+                chunks, metadatas = _split_text(text), None
+                await asyncio.to_thread(checkpoint.save_chunks, chunks, settings_hash, metadatas)
+                yield {"step": "split_done", "message": f"Découpage terminé ({len(chunks)} chunk(s))"}
+            del text
+
+        def store(on_progress: Callable[[int, int], None]) -> Any:
+            if items is not None:
+                return add_document_stream(
+                    doc_id, upload.filename, items, on_progress,
+                    settings_hash=settings_hash, content_hash=upload.content_hash,
+                )
+            return add_document(
+                doc_id, upload.filename, chunks, on_progress,
+                settings_hash=settings_hash, content_hash=upload.content_hash, chunk_metadatas=metadatas,
+            )
+
+        if store_slots is not None:
+            await store_slots.acquire()
+        try:
+            yield {"step": "store", "message": "Enregistrement…"}
+            stored: List[Any] = []
+            async for event in _store_with_progress(store, stored):
+                yield event
+                if event["step"] == "error":
+                    return
+            if items is not None:
+                chunks = stored[0]
+        finally:
+            if store_slots is not None:
+                store_slots.release()
         yield {"step": "done", "message": "Import terminé", "doc_id": doc_id, "chunks": len(chunks)}
     except Exception as e:
         yield {"step": "error", "message": str(e)}
+
+
+async def ingest_document_stream(
+    content: bytes, filename: str = "document", doc_id: Optional[str] = None
+) -> AsyncIterator[dict[str, Any]]:
+    """Variante de ingest_file_stream pour un contenu en mémoire."""
+    upload = await asyncio.to_thread(spool_bytes, content, filename)
+    try:
+        async for event in ingest_file_stream(upload, doc_id):
+            yield event
+    finally:
+        upload.cleanup()
@@ -0,0 +1,189 @@
+"""
+Catalogue des documents ingérés : une ligne par document (doc_id, nom de fichier, nombre de
+chunks, date d'ingestion, empreintes des paramètres et du contenu), plus la version du corpus.
+Maintenu par document_store à chaque ajout / remplacement / suppression et stocké en SQLite
+à côté de data/chroma : lister les documents ne lit jamais la collection Chroma.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+_log = logging.getLogger(__name__)
+
+# Colonnes triables exposées par l'API -> colonne SQL
+SORT_COLUMNS = {
+    "ingested_at": "ingested_at",
+    "filename": "filename COLLATE NOCASE",
+    "chunk_count": "chunk_count",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    ingested_at REAL NOT NULL,
+    settings_hash TEXT,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_ingested_at ON documents (ingested_at);
+CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_COLUMNS = "doc_id, filename, chunk_count, ingested_at, settings_hash, content_hash"
+
+
+def _row_to_dict(row: tuple) -> dict[str, Any]:
+    return {
+        "id": row[0],
+        "filename": row[1],
+        "chunk_count": int(row[2]),
+        "ingested_at": float(row[3]),
+        "settings_hash": row[4],
+        "content_hash": row[5],
+    }
+
+
+class DocumentCatalog:
+    """Catalogue thread-safe ; `path` = fichier SQLite ou ":memory:"."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._version = self._meta("corpus_version")
+        self._totals = self._compute_totals()
+
+    def _meta(self, key: str) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def _compute_totals(self) -> Tuple[int, int]:
+        row = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(chunk_count), 0) FROM documents").fetchone()
+        return int(row[0]), int(row[1])
+
+    def _bump_version_locked(self) -> None:
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('corpus_version', 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        )
+
+    def upsert(
+        self,
+        doc_id: str,
+        filename: str,
+        chunk_count: int,
+        settings_hash: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        ingested_at: Optional[float] = None,
+    ) -> None:
+        """Ajoute ou remplace la fiche d'un document et incrémente la version du corpus."""
+        with self._lock:
+            try:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO documents ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        doc_id,
+                        filename,
+                        int(chunk_count),
+                        time.time() if ingested_at is None else ingested_at,
+                        settings_hash,
+                        content_hash,
+                    ),
+                )
+                self._bump_version_locked()
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+            self._version = self._meta("corpus_version")
+            self._totals = self._compute_totals()
+
+    def delete(self, doc_id: str) -> bool:
+        """Retire la fiche d'un document. True si elle existait."""
+        with self._lock:
+            try:
+                removed = self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount
+                if removed:
+                    self._bump_version_locked()
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+            self._version = self._meta("corpus_version")
+            self._totals = self._compute_totals()
+        return removed > 0
+
+    def get(self, doc_id: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        return _row_to_dict(row) if row else None
+
+    def find_by_content(self, content_hash: str, settings_hash: Optional[str]) -> Optional[dict[str, Any]]:
+        """Fiche la plus récente d'un fichier identique ingéré avec les mêmes paramètres."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM documents WHERE content_hash = ? AND settings_hash IS ? "
+                "ORDER BY ingested_at DESC LIMIT 1",
+                (content_hash, settings_hash),
+            ).fetchone()
+        return _row_to_dict(row) if row else None
+
+    def list(
+        self,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort: str = "ingested_at",
+        descending: bool = False,
+    ) -> List[dict[str, Any]]:
+        """Page de fiches triées par `sort` (voir SORT_COLUMNS), doc_id en départage."""
+        column = SORT_COLUMNS.get(sort)
+        if column is None:
+            raise ValueError(f"Tri inconnu: {sort}")
+        direction = "DESC" if descending else "ASC"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM documents ORDER BY {column} {direction}, doc_id {direction} "
+                "LIMIT ? OFFSET ?",
+                (-1 if limit is None else int(limit), max(0, int(offset))),
+            ).fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    def count(self) -> int:
+        """Nombre de documents (en mémoire, sans requête)."""
+        return self._totals[0]
+
+    def chunk_total(self) -> int:
+        """Nombre total de chunks du corpus (en mémoire, sans requête)."""
+        return self._totals[1]
+
+    def version(self) -> int:
+        """Version du corpus : incrémentée à chaque ajout / remplacement / suppression."""
+        return self._version
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._bump_version_locked()
+            self._conn.commit()
+            self._version = self._meta("corpus_version")
+            self._totals = (0, 0)
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._conn.close()
+            except sqlite3.Error as e:
+                _log.debug("Fermeture du catalogue de documents: %s", e)
@@ -1,14 +1,26 @@
 """
 Abstraction du stockage des documents ingérés : Chroma (vector_store) ou mémoire.
 Une seule source de vérité pour list_documents, get_chunks, add_document, delete_document.
+Maintient aussi, à chaque ajout / suppression, l'index mots-clés BM25 (keyword_index)
+et le catalogue des documents (document_catalog), dont la version du corpus invalide le
+cache de réponses (answer_cache).
 """
 import logging
-from typing import List, Optional
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
-from app.services import vector_store
+from app.services import answer_cache, vector_map, vector_store
+from app.services.document_catalog import DocumentCatalog
+from app.services.keyword_index import KeywordIndex
+from app.services.vector_store import ProgressCallback
 
 _log = logging.getLogger(__name__)
 
+_KEYWORD_INDEX_FILE = "keyword_index.sqlite3"
+_CATALOG_FILE = "documents.sqlite3"
+
 
 class _InMemoryDoc:
     def __init__(self, doc_id: str, filename: str, chunks: List[str]):
@@ -21,26 +33,225 @@ class _InMemoryDoc:
 _memory_documents: List[_InMemoryDoc] = []
 
 
+# Index mots-clés et catalogue par backend : fichiers à côté de data/chroma (Chroma)
+# ou en mémoire ; indexés par chemin
+_keyword_indexes: dict[str, KeywordIndex] = {}
+_catalogs: dict[str, DocumentCatalog] = {}
+_backend_stores_lock = threading.Lock()
+
+_T = TypeVar("_T")
+
+
 def _uses_vector_store() -> bool:
     return vector_store.is_available()
 
 
-def list_documents() -> List[dict]:
-    """Retourne la liste des documents (id, filename, chunk_count)."""
+def _backend_store(
+    registry: dict[str, _T], filename: str, factory: Callable[[str], _T], label: str
+) -> Optional[_T]:
+    """Base SQLite du backend courant (persistée avec Chroma, volatile avec la mémoire)."""
     if _uses_vector_store():
-        ids = vector_store.list_document_ids()
-        return [
-            {
-                "id": doc_id,
-                "filename": filename,
-                "chunk_count": vector_store.get_chunk_count_by_doc_id(doc_id),
-            }
-            for doc_id, filename in ids
-        ]
-    return [
-        {"id": d.id, "filename": d.filename, "chunk_count": len(d.chunks)}
-        for d in _memory_documents
-    ]
+        path = os.path.join(vector_store.get_data_directory(), filename)
+    else:
+        path = ":memory:"
+    store = registry.get(path)
+    if store is not None:
+        return store
+    with _backend_stores_lock:
+        if path not in registry:
+            try:
+                if path != ":memory:":
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                registry[path] = factory(path)
+            except Exception as e:
+                _log.warning("%s indisponible (%s): %s", label, path, e)
+                return None
+        return registry[path]
+
+
+def _keyword_index() -> Optional[KeywordIndex]:
+    """Index BM25 du backend courant."""
+    return _backend_store(_keyword_indexes, _KEYWORD_INDEX_FILE, KeywordIndex, "Index mots-clés")
+
+
+def _catalog() -> Optional[DocumentCatalog]:
+    """Catalogue des documents du backend courant."""
+    return _backend_store(_catalogs, _CATALOG_FILE, DocumentCatalog, "Catalogue de documents")
+
+
+def corpus_version() -> int:
+    """Version courante du corpus (change à chaque ajout / suppression de document)."""
+    catalog = _catalog()
+    return catalog.version() if catalog is not None else 0
+
+
+def _catalog_document(
+    doc_id: str,
+    filename: str,
+    chunk_count: int,
+    settings_hash: Optional[str],
+    content_hash: Optional[str],
+) -> None:
+    catalog = _catalog()
+    if catalog is not None:
+        try:
+            catalog.upsert(doc_id, filename, chunk_count, settings_hash, content_hash)
+        except Exception as e:
+            _log.warning("Mise à jour du catalogue pour %s échouée: %s", doc_id, e)
+    _on_corpus_changed()
+
+
+def _uncatalog_document(doc_id: str) -> None:
+    catalog = _catalog()
+    if catalog is not None:
+        try:
+            catalog.delete(doc_id)
+        except Exception as e:
+            _log.warning("Suppression de %s du catalogue échouée: %s", doc_id, e)
+    _on_corpus_changed()
+
+
+def _on_corpus_changed() -> None:
+    """Corpus modifié : réponses en cache obsolètes, carte des vecteurs à mettre à jour."""
+    answer_cache.invalidate()
+    if _uses_vector_store():
+        vector_map.schedule_refresh()
+
+
+def _index_document(doc_id: str, chunks: List[str]) -> None:
+    index = _keyword_index()
+    if index is None:
+        return
+    try:
+        index.add_document(doc_id, vector_store.make_chunk_ids(doc_id, chunks), chunks)
+    except Exception as e:
+        _log.warning("Indexation mots-clés de %s échouée: %s", doc_id, e)
+
+
+def _unindex_document(doc_id: str) -> None:
+    index = _keyword_index()
+    if index is None:
+        return
+    try:
+        index.delete_document(doc_id)
+    except Exception as e:
+        _log.warning("Désindexation mots-clés de %s échouée: %s", doc_id, e)
+
+
+def keyword_search(question: str, k: int = 5) -> List[dict[str, Any]]:
+    """
+    Recherche BM25 : liste de { "id", "doc_id", "chunk_index", "text", "score" }
+    triée par score décroissant (vide si aucun terme ne correspond).
+    """
+    index = _keyword_index()
+    if index is None or not question.strip():
+        return []
+    try:
+        return index.search(question, k=k)
+    except Exception as e:
+        _log.warning("Recherche mots-clés échouée: %s", e)
+        return []
+
+
+def ensure_keyword_index() -> None:
+    """
+    Reconstruit l'index mots-clés depuis Chroma s'il est vide alors que des documents
+    existent (données antérieures à l'index, fichier supprimé). Appelé au démarrage.
+    """
+    if not _uses_vector_store():
+        return
+    index = _keyword_index()
+    if index is None or index.chunk_count() > 0:
+        return
+    # Documents lus dans le catalogue (pas de parcours des métadonnées Chroma)
+    doc_ids = [entry["id"] for entry in list_documents()]
+    for doc_id in doc_ids:
+        chunks = vector_store.get_chunks_by_doc_id(doc_id)
+        if chunks:
+            _index_document(doc_id, chunks)
+    if doc_ids:
+        _log.info("Index mots-clés reconstruit (%d document(s))", len(doc_ids))
+
+
+def ensure_catalog() -> None:
+    """
+    Reconstruit le catalogue depuis Chroma s'il est vide alors que des documents existent
+    (données antérieures au catalogue). Parcours complet unique, appelé au démarrage.
+    """
+    if not _uses_vector_store():
+        return
+    catalog = _catalog()
+    if catalog is None or catalog.count() > 0:
+        return
+    doc_ids = vector_store.list_document_ids()
+    for doc_id, filename in doc_ids:
+        catalog.upsert(doc_id, filename, vector_store.get_chunk_count_by_doc_id(doc_id))
+    if doc_ids:
+        _log.info("Catalogue de documents reconstruit (%d document(s))", len(doc_ids))
+
+
+def close_keyword_indexes() -> None:
+    """Ferme les index mots-clés et les catalogues (arrêt de l'application)."""
+    with _backend_stores_lock:
+        for store in [*_keyword_indexes.values(), *_catalogs.values()]:
+            store.close()
+        _keyword_indexes.clear()
+        _catalogs.clear()
+
+
+def _format_entry(entry: dict[str, Any]) -> dict[str, Any]:
+    return {
+        **entry,
+        "ingested_at": datetime.fromtimestamp(entry["ingested_at"], tz=timezone.utc).isoformat(),
+    }
+
+
+def list_documents(
+    offset: int = 0,
+    limit: Optional[int] = None,
+    sort: str = "ingested_at",
+    descending: bool = False,
+) -> List[dict]:
+    """
+    Retourne une page de documents (id, filename, chunk_count, ingested_at, settings_hash,
+    content_hash) depuis le catalogue, sans lire la collection Chroma.
+    """
+    catalog = _catalog()
+    if catalog is None:
+        return []
+    return [_format_entry(e) for e in catalog.list(offset, limit, sort, descending)]
+
+
+def count_documents() -> int:
+    """Nombre total de documents (catalogue)."""
+    catalog = _catalog()
+    return catalog.count() if catalog is not None else 0
+
+
+def get_document(doc_id: str) -> Optional[dict[str, Any]]:
+    """Fiche catalogue d'un document, ou None si inconnu."""
+    catalog = _catalog()
+    entry = catalog.get(doc_id) if catalog is not None else None
+    return _format_entry(entry) if entry is not None else None
+
+
+def find_unchanged_document(
+    doc_id: Optional[str], content_hash: Optional[str], settings_hash: Optional[str]
+) -> Optional[dict[str, Any]]:
+    """
+    Document déjà ingéré à l'identique (même fichier, mêmes paramètres d'ingestion), ou None.
+    Avec un doc_id connu (ré-ingestion), seul ce document est comparé ; sinon, tout fichier
+    identique du catalogue.
+    """
+    catalog = _catalog()
+    if catalog is None or not content_hash:
+        return None
+    entry = catalog.get(doc_id) if doc_id is not None else None
+    if entry is None:
+        entry = catalog.find_by_content(content_hash, settings_hash)
+    elif (entry["content_hash"], entry["settings_hash"]) != (content_hash, settings_hash):
+        return None
+    return _format_entry(entry) if entry is not None else None
 
 
 def get_chunks_by_doc_id(doc_id: str) -> Optional[List[str]]:
@@ -54,14 +265,25 @@ def get_chunks_by_doc_id(doc_id: str) -> Optional[List[str]]:
 
 
 def document_exists(doc_id: str) -> bool:
-    """True si le document existe."""
+    """True si le document existe (consultation du catalogue)."""
+    if _catalog() is not None:
+        return get_document(doc_id) is not None
     return get_chunks_by_doc_id(doc_id) is not None
 
 
 def delete_document(doc_id: str) -> bool:
     """Supprime un document. Retourne True si supprimé."""
     if _uses_vector_store():
-        return vector_store.delete_by_doc_id(doc_id)
+        deleted = vector_store.delete_by_doc_id(doc_id)
+    else:
+        deleted = _delete_document_memory(doc_id)
+    if deleted:
+        _unindex_document(doc_id)
+        _uncatalog_document(doc_id)
+    return deleted
+
+
+def _delete_document_memory(doc_id: str) -> bool:
     global _memory_documents
     for i, doc in enumerate(_memory_documents):
         if doc.id == doc_id:
@@ -70,46 +292,89 @@ def delete_document(doc_id: str) -> bool:
     return False
 
 
-def add_document(doc_id: str, filename: str, chunks: List[str]) -> bool:
+def add_document(
+    doc_id: str,
+    filename: str,
+    chunks: List[str],
+    on_progress: Optional[ProgressCallback] = None,
+    settings_hash: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    chunk_metadatas: Optional[List[dict[str, Any]]] = None,
+) -> bool:
     """
     Ajoute ou remplace un document par son doc_id.
-    En mode vector_store : remplacement atomique (écriture temporaire puis bascule)
-    pour éviter de perdre l'ancien document si l'ajout échoue.
+    settings_hash / content_hash (empreintes des paramètres d'ingestion et du fichier source)
+    sont enregistrés dans le catalogue. chunk_metadatas : métadonnées par chunk (section,
+    pages) ajoutées dans Chroma ; ignorées par le stockage en mémoire.
+    En mode vector_store : remplacement sans ré-embedding (upsert sous les ids finaux
+    puis suppression des chunks obsolètes) ; l'ancien document reste si l'ajout échoue.
+    on_progress(done, total) est appelé après chaque lot d'embeddings écrit.
     """
     if not chunks:
         return False
 
     if _uses_vector_store():
-        return _add_document_vector_store(doc_id, filename, chunks)
-    return _add_document_memory(doc_id, filename, chunks)
-
-
-def _add_document_vector_store(doc_id: str, filename: str, chunks: List[str]) -> bool:
-    """Ajoute ou remplace dans Chroma avec bascule atomique si le doc existait."""
-    existing = document_exists(doc_id)
-    if not existing:
-        ok = vector_store.add_chunks(doc_id, filename, chunks)
-        return ok
-    # Remplacement : écrire dans un doc temporaire, puis supprimer l'ancien, puis renommer
-    temp_id = f"{doc_id}_replacing"
-    if not vector_store.add_chunks(temp_id, filename, chunks):
-        return False
-    try:
-        vector_store.delete_by_doc_id(doc_id)
-    except Exception as e:
-        _log.warning("Suppression de l'ancien doc %s après ajout temp a échoué: %s", doc_id, e)
-        vector_store.delete_by_doc_id(temp_id)
-        return False
-    new_chunks = vector_store.get_chunks_by_doc_id(temp_id)
-    if not new_chunks:
-        _log.error("Chunks temporaires introuvables pour %s", temp_id)
-        return False
-    if not vector_store.add_chunks(doc_id, filename, new_chunks):
-        _log.error("Échec de la copie temp -> %s", doc_id)
-        vector_store.delete_by_doc_id(temp_id)
-        return False
-    vector_store.delete_by_doc_id(temp_id)
-    return True
+        ok = _add_document_vector_store(doc_id, filename, chunks, on_progress, chunk_metadatas)
+    else:
+        ok = _add_document_memory(doc_id, filename, chunks)
+        if ok and on_progress is not None:
+            on_progress(len(chunks), len(chunks))
+    if ok:
+        _index_document(doc_id, chunks)
+        _catalog_document(doc_id, filename, len(chunks), settings_hash, content_hash)
+    return ok
+
+
+def add_document_stream(
+    doc_id: str,
+    filename: str,
+    items: Iterable[Tuple[str, dict[str, Any]]],
+    on_progress: Optional[ProgressCallback] = None,
+    settings_hash: Optional[str] = None,
+    content_hash: Optional[str] = None,
+) -> Optional[List[str]]:
+    """
+    Variante de add_document pour des chunks (texte, métadonnées) produits au fil du découpage.
+    Un nouveau document en mode vector_store est embeddé et écrit pendant le découpage
+    (vector_store.add_chunk_stream) ; un document existant (comparaison avec les chunks
+    stockés) et le stockage en mémoire reçoivent la liste complète. Retourne les chunks
+    enregistrés, ou None en cas d'échec.
+    """
+    if _uses_vector_store() and not document_exists(doc_id):
+        chunks = vector_store.add_chunk_stream(doc_id, filename, items, on_progress)
+        if chunks is None:
+            return None
+        _index_document(doc_id, chunks)
+        _catalog_document(doc_id, filename, len(chunks), settings_hash, content_hash)
+        return chunks
+    chunks = []
+    metadatas: List[dict[str, Any]] = []
+    for chunk, metadata in items:
+        chunks.append(chunk)
+        metadatas.append(metadata)
+    ok = add_document(
+        doc_id,
+        filename,
+        chunks,
+        on_progress,
+        settings_hash=settings_hash,
+        content_hash=content_hash,
+        chunk_metadatas=metadatas,
+    )
+    return chunks if ok else None
+
+
+def _add_document_vector_store(
+    doc_id: str,
+    filename: str,
+    chunks: List[str],
+    on_progress: Optional[ProgressCallback] = None,
+    chunk_metadatas: Optional[List[dict[str, Any]]] = None,
+) -> bool:
+    """Ajoute ou remplace dans Chroma ; chaque chunk n'est embeddé qu'une fois."""
+    return vector_store.replace_chunks(
+        doc_id, filename, chunks, on_progress=on_progress, chunk_metadatas=chunk_metadatas
+    )
 
 
 def _add_document_memory(doc_id: str, filename: str, chunks: List[str]) -> bool:
@@ -123,16 +388,31 @@ def _add_document_memory(doc_id: str, filename: str, chunks: List[str]) -> bool:
     return True
 
 
-def get_all_chunks() -> List[str]:
-    """Retourne tous les chunks de tous les documents (pour retrieval fallback sans embeddings)."""
+def iter_chunks(page_size: int = 500) -> Iterator[dict[str, Any]]:
+    """
+    Curseur sur tous les chunks du corpus : { "id", "doc_id", "chunk_index", "text" }.
+    Avec Chroma, lecture par pages de `page_size` (mémoire bornée, indépendante du corpus).
+    """
     if _uses_vector_store():
-        result: List[str] = []
-        for doc_id, _ in vector_store.list_document_ids():
-            chunks = vector_store.get_chunks_by_doc_id(doc_id)
-            if chunks:
-                result.extend(chunks)
-        return result
-    out: List[str] = []
-    for doc in _memory_documents:
-        out.extend(doc.chunks)
-    return out
+        yield from vector_store.iter_chunks(page_size=page_size)
+        return
+    for doc in list(_memory_documents):
+        chunk_ids = vector_store.make_chunk_ids(doc.id, doc.chunks)
+        for i, (chunk_id, text) in enumerate(zip(chunk_ids, doc.chunks)):
+            yield {"id": chunk_id, "doc_id": doc.id, "chunk_index": i, "text": text}
+
+
+def corpus_stats() -> dict[str, int]:
+    """Nombre de documents et de chunks du corpus, lus dans le catalogue (O(1))."""
+    catalog = _catalog()
+    if catalog is None:
+        return {"documents": 0, "chunks": 0}
+    return {"documents": catalog.count(), "chunks": catalog.chunk_total()}
+
+
+def get_all_chunks() -> List[str]:
+    """
+    Retourne le texte de tous les chunks (matérialisé en mémoire). À réserver aux petits
+    corpus : préférer iter_chunks() pour un parcours, corpus_stats() pour des comptes.
+    """
+    return [chunk["text"] for chunk in iter_chunks()]
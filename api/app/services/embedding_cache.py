@@ -0,0 +1,211 @@
+"""
+Cache persistant des embeddings, adressé par contenu : clé (modèle, sha256 du texte).
+Les vecteurs de questions ont leur propre clé de modèle (suffixe "#query") : certains
+modèles (e5, bge) préfixent la question, son vecteur diffère de celui du même texte indexé.
+Stockage SQLite à côté de data/chroma, éviction LRU au-delà d'une taille maximale.
+CachedEmbeddings enveloppe une embedding function langchain pour que les textes déjà
+vus (ré-ingestion, upload en double, question répétée) ne coûtent aucun appel API.
+"""
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from typing import List, Optional, Sequence
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    Embeddings = object  # type: ignore
+
+_log = logging.getLogger(__name__)
+
+# Après éviction, on redescend à cette fraction de la taille maximale
+_EVICT_TARGET_RATIO = 0.9
+# Clé de modèle des vecteurs de questions (embed_query), séparés des vecteurs de documents
+_QUERY_KEY_SUFFIX = "#query"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, text_hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def text_hash(text: str) -> str:
+    """Empreinte sha256 (hex) d'un texte, utilisée comme clé de cache."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """Cache SQLite thread-safe des vecteurs (float32), borné en octets."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        self._size = int(row[0])
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Retourne les vecteurs en cache (None pour les absents), dans l'ordre de `texts`."""
+        hashes = [text_hash(t) for t in texts]
+        found: dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Requêtes par paquets pour rester sous la limite de paramètres SQLite
+            for start in range(0, len(unique), 500):
+                part = unique[start : start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = _unpack(blob)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+        return [found.get(h) for h in hashes]
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Enregistre les vecteurs puis évince les entrées les moins récemment utilisées si besoin."""
+        if not texts:
+            return
+        now = time.time()
+        rows = {text_hash(t): _pack(v) for t, v in zip(texts, vectors)}
+        with self._lock:
+            for h, blob in rows.items():
+                previous = self._conn.execute(
+                    "SELECT LENGTH(vector) FROM embeddings WHERE model = ? AND text_hash = ?",
+                    (model, h),
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                    (model, h, blob, now),
+                )
+                self._size += len(blob) - (previous[0] if previous else 0)
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        if self.max_bytes <= 0 or self._size <= self.max_bytes:
+            return
+        target = int(self.max_bytes * _EVICT_TARGET_RATIO)
+        evicted = 0
+        while self._size > target:
+            rows = self._conn.execute(
+                "SELECT model, text_hash, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                break
+            self._conn.executemany(
+                "DELETE FROM embeddings WHERE model = ? AND text_hash = ?",
+                [(m, h) for m, h, _ in rows],
+            )
+            self._size -= sum(n for _, _, n in rows)
+            evicted += len(rows)
+        _log.debug("Cache d'embeddings: %d entrée(s) évincée(s)", evicted)
+
+    def size_bytes(self) -> int:
+        return self._size
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._conn.close()
+            except sqlite3.Error as e:
+                _log.debug("Fermeture du cache d'embeddings: %s", e)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embedding function langchain qui consulte le cache avant le fournisseur."""
+
+    def __init__(self, inner: "Embeddings", cache: EmbeddingCache, model: str):
+        self.inner = inner
+        self.cache = cache
+        self.model = model
+        self.query_model = model + _QUERY_KEY_SUFFIX
+
+    def _lookup(self, texts: List[str], model: str) -> tuple[List[Optional[List[float]]], List[int]]:
+        try:
+            cached = self.cache.get_many(model, texts)
+        except sqlite3.Error as e:
+            _log.warning("Lecture du cache d'embeddings impossible: %s", e)
+            cached = [None] * len(texts)
+        missing = [i for i, v in enumerate(cached) if v is None]
+        return cached, missing
+
+    def _store(self, texts: List[str], vectors: List[List[float]], model: str) -> List[List[float]]:
+        try:
+            self.cache.put_many(model, texts, vectors)
+        except sqlite3.Error as e:
+            _log.warning("Écriture du cache d'embeddings impossible: %s", e)
+        # Même précision (float32) que les vecteurs relus depuis le cache
+        return [_unpack(_pack(v)) for v in vectors]
+
+    @staticmethod
+    def _merge(
+        cached: List[Optional[List[float]]], missing: List[int], computed: List[List[float]]
+    ) -> List[List[float]]:
+        out = list(cached)
+        for i, vec in zip(missing, computed):
+            out[i] = vec
+        return out  # type: ignore[return-value]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached, missing = self._lookup(texts, self.model)
+        if not missing:
+            return cached  # type: ignore[return-value]
+        # Dédoublonner les textes manquants avant l'appel au fournisseur
+        todo = list(dict.fromkeys(texts[i] for i in missing))
+        vectors = dict(zip(todo, self._store(todo, self.inner.embed_documents(todo), self.model)))
+        return self._merge(cached, missing, [vectors[texts[i]] for i in missing])
+
+    def embed_query(self, text: str) -> List[float]:
+        cached, missing = self._lookup([text], self.query_model)
+        if not missing:
+            return cached[0]  # type: ignore[return-value]
+        return self._store([text], [self.inner.embed_query(text)], self.query_model)[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached, missing = await asyncio.to_thread(self._lookup, texts, self.model)
+        if not missing:
+            return cached  # type: ignore[return-value]
+        todo = list(dict.fromkeys(texts[i] for i in missing))
+        computed = await self.inner.aembed_documents(todo)
+        vectors = dict(zip(todo, await asyncio.to_thread(self._store, todo, computed, self.model)))
+        return self._merge(cached, missing, [vectors[texts[i]] for i in missing])
+
+    async def aembed_query(self, text: str) -> List[float]:
+        cached, missing = await asyncio.to_thread(self._lookup, [text], self.query_model)
+        if not missing:
+            return cached[0]  # type: ignore[return-value]
+        vector = await self.inner.aembed_query(text)
+        return (await asyncio.to_thread(self._store, [text], [vector], self.query_model))[0]
@@ -0,0 +1,176 @@
+"""
+Pipeline d'embedding pour l'ingestion : découpe les chunks en lots bornés en tokens,
+embedde un nombre limité de lots en parallèle (retry avec backoff exponentiel)
+et remet chaque lot terminé à l'appelant pour écriture immédiate dans Chroma.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None  # type: ignore
+
+_log = logging.getLogger(__name__)
+
+_BACKOFF_BASE_SECONDS = 1.0
+_BACKOFF_MAX_SECONDS = 30.0
+# Encodage tiktoken introuvable (hors ligne) : nouvel essai après ce délai, estimation entre-temps
+_ENCODING_RETRY_SECONDS = 600.0
+
+EmbedFn = Callable[[List[str]], List[List[float]]]
+# (indices des chunks du lot, vecteurs correspondants)
+BatchCallback = Callable[[List[int], List[List[float]]], None]
+
+
+_encodings: dict[Optional[str], Any] = {}
+_encoding_failures: dict[Optional[str], float] = {}
+_encodings_lock = threading.Lock()
+
+
+def _load_encoding(model: Optional[str]) -> Any:
+    if model:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except Exception as e:
+            _log.debug("Encodage tiktoken inconnu pour %s: %s", model, e)
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def _get_encoding(model: Optional[str] = None) -> Any:
+    """
+    Encodage tiktoken du modèle (cl100k_base par défaut ou si le modèle est inconnu),
+    chargé au premier appel (peut télécharger : bloquant, voir warm_encoding) ; None si
+    indisponible (hors ligne), auquel cas le chargement est retenté après un délai.
+    """
+    if tiktoken is None:
+        return None
+    encoding = _encodings.get(model)
+    if encoding is not None:
+        return encoding
+    with _encodings_lock:
+        encoding = _encodings.get(model)
+        if encoding is not None:
+            return encoding
+        failed_at = _encoding_failures.get(model)
+        if failed_at is not None and time.monotonic() - failed_at < _ENCODING_RETRY_SECONDS:
+            return None
+        try:
+            encoding = _encodings[model] = _load_encoding(model)
+        except Exception as e:
+            _encoding_failures[model] = time.monotonic()
+            _log.warning("Encodage tiktoken indisponible, estimation approximative: %s", e)
+            return None
+        _encoding_failures.pop(model, None)
+        return encoding
+
+
+def warm_encoding(model: Optional[str] = None) -> bool:
+    """Charge l'encodage du modèle (démarrage, hors de la boucle d'événements). True si disponible."""
+    return _get_encoding(model) is not None
+
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
+    """Nombre de tokens d'un texte (tiktoken si disponible, sinon ~4 caractères par token)."""
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Début du texte tenant dans max_tokens tokens."""
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    return text[: max(0, max_tokens) * 4]
+
+
+def iter_batches(texts: Iterable[str], max_tokens: int, max_items: int) -> Iterator[List[int]]:
+    """
+    Yield les indices de `texts` par lots consécutifs d'au plus `max_items` textes
+    et `max_tokens` tokens (un texte plus long que le budget forme un lot à lui seul).
+    `texts` peut être produit au fil de l'eau : chaque lot est émis dès qu'il est complet.
+    """
+    current: List[int] = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            yield current
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        yield current
+
+
+def make_batches(texts: Sequence[str], max_tokens: int, max_items: int) -> List[List[int]]:
+    """Liste des lots de iter_batches."""
+    return list(iter_batches(texts, max_tokens, max_items))
+
+
+def _embed_with_retry(embed_fn: EmbedFn, texts: List[str], max_retries: int) -> List[List[float]]:
+    attempt = 0
+    while True:
+        try:
+            return embed_fn(texts)
+        except Exception as e:
+            if attempt >= max_retries:
+                raise
+            delay = min(_BACKOFF_MAX_SECONDS, _BACKOFF_BASE_SECONDS * (2 ** attempt))
+            delay *= 0.5 + random.random() / 2
+            _log.warning(
+                "Lot d'embeddings en échec (%d texte(s), tentative %d/%d): %s ; nouvel essai dans %.1fs",
+                len(texts), attempt + 1, max_retries + 1, e, delay,
+            )
+            time.sleep(delay)
+            attempt += 1
+
+
+def embed_batches(
+    embed_fn: EmbedFn,
+    texts: Sequence[str],
+    batches: Iterable[List[int]],
+    on_batch: BatchCallback,
+    concurrency: int = 4,
+    max_retries: int = 3,
+) -> None:
+    """
+    Embedde les lots avec au plus `concurrency` requêtes simultanées.
+    `on_batch` est appelé dans le thread appelant, dans l'ordre de fin des lots,
+    ce qui sérialise les écritures. Lève la première erreur définitive rencontrée
+    (les lots non démarrés sont alors annulés).
+    `batches` peut être un générateur (iter_batches sur un découpage en cours) qui complète
+    `texts` avant d'émettre chaque lot : il est consommé dans le thread appelant, au fur et
+    à mesure que des places se libèrent, pendant que les lots précédents sont embeddés.
+    """
+    concurrency = max(1, int(concurrency))
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed") as pool:
+        pending: dict[Future, List[int]] = {}
+        queue = iter(batches)
+
+        def submit_next() -> None:
+            batch: Optional[List[int]] = next(queue, None)
+            if batch is not None:
+                future = pool.submit(_embed_with_retry, embed_fn, [texts[i] for i in batch], max_retries)
+                pending[future] = batch
+
+        try:
+            for _ in range(concurrency):
+                submit_next()
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = pending.pop(future)
+                    on_batch(batch, future.result())
+                    submit_next()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
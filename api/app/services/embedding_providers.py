@@ -0,0 +1,188 @@
+"""
+Fournisseurs d'embeddings du vector store, choisis par la section "embeddings" des paramètres.
+- openai : OpenAIEmbeddings (OPENAI_API_KEY requise, un appel réseau par lot).
+- fastembed : modèle ONNX quantifié exécuté localement sur CPU (fastembed / ONNX Runtime),
+  sans clé ni réseau une fois le modèle présent dans EMBEDDING_MODELS_DIR ; inférence par
+  lots, threads ONNX Runtime, appels async servis par un pool de threads dédié.
+Chaque couple (fournisseur, modèle) a sa propre collection Chroma : les dimensions des
+vecteurs diffèrent d'un modèle à l'autre.
+"""
+import asyncio
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    Embeddings = object  # type: ignore
+
+try:
+    from langchain_openai import OpenAIEmbeddings
+except ImportError:
+    OpenAIEmbeddings = None  # type: ignore
+
+# Embeddings locaux optionnels (ONNX Runtime, modèles quantifiés)
+try:
+    from fastembed import TextEmbedding
+except ImportError:
+    TextEmbedding = None  # type: ignore
+
+from app.services import settings_service
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER = "openai"
+# Collection historique : données existantes conservées avec la configuration par défaut
+_DEFAULT_COLLECTION = "rag_chunks"
+_OPENAI_MODEL = "text-embedding-3-small"
+# Multilingue (documents en français), 384 dimensions
+_FASTEMBED_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+# Appels async (questions) servis en parallèle par un modèle local
+_LOCAL_ASYNC_WORKERS = 2
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Embeddings fastembed sur CPU. Les lots de embed_documents sont découpés en sous-lots de
+    batch_size textes ; threads = threads ONNX Runtime par inférence (tous les cœurs si None).
+    """
+
+    def __init__(
+        self,
+        model: str,
+        batch_size: int = 64,
+        threads: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self._model = TextEmbedding(model_name=model, cache_dir=cache_dir, threads=threads)
+        self._executor = ThreadPoolExecutor(
+            max_workers=_LOCAL_ASYNC_WORKERS, thread_name_prefix="local-embeddings"
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return [vector.tolist() for vector in self._model.embed(texts, batch_size=self.batch_size)]
+
+    def embed_query(self, text: str) -> List[float]:
+        # query_embed applique le préfixe de requête des modèles qui en ont un (e5, bge)
+        query_embed = getattr(self._model, "query_embed", None)
+        vectors = query_embed(text) if query_embed is not None else self._model.embed([text])
+        return next(iter(vectors)).tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.embed_query, text)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+@dataclass(frozen=True)
+class EmbeddingProvider:
+    """
+    name : valeur de embeddings.provider ; build(modèle, paramètres, répertoire de données)
+    crée l'embedding function ; credential : secret dont le changement rouvre le store.
+    """
+
+    name: str
+    default_model: str
+    build: Callable[[str, dict[str, Any], str], Any]
+    available: Callable[[], bool]
+    credential: Callable[[], str] = lambda: ""
+
+
+def _models_directory(data_dir: str) -> str:
+    raw = os.getenv("EMBEDDING_MODELS_DIR", "").strip()
+    return os.path.abspath(raw) if raw else os.path.join(data_dir, "models")
+
+
+def _build_openai(model: str, cfg: dict[str, Any], data_dir: str) -> Any:
+    return OpenAIEmbeddings(model=model)
+
+
+def _build_fastembed(model: str, cfg: dict[str, Any], data_dir: str) -> Any:
+    return LocalEmbeddings(
+        model,
+        batch_size=int(cfg.get("batch_size") or 64),
+        threads=cfg.get("threads"),
+        cache_dir=_models_directory(data_dir),
+    )
+
+
+_PROVIDERS: Dict[str, EmbeddingProvider] = {}
+
+
+def register_provider(provider: EmbeddingProvider) -> None:
+    """Ajoute (ou remplace) un fournisseur sélectionnable par embeddings.provider."""
+    _PROVIDERS[provider.name] = provider
+
+
+def provider_names() -> List[str]:
+    """Valeurs acceptées pour embeddings.provider."""
+    return list(_PROVIDERS)
+
+
+def is_available(provider_name: str) -> bool:
+    """True si le fournisseur est enregistré et utilisable (dépendance installée, clé présente)."""
+    provider = _PROVIDERS.get(provider_name)
+    return provider is not None and provider.available()
+
+
+register_provider(
+    EmbeddingProvider(
+        name="openai",
+        default_model=_OPENAI_MODEL,
+        build=_build_openai,
+        available=lambda: OpenAIEmbeddings is not None and bool(os.getenv("OPENAI_API_KEY")),
+        credential=lambda: os.getenv("OPENAI_API_KEY", ""),
+    )
+)
+register_provider(
+    EmbeddingProvider(
+        name="fastembed",
+        default_model=_FASTEMBED_MODEL,
+        build=_build_fastembed,
+        available=lambda: TextEmbedding is not None,
+    )
+)
+
+
+def _embeddings_settings() -> dict[str, Any]:
+    # Lecture seule de l'instantané : appelé à chaque accès au store, sans copie
+    return settings_service.get_snapshot().data.get("embeddings", {})
+
+
+def configured() -> Tuple[Optional[EmbeddingProvider], str]:
+    """(fournisseur, modèle) selon les paramètres ; fournisseur None s'il est inconnu."""
+    cfg = _embeddings_settings()
+    provider = _PROVIDERS.get(cfg.get("provider") or DEFAULT_PROVIDER)
+    if provider is None:
+        return None, ""
+    return provider, cfg.get("model") or provider.default_model
+
+
+def build_embeddings(provider_name: str, model: str, data_dir: str) -> Any:
+    """Embedding function du fournisseur (peut charger un modèle : bloquant)."""
+    return _PROVIDERS[provider_name].build(model, _embeddings_settings(), data_dir)
+
+
+def collection_name(provider_name: str, model: str) -> str:
+    """Collection Chroma du couple (fournisseur, modèle) ; rag_chunks pour la configuration par défaut."""
+    if provider_name == DEFAULT_PROVIDER and model == _OPENAI_MODEL:
+        return _DEFAULT_COLLECTION
+    slug = re.sub(r"[^a-z0-9]+", "_", f"{provider_name}_{model}".lower()).strip("_")
+    return f"{_DEFAULT_COLLECTION}_{slug}"[:63].rstrip("_")
+
+
+def cache_model_key(provider_name: str, model: str) -> str:
+    """Clé « modèle » du cache d'embeddings (inchangée pour OpenAI)."""
+    return model if provider_name == DEFAULT_PROVIDER else f"{provider_name}:{model}"
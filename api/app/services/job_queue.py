@@ -0,0 +1,244 @@
+"""
+File durable des jobs d'ingestion : une ligne par job et une par fichier (statut, étape
+atteinte, progression des embeddings, doc_id), stockée en SQLite à côté de data/chroma.
+Un fichier « running » au démarrage appartenait à un worker interrompu : il est remis en
+file et repris à partir de sa dernière étape terminée (voir batch_ingest), sauf s'il a déjà
+épuisé ses tentatives (il a sans doute fait tomber le processus) : il passe alors en erreur.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional
+
+_log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at);
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL,
+    file_index INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    content_hash TEXT,
+    doc_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    message TEXT NOT NULL DEFAULT '',
+    chunks INTEGER,
+    embedded INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, file_index)
+);
+CREATE INDEX IF NOT EXISTS idx_job_files_status ON job_files (status);
+"""
+
+_FILE_COLUMNS = (
+    "job_id, file_index, filename, path, content_hash, doc_id, status, stage, message, chunks, embedded, attempts"
+)
+
+_FILE_COLUMNS_F = ", ".join(f"f.{column}" for column in _FILE_COLUMNS.split(", "))
+
+# Colonnes modifiables par update_file
+_UPDATABLE = frozenset({"status", "stage", "message", "chunks", "embedded", "doc_id"})
+
+# Statuts d'un fichier : queued -> running -> done | error
+# Étapes atteintes : received -> converted -> split -> stored
+
+
+def _file_row_to_dict(row: tuple) -> dict[str, Any]:
+    return {
+        "job_id": row[0],
+        "index": int(row[1]),
+        "filename": row[2],
+        "path": row[3],
+        "content_hash": row[4],
+        "doc_id": row[5],
+        "status": row[6],
+        "stage": row[7],
+        "message": row[8],
+        "chunks": row[9],
+        "embedded": int(row[10]),
+        "attempts": int(row[11]),
+    }
+
+
+class JobQueue:
+    """File de jobs thread-safe ; `path` = fichier SQLite ou ":memory:"."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def create_job(self, job_id: str, files: List[dict[str, Any]]) -> None:
+        """Enregistre un job et ses fichiers (filename, path, content_hash, doc_id), tous en file."""
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, status, created_at) VALUES (?, 'queued', ?)",
+                    (job_id, time.time()),
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_files (job_id, file_index, filename, path, content_hash, doc_id, status, stage) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 'queued', 'received')",
+                    [
+                        (job_id, i, f["filename"], f["path"], f.get("content_hash"), f["doc_id"])
+                        for i, f in enumerate(files)
+                    ],
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+
+    def claim_next(self) -> Optional[dict[str, Any]]:
+        """Passe le plus ancien fichier en file à « running » et le retourne (None si file vide)."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_FILE_COLUMNS_F} "
+                "FROM job_files f JOIN jobs j ON j.job_id = f.job_id "
+                "WHERE f.status = 'queued' ORDER BY j.created_at, f.file_index LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            try:
+                self._conn.execute(
+                    "UPDATE job_files SET status = 'running', attempts = attempts + 1 "
+                    "WHERE job_id = ? AND file_index = ?",
+                    (row[0], row[1]),
+                )
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running' WHERE job_id = ? AND status = 'queued'", (row[0],)
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+        claimed = _file_row_to_dict(row)
+        claimed["status"] = "running"
+        claimed["attempts"] += 1
+        return claimed
+
+    def update_file(self, job_id: str, index: int, **fields: Any) -> None:
+        """Met à jour status / stage / message / chunks / embedded / doc_id d'un fichier."""
+        unknown = set(fields) - _UPDATABLE
+        if unknown:
+            raise ValueError(f"Colonnes inconnues: {sorted(unknown)}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE job_files SET {assignments} WHERE job_id = ? AND file_index = ?",
+                (*fields.values(), job_id, index),
+            )
+            self._conn.commit()
+
+    def finish_job_if_complete(self, job_id: str) -> bool:
+        """Marque le job terminé si plus aucun fichier n'est en file ou en cours. True si terminé."""
+        with self._lock:
+            remaining = self._conn.execute(
+                "SELECT COUNT(*) FROM job_files WHERE job_id = ? AND status IN ('queued', 'running')",
+                (job_id,),
+            ).fetchone()[0]
+            if remaining:
+                return False
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ? WHERE job_id = ? AND status != 'done'",
+                (time.time(), job_id),
+            ).rowcount
+            self._conn.commit()
+        return updated > 0
+
+    def abandon_running(self, max_attempts: int) -> List[dict[str, Any]]:
+        """
+        Passe en erreur les fichiers « running » ayant déjà eu max_attempts tentatives, au lieu
+        de les relancer indéfiniment. Retourne ces fichiers (statut et message à jour).
+        """
+        message = f"Abandonné après {max_attempts} tentative(s) : le traitement a été interrompu à chaque fois"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_FILE_COLUMNS} FROM job_files WHERE status = 'running' AND attempts >= ?",
+                (max_attempts,),
+            ).fetchall()
+            if rows:
+                try:
+                    self._conn.execute(
+                        "UPDATE job_files SET status = 'error', message = ? WHERE status = 'running' AND attempts >= ?",
+                        (message, max_attempts),
+                    )
+                    self._conn.commit()
+                except sqlite3.Error:
+                    self._conn.rollback()
+                    raise
+        abandoned = [_file_row_to_dict(row) for row in rows]
+        for job_file in abandoned:
+            job_file["status"], job_file["message"] = "error", message
+        return abandoned
+
+    def requeue_running(self) -> int:
+        """Remet en file les fichiers « running » (workers interrompus). Retourne leur nombre."""
+        with self._lock:
+            count = self._conn.execute(
+                "UPDATE job_files SET status = 'queued' WHERE status = 'running'"
+            ).rowcount
+            self._conn.commit()
+        return count
+
+    def get_job(self, job_id: str) -> Optional[dict[str, Any]]:
+        """État du job et de ses fichiers, ou None si inconnu."""
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT job_id, status, created_at, finished_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            rows = self._conn.execute(
+                f"SELECT {_FILE_COLUMNS} FROM job_files WHERE job_id = ? ORDER BY file_index", (job_id,)
+            ).fetchall()
+        files = [_file_row_to_dict(row) for row in rows]
+        counts = {"queued": 0, "running": 0, "done": 0, "error": 0}
+        for f in files:
+            counts[f["status"]] += 1
+        return {
+            "job_id": job[0],
+            "status": job[1],
+            "created_at": job[2],
+            "finished_at": job[3],
+            "total": len(files),
+            **counts,
+            "files": files,
+        }
+
+    def forget_finished(self, keep: int) -> List[str]:
+        """Supprime les jobs terminés au-delà des `keep` plus récents. Retourne leurs ids."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status = 'done' ORDER BY finished_at DESC, rowid DESC LIMIT -1 OFFSET ?",
+                (max(0, keep),),
+            ).fetchall()
+            job_ids = [row[0] for row in rows]
+            if job_ids:
+                placeholders = ",".join("?" * len(job_ids))
+                self._conn.execute(f"DELETE FROM job_files WHERE job_id IN ({placeholders})", job_ids)
+                self._conn.execute(f"DELETE FROM jobs WHERE job_id IN ({placeholders})", job_ids)
+                self._conn.commit()
+        return job_ids
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._conn.close()
+            except sqlite3.Error as e:
+                _log.debug("Fermeture de la file de jobs: %s", e)
@@ -0,0 +1,253 @@
+"""
+Index inversé BM25 pour la recherche par mots-clés (français / anglais).
+Maintenu incrémentalement par document_store (ajout, remplacement, suppression d'un
+document) et stocké en SQLite à côté de data/chroma. Une requête ne lit que les
+postings de ses termes : la latence ne dépend pas de la taille totale du corpus.
+"""
+import heapq
+import logging
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, List, Sequence
+
+_log = logging.getLogger(__name__)
+
+# Paramètres BM25 classiques
+_K1 = 1.2
+_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = frozenset(
+    # Français (sans accents, après normalisation)
+    "au aux avec ce ces cet cette dans de des du elle elles en est et etre eu il ils je la le les "
+    "leur leurs lui ma mais me meme mes moi mon ne nos notre nous on ou par pas pour qu que qui "
+    "quoi sa se ses son sont sur ta te tes toi ton tu un une vos votre vous ete ai as avons avez "
+    "ont fait comme donc car si dont cela ceci ca plus tres aussi sans sous entre vers chez "
+    # Anglais
+    "the an and or of to in on for with without by is are was were be been being this that these "
+    "those it its as at from not no but if then than so such there their they he she we you what "
+    "which who whom how when where why do does did has have had will would can could should may "
+    "might must into about over also".split()
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id TEXT PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks (doc_id);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, chunk_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_chunk_id ON postings (chunk_id);
+CREATE TABLE IF NOT EXISTS stats (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def _strip_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _stem(token: str) -> str:
+    """Racinisation légère commune FR/EN : retire le pluriel en -s."""
+    if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Minuscules, sans accents, mots vides FR/EN retirés, pluriels ramenés au singulier."""
+    normalized = _strip_accents(text.lower())
+    return [
+        _stem(t)
+        for t in _TOKEN_RE.findall(normalized)
+        if len(t) > 1 and t not in _STOPWORDS
+    ]
+
+
+class KeywordIndex:
+    """Index BM25 thread-safe ; `path` = fichier SQLite ou ":memory:"."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _stat(self, key: str) -> int:
+        row = self._conn.execute("SELECT value FROM stats WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def _add_stat(self, key: str, delta: int) -> None:
+        self._conn.execute(
+            "INSERT INTO stats (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            (key, delta),
+        )
+
+    def _delete_document_locked(self, doc_id: str) -> int:
+        rows = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        count, total_length = int(rows[0]), int(rows[1])
+        if count == 0:
+            return 0
+        self._conn.execute(
+            "DELETE FROM postings WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE doc_id = ?)",
+            (doc_id,),
+        )
+        self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+        self._add_stat("chunks", -count)
+        self._add_stat("length", -total_length)
+        return count
+
+    def _delete_chunks_locked(self, chunk_ids: Sequence[str]) -> None:
+        for chunk_id in chunk_ids:
+            row = self._conn.execute("SELECT length FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if row is None:
+                continue
+            self._conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+            self._conn.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id,))
+            self._add_stat("chunks", -1)
+            self._add_stat("length", -int(row[0]))
+
+    def add_document(self, doc_id: str, chunk_ids: Sequence[str], chunks: Sequence[str]) -> None:
+        """
+        Indexe (ou ré-indexe) les chunks d'un document, en remplaçant l'ancienne version.
+        Les ids dérivant du contenu, seuls les chunks nouveaux sont tokenisés et seuls les
+        chunks disparus sont retirés ; les autres ne changent que de position.
+        """
+        with self._lock:
+            try:
+                new_texts = dict(zip(chunk_ids, chunks))
+                existing = {}
+                for chunk_id, chunk_index, text in self._conn.execute(
+                    "SELECT chunk_id, chunk_index, text FROM chunks WHERE doc_id = ?", (doc_id,)
+                ).fetchall():
+                    # Un id réutilisé pour un autre texte (ids positionnels d'un ancien index) est ré-indexé
+                    if new_texts.get(chunk_id) == text:
+                        existing[chunk_id] = chunk_index
+                    else:
+                        self._delete_chunks_locked([chunk_id])
+                added, total_length = 0, 0
+                for i, (chunk_id, text) in enumerate(zip(chunk_ids, chunks)):
+                    if chunk_id in existing:
+                        if existing[chunk_id] != i:
+                            self._conn.execute(
+                                "UPDATE chunks SET chunk_index = ? WHERE chunk_id = ?", (i, chunk_id)
+                            )
+                        continue
+                    terms = Counter(tokenize(text))
+                    length = sum(terms.values())
+                    added += 1
+                    total_length += length
+                    self._conn.execute(
+                        "INSERT INTO chunks (chunk_id, doc_id, chunk_index, length, text) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (chunk_id, doc_id, i, length, text),
+                    )
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                        [(term, chunk_id, tf) for term, tf in terms.items()],
+                    )
+                self._add_stat("chunks", added)
+                self._add_stat("length", total_length)
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+
+    def delete_document(self, doc_id: str) -> bool:
+        """Retire un document de l'index. True s'il était indexé."""
+        with self._lock:
+            try:
+                removed = self._delete_document_locked(doc_id)
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+        return removed > 0
+
+    def search(self, query: str, k: int = 5) -> List[dict[str, Any]]:
+        """
+        Retourne les k chunks les mieux classés (BM25) :
+        { "id", "doc_id", "chunk_index", "text", "score" }, score décroissant.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+        with self._lock:
+            n_chunks = self._stat("chunks")
+            if n_chunks <= 0:
+                return []
+            avgdl = max(1.0, self._stat("length") / n_chunks)
+            scores: dict[str, float] = {}
+            for term in terms:
+                rows = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, c.length FROM postings p "
+                    "JOIN chunks c ON c.chunk_id = p.chunk_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not rows:
+                    continue
+                df = len(rows)
+                idf = math.log(1 + (n_chunks - df + 0.5) / (df + 0.5))
+                for chunk_id, tf, length in rows:
+                    norm = tf + _K1 * (1 - _B + _B * length / avgdl)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (_K1 + 1) / norm
+            best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], item[0]))
+            if not best:
+                return []
+            placeholders = ",".join("?" * len(best))
+            rows = self._conn.execute(
+                f"SELECT chunk_id, doc_id, chunk_index, text FROM chunks WHERE chunk_id IN ({placeholders})",
+                [chunk_id for chunk_id, _ in best],
+            ).fetchall()
+        by_id = {row[0]: row for row in rows}
+        return [
+            {
+                "id": chunk_id,
+                "doc_id": by_id[chunk_id][1],
+                "chunk_index": by_id[chunk_id][2],
+                "text": by_id[chunk_id][3],
+                "score": round(score, 6),
+            }
+            for chunk_id, score in best
+            if chunk_id in by_id
+        ]
+
+    def chunk_count(self) -> int:
+        with self._lock:
+            return self._stat("chunks")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM stats")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._conn.close()
+            except sqlite3.Error as e:
+                _log.debug("Fermeture de l'index mots-clés: %s", e)
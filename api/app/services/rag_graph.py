@@ -2,11 +2,23 @@
 Graphe RAG minimal : retrieval + génération.
 Un seul chemin d'exécution (_retrieve puis _generate), avec ou sans Langgraph.
 Utilise document_store et un LLM optionnel (OpenAI si clé fournie).
+Les deux nœuds sont asynchrones : embeddings et LLM via les API async, Chroma et
+SQLite dans des threads ; la boucle d'événements n'est jamais bloquée par une requête.
+Les réponses sont mises en cache par similarité de question (answer_cache).
+Avant la génération, les chunks retrouvés sont assemblés en contexte (context_packer) :
+chunks voisins fusionnés sans leur recouvrement, puis budget de tokens du modèle.
+Retrieval en deux étages si rerank.enabled : rerank.candidates candidats, réordonnés
+par le reranker local (reranker), dont les k meilleurs sont gardés. La durée de chaque
+étape est rapportée dans "timings" (ms).
 """
+import asyncio
 import os
-from typing import Any
+import time
+from typing import Any, AsyncIterator, List, Optional, TypedDict
 
-from app.services.document_store import get_all_chunks
+from app.services import answer_cache, reranker, settings_service
+from app.services.context_packer import context_text, pack_context
+from app.services.document_store import corpus_stats, corpus_version, keyword_search
 from app.services.settings_service import get_settings
 from app.services import vector_store
 
@@ -18,89 +30,398 @@ try:
 except ImportError:
     _HAS_LLM = False
 
+try:
+    from langgraph.graph import END, START, StateGraph
+    _HAS_LANGGRAPH = True
+except ImportError:
+    _HAS_LANGGRAPH = False
+
+
+class RAGState(TypedDict, total=False):
+    question: str
+    context: str
+    answer: str
+    sources: List[str]
+    # Passages du contexte (chunks voisins fusionnés) et leur total en tokens
+    context_passages: List[str]
+    context_tokens: int
+    retrieved_chunks: List[dict[str, Any]]
+    retrieval_method: str
+    # Infos du rerank (backend, candidats, scorés, timed_out), None sans second étage
+    rerank: Optional[dict[str, Any]]
+    # Durée de chaque étape en millisecondes (cache, retrieve, rerank, generate)
+    timings: dict[str, float]
+    # Embedding de la question, calculé une fois (cache de réponses) et réutilisé au retrieval
+    query_embedding: Optional[List[float]]
+
+
+# Fusion hybride : constante RRF usuelle et nombre de candidats demandés à chaque source (x k)
+_RRF_K = 60
+_HYBRID_OVERSAMPLING = 2
+
+# Client LLM réutilisé entre requêtes : (clé API, client) ; réinitialisé si "chat" change
+_llm_cache: Optional[tuple] = None
+# Le cache de réponses n'est reconfiguré (seuil, TTL, taille) qu'après un changement de paramètres
+_answer_cache_configured = False
+
+
+def _on_settings_changed(old: dict[str, Any], new: dict[str, Any]) -> None:
+    global _llm_cache, _answer_cache_configured
+    if old.get("chat") != new.get("chat"):
+        _llm_cache = None
+    if old.get("answer_cache") != new.get("answer_cache"):
+        _answer_cache_configured = False
+    # Les réponses en cache dépendent du retrieval et du modèle de chat
+    if any(old.get(key) != new.get(key) for key in ("chat", "retriever", "rerank", "embeddings", "answer_cache")):
+        answer_cache.invalidate()
+
+
+settings_service.subscribe(_on_settings_changed)
+
 
 def _get_llm():
+    global _llm_cache
     if not _HAS_LLM:
         return None
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         return None
+    cached = _llm_cache
+    if cached is not None and cached[0] == api_key:
+        return cached[1]
     settings = get_settings()
     chat_cfg = settings.get("chat", {})
     model = chat_cfg.get("model", "gpt-4o-mini")
     temperature = float(chat_cfg.get("temperature", 0))
-    return ChatOpenAI(model=model, temperature=temperature)
+    llm = ChatOpenAI(model=model, temperature=temperature)
+    _llm_cache = (api_key, llm)
+    return llm
+
+
+def _get_answer_cache() -> Optional[answer_cache.AnswerCache]:
+    """Cache de réponses configuré selon les paramètres, None s'il est désactivé."""
+    global _answer_cache_configured
+    # Lecture seule de l'instantané : appelé à chaque question, sans copie
+    cfg = settings_service.get_snapshot().data.get("answer_cache", {})
+    if not cfg.get("enabled", True):
+        return None
+    cache = answer_cache.get_cache()
+    if not _answer_cache_configured:
+        cache.configure(
+            threshold=float(cfg.get("similarity_threshold", 0.95)),
+            ttl_seconds=float(cfg.get("ttl_seconds", 3600)),
+            max_entries=int(cfg.get("max_entries", 512)),
+        )
+        _answer_cache_configured = True
+    return cache
 
 
-def _retrieve(state: dict) -> dict:
-    """Récupère les chunks pertinents : recherche sémantique (embeddings) ou fallback mot-clé."""
+def _fuse_rrf(
+    vector_hits: List[dict[str, Any]], keyword_hits: List[dict[str, Any]], k: int
+) -> List[dict[str, Any]]:
+    """
+    Fusion par rang réciproque : score = somme des 1 / (_RRF_K + rang) sur les deux listes.
+    Chaque résultat garde le score de chaque source (distance vectorielle, score BM25).
+    """
+    fused: dict[str, dict[str, Any]] = {}
+    for source, hits in (("vector", vector_hits), ("keyword", keyword_hits)):
+        for rank, hit in enumerate(hits, start=1):
+            key = hit.get("id") or hit["text"]
+            entry = fused.get(key)
+            if entry is None:
+                entry = {**hit, "score": 0.0, "vector_score": None, "keyword_score": None}
+                fused[key] = entry
+            entry["score"] += 1.0 / (_RRF_K + rank)
+            entry[f"{source}_score"] = hit.get("score")
+    ranked = sorted(fused.values(), key=lambda h: h["score"], reverse=True)[:k]
+    for hit in ranked:
+        hit["score"] = round(hit["score"], 6)
+    return ranked
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+async def _retrieve(state: dict) -> dict:
+    """
+    Récupère les chunks pertinents selon retriever.mode : recherche sémantique (embeddings),
+    mots-clés (BM25), ou hybride (les deux en parallèle, fusion RRF). En mode auto, ou si le
+    vector store est indisponible, on retombe sur les mots-clés.
+    Avec rerank.enabled, le premier étage sur-échantillonne (rerank.candidates) et le
+    reranker garde les k meilleurs.
+    """
     question = state.get("question", "")
     settings = get_settings()
-    k = int(settings.get("retriever", {}).get("k", 5))
+    retriever_cfg = settings.get("retriever", {})
+    rerank_cfg = settings.get("rerank", {})
+    k = int(retriever_cfg.get("k", 5))
     k = max(1, min(k, 20))
-    if vector_store.is_available():
-        with_scores = vector_store.similarity_search_with_scores(question, k=k)
-        state["retrieved_chunks"] = with_scores
-        state["retrieval_method"] = "similarity"
-        state["context"] = "\n\n".join(c["text"] for c in with_scores) if with_scores else ""
+    use_rerank = bool(rerank_cfg.get("enabled", False))
+    first_k = max(k, int(rerank_cfg.get("candidates", 30))) if use_rerank else k
+    mode = retriever_cfg.get("mode", "auto")
+    use_vector = mode != "keyword" and vector_store.is_available()
+    timings = state.setdefault("timings", {})
+    start = time.perf_counter()
+    if use_vector and mode == "hybrid":
+        candidates = min(first_k * _HYBRID_OVERSAMPLING, 200)
+        vector_hits, keyword_hits = await asyncio.gather(
+            vector_store.asimilarity_search_with_scores(
+                question, candidates, embedding=state.get("query_embedding")
+            ),
+            asyncio.to_thread(keyword_search, question, candidates),
+        )
+        hits = _fuse_rrf(vector_hits, keyword_hits, first_k)
+        method = "hybrid"
+    elif use_vector:
+        hits = await vector_store.asimilarity_search_with_scores(
+            question, first_k, embedding=state.get("query_embedding")
+        )
+        method = "similarity"
     else:
-        chunks = get_all_chunks()
-        if question and chunks:
-            q_lower = question.lower()
-            relevant = [c for c in chunks if any(w in c.lower() for w in q_lower.split() if len(w) > 2)]
-            raw = relevant[:k] if relevant else chunks[:k]
-        else:
-            raw = chunks[:k] if chunks else []
-        state["retrieved_chunks"] = [{"text": t, "score": None} for t in raw]
-        state["retrieval_method"] = "keyword"
-        state["context"] = "\n\n".join(raw) if raw else ""
+        # Index inversé BM25 : ne lit que les postings des termes de la question
+        hits = await asyncio.to_thread(keyword_search, question, first_k) if question else []
+        method = "keyword"
+    timings["retrieve_ms"] = _elapsed_ms(start)
+    state["rerank"] = None
+    if use_rerank:
+        start = time.perf_counter()
+        hits, state["rerank"] = await reranker.rerank(question, hits, k, rerank_cfg)
+        timings["rerank_ms"] = _elapsed_ms(start)
+    state["retrieved_chunks"] = hits
+    state["retrieval_method"] = method
+    return state
+
+
+def _assemble_context(state: dict) -> dict:
+    """
+    Contexte du prompt : chunks retrouvés fusionnés avec leurs voisins (recouvrement retiré)
+    et ajoutés par ordre de pertinence dans la limite de chat.max_context_tokens.
+    Bloquant (tokenizer) : appelé dans un thread.
+    """
+    settings = get_settings()
+    chat_cfg = settings.get("chat", {})
+    passages = pack_context(
+        state.get("retrieved_chunks", []),
+        max_tokens=int(chat_cfg.get("max_context_tokens", 3000)),
+        model=chat_cfg.get("model"),
+        max_overlap=int(settings.get("chunks", {}).get("chunk_overlap", 200)),
+    )
+    state["context"] = context_text(passages)
+    state["context_passages"] = [p.text for p in passages]
+    state["context_tokens"] = sum(p.tokens for p in passages)
     return state
 
 
-def _generate(state: dict) -> dict:
-    """Génère la réponse avec le LLM ou un fallback."""
+_SYSTEM_PROMPT = "Tu réponds à la question en t'appuyant sur le contexte fourni. Si le contexte est vide, dis que tu n'as pas d'information."
+
+
+def _build_messages(context: str, question: str) -> list:
+    return [
+        SystemMessage(content=_SYSTEM_PROMPT),
+        HumanMessage(content=f"Contexte:\n{context}\n\nQuestion: {question}"),
+    ]
+
+
+async def _fallback_answer() -> str:
+    """Réponse sans LLM : indique l'état du corpus."""
+    n_chunks = (await asyncio.to_thread(corpus_stats))["chunks"]
+    if not n_chunks:
+        return "Aucun document ingéré. Uploadez un PDF ou un fichier texte via /api/rag/ingest."
+    return f"Contexte disponible ({n_chunks} chunks). Configurez OPENAI_API_KEY pour des réponses générées."
+
+
+def _sources(state: dict) -> List[str]:
+    return state.get("context_passages", [])[:3]
+
+
+async def _generate(state: dict) -> dict:
+    """Assemble le contexte puis génère la réponse avec le LLM ou un fallback."""
+    start = time.perf_counter()
+    state = await asyncio.to_thread(_assemble_context, state)
     context = state.get("context", "")
     question = state.get("question", "")
     llm = _get_llm()
     if llm and (context or question):
-        system = "Tu réponds à la question en t'appuyant sur le contexte fourni. Si le contexte est vide, dis que tu n'as pas d'information."
-        messages = [
-            SystemMessage(content=system),
-            HumanMessage(content=f"Contexte:\n{context}\n\nQuestion: {question}"),
-        ]
-        response = llm.invoke(messages)
+        response = await llm.ainvoke(_build_messages(context, question))
         state["answer"] = response.content if hasattr(response, "content") else str(response)
     else:
-        all_chunks = get_all_chunks()
-        if not all_chunks:
-            state["answer"] = "Aucun document ingéré. Uploadez un PDF ou un fichier texte via /api/rag/ingest."
-        else:
-            state["answer"] = f"Contexte disponible ({len(all_chunks)} chunks). Configurez OPENAI_API_KEY pour des réponses générées."
-    state["sources"] = state.get("context", "").split("\n\n")[:3] if state.get("context") else []
+        state["answer"] = await _fallback_answer()
+    state["sources"] = _sources(state)
+    state.setdefault("timings", {})["generate_ms"] = _elapsed_ms(start)
     return state
 
 
-def _run_rag_pipeline(state: dict) -> dict:
+_graph: Any = None
+
+
+def _get_graph():
+    """Graphe Langgraph compilé (retrieve -> generate, nœuds async), None si absent."""
+    global _graph
+    if not _HAS_LANGGRAPH:
+        return None
+    if _graph is None:
+        graph = StateGraph(RAGState)
+        graph.add_node("retrieve", _retrieve)
+        graph.add_node("generate", _generate)
+        graph.add_edge(START, "retrieve")
+        graph.add_edge("retrieve", "generate")
+        graph.add_edge("generate", END)
+        _graph = graph.compile()
+    return _graph
+
+
+async def _run_rag_pipeline(state: dict) -> dict:
     """Exécute retrieve puis generate. Chemin unique pour avec/sans Langgraph."""
-    state = _retrieve(state)
-    state = _generate(state)
+    graph = _get_graph()
+    if graph is not None:
+        return dict(await graph.ainvoke(state))
+    state = await _retrieve(state)
+    state = await _generate(state)
     return state
 
 
-async def query_rag(question: str) -> dict[str, Any]:
-    """Exécute le pipeline RAG et retourne answer, sources, retrieved_chunks, retrieval_method."""
-    state = {
+def _initial_state(question: str) -> dict:
+    return {
         "question": question,
         "context": "",
         "answer": "",
         "sources": [],
+        "context_passages": [],
+        "context_tokens": 0,
         "retrieved_chunks": [],
         "retrieval_method": "keyword",
+        "rerank": None,
+        "timings": {},
+        "query_embedding": None,
     }
-    state = _run_rag_pipeline(state)
+
+
+async def _lookup_cached_answer(
+    question: str, version: int
+) -> tuple[Optional[answer_cache.AnswerCache], Optional[List[float]], Optional[dict[str, Any]]]:
+    """
+    (cache, embedding de la question, réponse en cache ou None). Sans embeddings
+    disponibles (pas de vector store), le cache n'est pas utilisé. La recherche dans le
+    cache s'exécute dans un thread.
+    """
+    cache = _get_answer_cache()
+    if cache is None:
+        return None, None, None
+    embedding = await vector_store.aembed_query(question)
+    if embedding is None:
+        return None, None, None
+    hit = await asyncio.to_thread(cache.lookup, embedding, version)
+    return cache, embedding, (dict(hit.result) if hit is not None else None)
+
+
+def _result(state: dict) -> dict[str, Any]:
     return {
         "answer": state.get("answer", ""),
         "sources": state.get("sources", []),
         "retrieved_chunks": state.get("retrieved_chunks", []),
         "retrieval_method": state.get("retrieval_method", "keyword"),
+        "context_tokens": state.get("context_tokens", 0),
+        "rerank": state.get("rerank"),
+        "timings": state.get("timings", {}),
+    }
+
+
+async def _store_answer(
+    cache: Optional[answer_cache.AnswerCache],
+    question: str,
+    embedding: Optional[List[float]],
+    result: dict[str, Any],
+    version: int,
+) -> None:
+    if cache is None or embedding is None:
+        return
+    chunk_ids = [c["id"] for c in result.get("retrieved_chunks", []) if c.get("id")]
+    await asyncio.to_thread(cache.store, question, embedding, result, chunk_ids, version)
+
+
+async def query_rag(question: str) -> dict[str, Any]:
+    """
+    Exécute le pipeline RAG et retourne answer, sources, retrieved_chunks, retrieval_method
+    et cached (True si la réponse vient du cache sémantique, sans appel au LLM).
+    """
+    # Version lue avant le retrieval : une ingestion concurrente rend l'entrée obsolète
+    version = await asyncio.to_thread(corpus_version)
+    start = time.perf_counter()
+    cache, embedding, cached = await _lookup_cached_answer(question, version)
+    cache_ms = _elapsed_ms(start)
+    if cached is not None:
+        return {**cached, "timings": {"cache_ms": cache_ms}, "cached": True}
+    state = _initial_state(question)
+    state["query_embedding"] = embedding
+    state["timings"] = {"cache_ms": cache_ms}
+    state = await _run_rag_pipeline(state)
+    result = _result(state)
+    await _store_answer(cache, question, embedding, result, version)
+    return {**result, "cached": False}
+
+
+async def stream_rag(question: str) -> AsyncIterator[dict[str, Any]]:
+    """
+    Variante streamée du pipeline : un événement "retrieved" (chunks + scores) dès la fin
+    du retrieval, puis un événement "token" par fragment reçu du LLM (astream), puis "done"
+    avec la réponse complète et les sources. Fermer le générateur (client déconnecté)
+    annule l'appel LLM en cours. Une réponse en cache est émise en un seul token.
+    """
+    version = await asyncio.to_thread(corpus_version)
+    start = time.perf_counter()
+    cache, embedding, cached = await _lookup_cached_answer(question, version)
+    cache_ms = _elapsed_ms(start)
+    if cached is not None:
+        yield {
+            "step": "retrieved",
+            "retrieval_method": cached["retrieval_method"],
+            "retrieved_chunks": cached["retrieved_chunks"],
+        }
+        yield {"step": "token", "content": cached["answer"]}
+        yield {
+            "step": "done",
+            "answer": cached["answer"],
+            "sources": cached["sources"],
+            "timings": {"cache_ms": cache_ms},
+            "cached": True,
+        }
+        return
+    state = _initial_state(question)
+    state["query_embedding"] = embedding
+    state["timings"] = {"cache_ms": cache_ms}
+    state = await _retrieve(state)
+    yield {
+        "step": "retrieved",
+        "retrieval_method": state.get("retrieval_method", "keyword"),
+        "retrieved_chunks": state.get("retrieved_chunks", []),
+        "rerank": state.get("rerank"),
+    }
+    start = time.perf_counter()
+    state = await asyncio.to_thread(_assemble_context, state)
+    context = state.get("context", "")
+    llm = _get_llm()
+    if llm and (context or question):
+        parts: List[str] = []
+        async for chunk in llm.astream(_build_messages(context, question)):
+            token = chunk.content if hasattr(chunk, "content") else str(chunk)
+            if token:
+                parts.append(token)
+                yield {"step": "token", "content": token}
+        answer = "".join(parts)
+    else:
+        answer = await _fallback_answer()
+        yield {"step": "token", "content": answer}
+    state["answer"] = answer
+    state["sources"] = _sources(state)
+    state["timings"]["generate_ms"] = _elapsed_ms(start)
+    # Réponse complète seulement : un stream interrompu n'arrive pas jusqu'ici
+    await _store_answer(cache, question, embedding, _result(state), version)
+    yield {
+        "step": "done",
+        "answer": answer,
+        "sources": state["sources"],
+        "context_tokens": state.get("context_tokens", 0),
+        "timings": state["timings"],
+        "cached": False,
     }
@@ -0,0 +1,286 @@
+"""
+Second étage du retrieval : réordonne les N candidats du premier étage (vectoriel, BM25 ou
+hybride) avec un reranker local, puis garde les k meilleurs.
+Backends (section "rerank") : cross-encoder sentence-transformers (PyTorch ou ONNX, CPU)
+ou score lexical BM25 calculé sur les seuls candidats (sans dépendance). Les paires
+(question, chunk) sont scorées par lots, les scores gardés en cache LRU, et le rerank est
+borné en temps : les candidats non scorés à l'échéance gardent leur ordre du premier étage.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Protocol, Sequence, Tuple
+
+from app.services import settings_service
+from app.services.keyword_index import tokenize
+from app.services.settings_service import get_settings
+
+# Cross-encoders locaux optionnels (sentence-transformers, backend ONNX si installé)
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None  # type: ignore
+
+_log = logging.getLogger(__name__)
+
+_K1 = 1.2
+_B = 0.75
+_CACHE_MAX_ENTRIES = 8192
+
+
+class Reranker(Protocol):
+    """Score de pertinence de chaque texte pour la question (plus haut = plus pertinent)."""
+
+    name: str
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        ...
+
+
+class LexicalReranker:
+    """
+    BM25 sur l'ensemble des candidats (idf et longueur moyenne calculés sur eux seuls) :
+    les scores dépendent du pool, qui est donc scoré en un seul appel et sans cache.
+    """
+
+    name = "lexical"
+    batched = False
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        documents = [tokenize(text) for text in texts]
+        n_docs = len(documents)
+        avgdl = max(1.0, sum(len(tokens) for tokens in documents) / max(1, n_docs))
+        df: Counter = Counter()
+        for tokens in documents:
+            df.update(set(tokens))
+        terms = list(dict.fromkeys(tokenize(query)))
+        scores: List[float] = []
+        for tokens in documents:
+            tf = Counter(tokens)
+            total = 0.0
+            for term in terms:
+                if not tf[term]:
+                    continue
+                idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+                norm = tf[term] + _K1 * (1 - _B + _B * len(tokens) / avgdl)
+                total += idf * tf[term] * (_K1 + 1) / norm
+            scores.append(total)
+        return scores
+
+
+class CrossEncoderReranker:
+    """Cross-encoder sentence-transformers sur CPU ; backend "onnx" si demandé."""
+
+    def __init__(self, model: str, onnx: bool = False, batch_size: int = 16):
+        self.name = f"{'onnx' if onnx else 'cross_encoder'}:{model}"
+        self.batch_size = batch_size
+        kwargs: dict[str, Any] = {"device": "cpu"}
+        if onnx:
+            kwargs["backend"] = "onnx"
+        self._model = CrossEncoder(model, **kwargs)
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        scores = self._model.predict([(query, text) for text in texts], batch_size=self.batch_size)
+        return [float(s) for s in scores]
+
+
+# --- Registre des backends ------------------------------------------------------------
+
+RerankerFactory = Callable[[dict[str, Any]], Reranker]
+
+
+def _lexical_factory(cfg: dict[str, Any]) -> Reranker:
+    return LexicalReranker()
+
+
+def _cross_encoder_factory(cfg: dict[str, Any]) -> Reranker:
+    if CrossEncoder is None:
+        raise RuntimeError("sentence-transformers n'est pas installé")
+    return CrossEncoderReranker(
+        cfg.get("model", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+        onnx=cfg.get("backend") == "onnx",
+        batch_size=int(cfg.get("batch_size", 16)),
+    )
+
+
+_BACKENDS: Dict[str, RerankerFactory] = {
+    "lexical": _lexical_factory,
+    "cross_encoder": _cross_encoder_factory,
+    "onnx": _cross_encoder_factory,
+}
+
+
+def register_backend(name: str, factory: RerankerFactory) -> None:
+    """Ajoute un backend de rerank (sélectionnable par rerank.backend)."""
+    _BACKENDS[name] = factory
+
+
+def backend_names() -> List[str]:
+    """Valeurs acceptées pour rerank.backend."""
+    return ["auto", *_BACKENDS]
+
+
+# Modèle chargé une fois par configuration ; réinitialisé quand la section "rerank" change
+_reranker: Optional[Tuple[str, Reranker]] = None
+_reranker_lock = threading.Lock()
+
+
+def _on_settings_changed(old: dict[str, Any], new: dict[str, Any]) -> None:
+    global _reranker
+    if old.get("rerank") != new.get("rerank"):
+        with _reranker_lock:
+            _reranker = None
+        _cache.clear()
+
+
+settings_service.subscribe(_on_settings_changed)
+
+
+def _config_key(cfg: dict[str, Any]) -> str:
+    return f"{cfg.get('backend', 'auto')}:{cfg.get('model', '')}:{cfg.get('batch_size', 16)}"
+
+
+def get_reranker(cfg: dict[str, Any]) -> Reranker:
+    """
+    Reranker configuré (chargé au premier appel, bloquant). "auto" : cross-encoder si
+    sentence-transformers est installé, sinon lexical ; un modèle impossible à charger
+    (hors ligne, dépendance absente) retombe aussi sur le score lexical.
+    """
+    global _reranker
+    key = _config_key(cfg)
+    with _reranker_lock:
+        if _reranker is not None and _reranker[0] == key:
+            return _reranker[1]
+        backend = cfg.get("backend", "auto")
+        if backend == "auto":
+            backend = "cross_encoder" if CrossEncoder is not None else "lexical"
+        factory = _BACKENDS.get(backend, _lexical_factory)
+        try:
+            reranker = factory(cfg)
+        except Exception as e:
+            _log.warning("Reranker %s indisponible, score lexical utilisé: %s", backend, e)
+            reranker = LexicalReranker()
+        _reranker = (key, reranker)
+        return reranker
+
+
+# --- Cache des scores (question, chunk) -----------------------------------------------
+
+
+class _ScoreCache:
+    """Cache LRU thread-safe des scores par (reranker, question, chunk)."""
+
+    def __init__(self, max_entries: int = _CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._scores: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def put(self, key: Tuple[str, str, str], score: float) -> None:
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scores.clear()
+
+
+_cache = _ScoreCache()
+
+
+def _chunk_key(hit: dict[str, Any]) -> str:
+    # Les ids de chunks dérivent du contenu : un id identifie un texte
+    return hit.get("id") or hashlib.sha256(hit["text"].encode("utf-8")).hexdigest()
+
+
+def _score_batches(
+    reranker: Reranker,
+    query: str,
+    hits: List[dict[str, Any]],
+    batch_size: int,
+    deadline: float,
+    scores: Dict[int, float],
+) -> None:
+    """Score les candidats par lots (ordre du premier étage) jusqu'à l'échéance ; remplit `scores`."""
+    if not getattr(reranker, "batched", True):
+        scores.update(enumerate(reranker.score(query, [hit["text"] for hit in hits])))
+        return
+    query_key = " ".join(query.lower().split())
+    pending: List[int] = []
+    for i, hit in enumerate(hits):
+        cached = _cache.get((reranker.name, query_key, _chunk_key(hit)))
+        if cached is not None:
+            scores[i] = cached
+        else:
+            pending.append(i)
+    for start in range(0, len(pending), batch_size):
+        if time.monotonic() >= deadline:
+            return
+        batch = pending[start : start + batch_size]
+        batch_scores = reranker.score(query, [hits[i]["text"] for i in batch])
+        for i, score in zip(batch, batch_scores):
+            _cache.put((reranker.name, query_key, _chunk_key(hits[i])), score)
+            scores[i] = score
+
+
+def _log_late_failure(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        _log.warning("Rerank en arrière-plan échoué: %s", task.exception())
+
+
+async def rerank(
+    query: str, hits: List[dict[str, Any]], k: int, cfg: Optional[dict[str, Any]] = None
+) -> Tuple[List[dict[str, Any]], dict[str, Any]]:
+    """
+    Réordonne les candidats et retourne (k meilleurs, infos). Chaque résultat scoré porte
+    "rerank_score" ; "score" reste celui du premier étage. Infos : backend, candidats,
+    scorés, timed_out. Le chargement du modèle et les lots s'exécutent dans un thread ;
+    au-delà de rerank.timeout_ms, seuls les scores déjà calculés sont utilisés.
+    """
+    cfg = cfg if cfg is not None else get_settings().get("rerank", {})
+    info: dict[str, Any] = {"backend": None, "candidates": len(hits), "scored": 0, "timed_out": False}
+    if not hits or not query.strip():
+        return hits[:k], info
+    timeout = int(cfg.get("timeout_ms", 800)) / 1000.0
+    deadline = time.monotonic() + timeout
+    scores: Dict[int, float] = {}
+    backend: List[str] = []
+
+    def run() -> None:
+        reranker = get_reranker(cfg)
+        backend.append(reranker.name)
+        _score_batches(reranker, query, hits, int(cfg.get("batch_size", 16)), deadline, scores)
+
+    task = asyncio.ensure_future(asyncio.to_thread(run))
+    done, _ = await asyncio.wait({task}, timeout=timeout)
+    if task in done:
+        task.result()
+    else:
+        # Le lot en cours se termine en arrière-plan et alimente le cache
+        info["timed_out"] = True
+        task.add_done_callback(_log_late_failure)
+    scored = dict(scores)
+    info["backend"] = backend[0] if backend else None
+    info["scored"] = len(scored)
+    # Scorés par score décroissant, puis les autres dans l'ordre du premier étage
+    order = sorted(scored, key=lambda i: scored[i], reverse=True) + [i for i in range(len(hits)) if i not in scored]
+    ranked = []
+    for i in order[:k]:
+        hit = dict(hits[i])
+        if i in scored:
+            hit["rerank_score"] = round(scored[i], 6)
+        ranked.append(hit)
+    return ranked, info
@@ -1,10 +1,22 @@
 """
 Service de gestion des paramètres (chunks, Docling).
 Stockage dans data/settings.json. Validation via schéma Pydantic.
+
+Les paramètres sont gardés en mémoire sous forme d'instantané versionné : le fichier
+n'est relu (et revalidé) que si sa date de modification change ou après une sauvegarde.
+Les modules qui dérivent des objets coûteux des paramètres (converter Docling, splitter,
+client LLM) s'abonnent aux changements via subscribe().
 """
+import copy
 import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, List, Optional, Tuple
 
 from app.schemas.settings import AppSettings
 
@@ -12,17 +24,49 @@ from app.schemas.settings import AppSettings
 _SETTINGS_DIR = Path(__file__).resolve().parent.parent.parent / "data"
 _SETTINGS_FILE = _SETTINGS_DIR / "settings.json"
 
+# Intervalle minimal entre deux vérifications de la date de modification du fichier
+_STAT_INTERVAL_SECONDS = 1.0
+
+_log = logging.getLogger(__name__)
+
+# Callback (anciens paramètres, nouveaux paramètres)
+SettingsListener = Callable[[dict[str, Any], dict[str, Any]], None]
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    """Paramètres validés à un instant donné. `version` augmente à chaque changement."""
+
+    version: int
+    data: dict[str, Any]
+    # (chemin, mtime_ns, taille) du fichier d'origine ; None si fichier absent
+    source: Tuple[str, Optional[Tuple[int, int]]]
+
+
+_lock = threading.RLock()
+_snapshot: Optional[SettingsSnapshot] = None
+_last_check = 0.0
+_subscribers: List[SettingsListener] = []
+
 
 def _ensure_dir() -> None:
     _SETTINGS_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def get_settings() -> dict[str, Any]:
-    """Charge les paramètres depuis le fichier, ou retourne les valeurs par défaut (validées)."""
-    if not _SETTINGS_FILE.exists():
+def _file_signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _load(path: Path) -> dict[str, Any]:
+    """Charge et valide le fichier, ou retourne les valeurs par défaut (validées)."""
+    if not path.exists():
         return AppSettings().model_dump()
     try:
-        with open(_SETTINGS_FILE, encoding="utf-8") as f:
+        with open(path, encoding="utf-8") as f:
             loaded = json.load(f)
         # Valider et fusionner avec les défauts (Pydantic remplit les champs manquants)
         settings = AppSettings.model_validate(loaded)
@@ -31,6 +75,68 @@ def get_settings() -> dict[str, Any]:
         return AppSettings().model_dump()
 
 
+def _publish(data: dict[str, Any], source: Tuple[str, Optional[Tuple[int, int]]]) -> SettingsSnapshot:
+    """Remplace l'instantané et notifie les abonnés si le contenu a changé."""
+    global _snapshot
+    with _lock:
+        previous = _snapshot
+        if previous is not None and previous.data == data:
+            _snapshot = SettingsSnapshot(previous.version, previous.data, source)
+            return _snapshot
+        _snapshot = SettingsSnapshot((previous.version + 1) if previous else 1, data, source)
+        current = _snapshot
+    if previous is not None:
+        _notify(previous.data, current.data)
+    return current
+
+
+def _notify(old: dict[str, Any], new: dict[str, Any]) -> None:
+    for listener in list(_subscribers):
+        try:
+            listener(copy.deepcopy(old), copy.deepcopy(new))
+        except Exception as e:
+            _log.warning("Abonné aux paramètres en erreur (%s): %s", listener, e)
+
+
+def get_snapshot() -> SettingsSnapshot:
+    """
+    Instantané courant. Le fichier n'est vérifié (stat) qu'au plus une fois par
+    _STAT_INTERVAL_SECONDS et relu seulement si sa signature a changé.
+    """
+    global _last_check
+    path = str(_SETTINGS_FILE)
+    snap = _snapshot
+    now = time.monotonic()
+    if snap is not None and snap.source[0] == path and now - _last_check < _STAT_INTERVAL_SECONDS:
+        return snap
+    with _lock:
+        _last_check = now
+        source = (path, _file_signature(_SETTINGS_FILE))
+        if _snapshot is not None and _snapshot.source == source:
+            return _snapshot
+        return _publish(_load(_SETTINGS_FILE), source)
+
+
+def get_settings() -> dict[str, Any]:
+    """Retourne les paramètres courants (copie de l'instantané en mémoire, validée)."""
+    return copy.deepcopy(get_snapshot().data)
+
+
+def subscribe(listener: SettingsListener) -> None:
+    """
+    Enregistre un callback appelé (anciens, nouveaux paramètres) à chaque changement.
+    Appelé de façon synchrone pendant la publication : il doit rester léger
+    (invalider un cache, pas reconstruire des modèles).
+    """
+    if listener not in _subscribers:
+        _subscribers.append(listener)
+
+
+def unsubscribe(listener: SettingsListener) -> None:
+    if listener in _subscribers:
+        _subscribers.remove(listener)
+
+
 def _deep_merge(base: dict, override: dict) -> dict:
     """Fusionne override dans base (récursif). Les clés absentes de override sont conservées."""
     result = dict(base)
@@ -42,6 +148,20 @@ def _deep_merge(base: dict, override: dict) -> dict:
     return result
 
 
+def _atomic_write_json(path: Path, data: dict[str, Any]) -> None:
+    """Écrit dans un fichier temporaire du même dossier puis renomme (jamais de fichier partiel)."""
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
 def save_settings(settings: dict[str, Any]) -> dict[str, Any]:
     """
     Valide les paramètres avec le schéma, sauvegarde uniquement les clés autorisées,
@@ -50,9 +170,10 @@ def save_settings(settings: dict[str, Any]) -> dict[str, Any]:
     validated = AppSettings.model_validate(settings)
     merged = validated.model_dump()
     _ensure_dir()
-    with open(_SETTINGS_FILE, "w", encoding="utf-8") as f:
-        json.dump(merged, f, indent=2, ensure_ascii=False)
-    return merged
+    with _lock:
+        _atomic_write_json(_SETTINGS_FILE, merged)
+        _publish(merged, (str(_SETTINGS_FILE), _file_signature(_SETTINGS_FILE)))
+    return copy.deepcopy(merged)
 
 
 def update_settings(partial: dict[str, Any]) -> dict[str, Any]:
@@ -60,6 +181,7 @@ def update_settings(partial: dict[str, Any]) -> dict[str, Any]:
     Met à jour partiellement la config : fusionne partial avec la config actuelle,
     valide le tout et sauvegarde. Idéal pour PUT avec un body partiel.
     """
-    current = get_settings()
-    merged = _deep_merge(current, partial)
-    return save_settings(merged)
+    with _lock:
+        current = get_settings()
+        merged = _deep_merge(current, partial)
+        return save_settings(merged)
@@ -0,0 +1,310 @@
+"""
+Découpage structuré (chunks.strategy = "structure").
+Le worker Docling exporte le document élément par élément (titres, paragraphes, listes,
+tableaux) en markdown, avec un marqueur `<!-- page N -->` à chaque changement de page. Ce
+module relit ce markdown ligne à ligne et produit les chunks au fil de l'eau (générateur) :
+un titre ouvre toujours un nouveau chunk, un tableau n'est jamais coupé au milieu d'une
+ligne (un tableau trop long est découpé par lignes, en-tête répété), et chaque chunk porte
+le chemin de sections et les pages couvertes (métadonnées Chroma).
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+PAGE_MARKER_RE = re.compile(r"^<!-- page (\d+) -->$")
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*\S)\s*$")
+_TABLE_ROW_RE = re.compile(r"^\s*\|.*\|\s*$")
+_TABLE_SEPARATOR_RE = re.compile(r"^\s*\|(\s*:?-{3,}:?\s*\|)+\s*$")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+")
+
+SECTION_SEPARATOR = " > "
+
+
+def page_marker(page_no: int) -> str:
+    return f"<!-- page {page_no} -->"
+
+
+def is_page_marker(line: str) -> bool:
+    return PAGE_MARKER_RE.match(line.strip()) is not None
+
+
+def _column_count(row: str) -> int:
+    return row.strip().strip("|").count("|") + 1
+
+
+@dataclass
+class Block:
+    """Bloc du document : titre, tableau ou paragraphe (lignes markdown), avec ses pages."""
+
+    kind: str  # heading | table | text
+    lines: List[str]
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    level: int = 0
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+def iter_blocks(lines: Iterable[str]) -> Iterator[Block]:
+    """
+    Regroupe les lignes en blocs. Les marqueurs de page ne sont pas des blocs : ils fixent la
+    page des blocs suivants. Un tableau interrompu par un changement de page et repris avec la
+    même largeur (ligne d'en-tête + séparateur répétés par Docling) reste un seul tableau.
+    """
+    page: Optional[int] = None
+    current: Optional[Block] = None
+    table_paused = False  # ligne vide ou marqueur après un tableau
+    page_changed = False  # changement de page pendant la pause
+    skip_separator = False
+
+    for raw in lines:
+        line = raw.rstrip("\n")
+        stripped = line.strip()
+        marker = PAGE_MARKER_RE.match(stripped)
+        if marker:
+            page = int(marker.group(1))
+            if current is not None and current.kind == "table":
+                table_paused, page_changed = True, True
+            elif current is not None:
+                yield current
+                current = None
+            continue
+        if not stripped:
+            if current is not None and current.kind == "table":
+                table_paused = True
+            elif current is not None:
+                yield current
+                current = None
+            continue
+
+        if current is not None and current.kind == "table" and _TABLE_ROW_RE.match(line):
+            if skip_separator and _TABLE_SEPARATOR_RE.match(line):
+                skip_separator = False
+                continue
+            skip_separator = False
+            if not table_paused:
+                current.lines.append(line)
+                current.page_end = page
+                continue
+            if page_changed and _column_count(line) == _column_count(current.lines[0]):
+                table_paused, page_changed, skip_separator = False, False, True
+                current.lines.append(line)
+                current.page_end = page
+                continue
+        skip_separator = False
+        if current is not None and current.kind == "table":
+            yield current
+            current = None
+        table_paused, page_changed = False, False
+
+        heading = _HEADING_RE.match(stripped)
+        if heading:
+            if current is not None:
+                yield current
+                current = None
+            yield Block("heading", [stripped], page, page, level=len(heading.group(1)))
+        elif _TABLE_ROW_RE.match(line):
+            if current is not None:
+                yield current
+            current = Block("table", [line], page, page)
+        elif current is None:
+            current = Block("text", [line], page, page)
+        else:
+            current.lines.append(line)
+            current.page_end = page
+    if current is not None:
+        yield current
+
+
+def _split_long_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """Découpe un paragraphe trop long par phrases, puis par mots, avec recouvrement."""
+    pieces: List[str] = []
+    units = [u for u in _SENTENCE_SPLIT_RE.split(text) if u]
+    current = ""
+    for unit in units:
+        while len(unit) > chunk_size:
+            cut = unit.rfind(" ", 0, chunk_size)
+            cut = cut if cut > 0 else chunk_size
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(unit[:cut].strip())
+            unit = unit[cut:].strip()
+        candidate = f"{current} {unit}".strip() if current else unit
+        if len(candidate) <= chunk_size:
+            current = candidate
+        else:
+            pieces.append(current)
+            current = f"{_overlap_tail(current, chunk_overlap)} {unit}".strip()
+            if len(current) > chunk_size:
+                current = unit
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _split_head(text: str, size: int) -> Tuple[str, str]:
+    """
+    (début, reste) : début d'au plus size caractères, coupé après la dernière phrase complète
+    si elle en remplit au moins la moitié, sinon au dernier espace ; ("", texte) si size <= 0.
+    """
+    if size <= 0:
+        return "", text
+    window = text[: size + 1]
+    ends = [m.start() for m in _SENTENCE_SPLIT_RE.finditer(window)]
+    cut = ends[-1] if ends and ends[-1] >= size // 2 else window.rfind(" ")
+    cut = cut if cut > 0 else size
+    return text[:cut].rstrip(), text[cut:].strip()
+
+
+def _overlap_tail(text: str, chunk_overlap: int) -> str:
+    """Fin du texte (au plus chunk_overlap caractères) coupée sur une frontière de mot."""
+    if chunk_overlap <= 0 or not text:
+        return ""
+    tail = text[-chunk_overlap:]
+    space = tail.find(" ")
+    return tail[space + 1 :] if 0 <= space < len(tail) - 1 and len(text) > chunk_overlap else tail
+
+
+def _split_table(block: Block, chunk_size: int) -> List[str]:
+    """Tableau trop long : groupes de lignes, chacun précédé de l'en-tête et du séparateur."""
+    lines = block.lines
+    header = lines[:2] if len(lines) > 1 and _TABLE_SEPARATOR_RE.match(lines[1]) else lines[:1]
+    rows = lines[len(header) :]
+    pieces: List[str] = []
+    current = list(header)
+    for row in rows:
+        if len(current) > len(header) and len("\n".join(current + [row])) > chunk_size:
+            pieces.append("\n".join(current))
+            current = list(header)
+        current.append(row)
+    if len(current) > len(header) or not pieces:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+@dataclass
+class _Buffer:
+    parts: List[str] = field(default_factory=list)
+    has_content: bool = False
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+
+    @property
+    def size(self) -> int:
+        return sum(len(p) for p in self.parts) + 2 * max(0, len(self.parts) - 1)
+
+    def add(self, text: str, page_start: Optional[int], page_end: Optional[int], content: bool = True) -> None:
+        self.parts.append(text)
+        self.has_content = self.has_content or content
+        if page_start is not None:
+            self.page_start = page_start if self.page_start is None else min(self.page_start, page_start)
+        if page_end is not None:
+            self.page_end = page_end if self.page_end is None else max(self.page_end, page_end)
+
+
+def _metadata(sections: List[Tuple[int, str]], page_start: Optional[int], page_end: Optional[int]) -> dict[str, Any]:
+    metadata: dict[str, Any] = {}
+    if sections:
+        metadata["section"] = SECTION_SEPARATOR.join(title for _, title in sections)
+    if page_start is not None:
+        metadata["page_start"] = page_start
+        metadata["page_end"] = page_end if page_end is not None else page_start
+    return metadata
+
+
+def chunk_blocks(
+    blocks: Iterable[Block], chunk_size: int = 1000, chunk_overlap: int = 200
+) -> Iterator[Tuple[str, dict[str, Any]]]:
+    """
+    Yield (texte du chunk, métadonnées) au fil des blocs. Les paragraphes d'une même section
+    sont regroupés jusqu'à chunk_size caractères ; deux chunks consécutifs d'une section se
+    recouvrent d'au plus chunk_overlap caractères. Un titre commence toujours un chunk (il
+    est inclus en tête de son texte) et met à jour le chemin de sections.
+    """
+    chunk_overlap = min(chunk_overlap, chunk_size // 2)
+    sections: List[Tuple[int, str]] = []
+    buffer = _Buffer()
+
+    def flush(overlap: bool) -> Iterator[Tuple[str, dict[str, Any]]]:
+        nonlocal buffer
+        if not buffer.has_content:
+            return
+        text = "\n\n".join(buffer.parts)
+        yield text, _metadata(sections, buffer.page_start, buffer.page_end)
+        tail = _overlap_tail(buffer.parts[-1], chunk_overlap) if overlap else ""
+        page = buffer.page_end
+        buffer = _Buffer()
+        if tail:
+            buffer.add(tail, page, page, content=False)
+
+    for block in blocks:
+        if block.kind == "heading":
+            yield from flush(overlap=False)
+            # Recouvrement sans objet dans une nouvelle section ; les titres en attente restent
+            buffer.parts = [part for part in buffer.parts if _HEADING_RE.match(part)]
+            title = block.lines[0].lstrip("#").strip()
+            while sections and sections[-1][0] >= block.level:
+                sections.pop()
+            sections.append((block.level, title))
+            buffer.add(block.text, block.page_start, block.page_end, content=False)
+            continue
+
+        text = block.text
+        if buffer.size + 2 + len(text) <= chunk_size:
+            buffer.add(text, block.page_start, block.page_end)
+            continue
+
+        if block.kind == "table":
+            yield from flush(overlap=False)
+            if buffer.size + 2 + len(text) <= chunk_size:
+                buffer.add(text, block.page_start, block.page_end)
+                continue
+            pieces = _split_table(block, chunk_size)
+            for piece in pieces[:-1]:
+                buffer.add(piece, block.page_start, block.page_end)
+                yield from flush(overlap=False)
+            buffer.add(pieces[-1], block.page_start, block.page_end)
+            yield from flush(overlap=False)
+            continue
+
+        yield from flush(overlap=True)
+        if buffer.size + 2 + len(text) <= chunk_size:
+            buffer.add(text, block.page_start, block.page_end)
+            continue
+        # Seul le premier morceau complète le chunk en cours ; les suivants font chunk_size
+        head, rest = _split_head(text, chunk_size - buffer.size - 2) if buffer.parts else ("", text)
+        if head:
+            buffer.add(head, block.page_start, block.page_end)
+            yield from flush(overlap=False)
+            rest = f"{_overlap_tail(head, chunk_overlap)} {rest}".strip()
+        pieces = _split_long_text(rest, chunk_size, chunk_overlap)
+        for piece in pieces[:-1]:
+            buffer.add(piece, block.page_start, block.page_end)
+            yield from flush(overlap=False)
+        buffer.add(pieces[-1], block.page_start, block.page_end)
+    yield from flush(overlap=False)
+
+
+def _iter_lines(text: str) -> Iterator[str]:
+    """Lignes du texte, extraites une à une (ni copie du texte ni liste des lignes)."""
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end < 0:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def chunk_markdown(
+    text: str, chunk_size: int = 1000, chunk_overlap: int = 200
+) -> Iterator[Tuple[str, dict[str, Any]]]:
+    """
+    Yield les chunks (texte, métadonnées) d'un markdown structuré, lu ligne à ligne : le
+    premier chunk est disponible (et peut être embeddé) avant la fin du découpage.
+    """
+    yield from chunk_blocks(iter_blocks(_iter_lines(text)), chunk_size, chunk_overlap)
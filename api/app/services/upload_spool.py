@@ -0,0 +1,244 @@
+"""
+Réception des fichiers envoyés : copie par blocs dans un fichier temporaire (spool) sur
+disque, avec empreinte SHA-256 calculée au fil de l'eau ; le chemin est transmis tel quel
+à Docling. Starlette a déjà reçu le corps multipart dans ses propres fichiers temporaires
+quand la route s'exécute : la limite de taille pendant la réception est appliquée en amont
+par UploadLimitMiddleware (max_request_bytes), celle de spool_upload (docling.max_file_size)
+vaut par fichier d'un envoi groupé.
+Les archives zip / tar reçues pour un import groupé sont dépliées de la même façon : chaque
+membre est copié par blocs dans son propre fichier temporaire (aucune écriture sous un
+chemin issu de l'archive). La taille dépliée est bornée par membre et au total
+(INGEST_MAX_EXPANDED_MB) : une archive très compressée (zip bomb) ne peut pas remplir le disque.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tarfile
+import tempfile
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import IO, Any, List, Optional
+
+from app.services.settings_service import get_settings
+
+_log = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1024 * 1024  # 1 Mo
+
+_DEFAULT_MAX_ARCHIVE_MB = 1024
+_DEFAULT_MAX_ARCHIVE_MEMBERS = 2000
+_DEFAULT_MAX_EXPANDED_MB = 2048
+# Taille maximale d'un membre quand docling.max_file_size n'est pas défini
+_DEFAULT_MAX_MEMBER_MB = 256
+# Enveloppe multipart (délimiteurs, en-têtes de partie) tolérée en plus du fichier
+_MULTIPART_OVERHEAD = 64 * 1024
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# Entrées ignorées dans les archives (métadonnées macOS / Windows)
+_IGNORED_NAMES = frozenset({".DS_Store", "Thumbs.db", "desktop.ini"})
+
+
+class FileTooLargeError(ValueError):
+    """Fichier envoyé au-delà de la taille maximale configurée."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Fichier trop volumineux (maximum {max_bytes // (1024 * 1024)} Mo)")
+        self.max_bytes = max_bytes
+
+
+@dataclass
+class SpooledUpload:
+    """Fichier reçu sur disque. À supprimer avec cleanup() une fois traité."""
+
+    path: str
+    filename: str
+    size: int
+    content_hash: str
+
+    def cleanup(self) -> None:
+        Path(self.path).unlink(missing_ok=True)
+
+
+def max_upload_bytes(settings: Optional[dict[str, Any]] = None) -> Optional[int]:
+    """Taille maximale d'un envoi en octets (docling.max_file_size, en Mo), None si illimitée."""
+    settings = settings if settings is not None else get_settings()
+    max_mb = settings.get("docling", {}).get("max_file_size")
+    return int(max_mb) * 1024 * 1024 if max_mb else None
+
+
+def max_archive_bytes() -> int:
+    """Taille maximale d'une archive envoyée (INGEST_MAX_ARCHIVE_MB, défaut 1024 Mo)."""
+    try:
+        max_mb = int(os.getenv("INGEST_MAX_ARCHIVE_MB", _DEFAULT_MAX_ARCHIVE_MB))
+    except ValueError:
+        max_mb = _DEFAULT_MAX_ARCHIVE_MB
+    return max(1, max_mb) * 1024 * 1024
+
+
+def max_expanded_bytes() -> int:
+    """Taille totale maximale des fichiers dépliés d'une archive (INGEST_MAX_EXPANDED_MB, défaut 2048 Mo)."""
+    try:
+        max_mb = int(os.getenv("INGEST_MAX_EXPANDED_MB", _DEFAULT_MAX_EXPANDED_MB))
+    except ValueError:
+        max_mb = _DEFAULT_MAX_EXPANDED_MB
+    return max(1, max_mb) * 1024 * 1024
+
+
+def max_request_bytes(batch: bool = False) -> Optional[int]:
+    """
+    Taille maximale du corps d'une requête d'envoi, None si illimitée : un fichier
+    (docling.max_file_size) ou, pour un import groupé, l'ensemble des fichiers et archives
+    envoyés (au moins INGEST_MAX_ARCHIVE_MB).
+    """
+    limit = max_upload_bytes()
+    if batch:
+        limit = max(max_archive_bytes(), limit or 0)
+    return limit + _MULTIPART_OVERHEAD if limit else None
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _spool_dir() -> Optional[str]:
+    return os.getenv("UPLOAD_SPOOL_DIR") or None
+
+
+async def spool_upload(upload: Any, filename: str, max_bytes: Optional[int] = None) -> SpooledUpload:
+    """
+    Copie `upload` (UploadFile ou objet avec `async read(n)`) dans un fichier temporaire
+    par blocs de _CHUNK_SIZE. Lève FileTooLargeError dès que max_bytes est dépassé
+    (le fichier partiel est supprimé). Pour un UploadFile, le contenu est déjà sur le
+    serveur : la réception elle-même est bornée par UploadLimitMiddleware.
+    """
+    suffix = Path(filename).suffix or ".bin"
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="upload-", dir=_spool_dir())
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await upload.read(_CHUNK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if max_bytes is not None and size > max_bytes:
+                    raise FileTooLargeError(max_bytes)
+                digest.update(block)
+                await asyncio.to_thread(out.write, block)
+    except BaseException:
+        Path(path).unlink(missing_ok=True)
+        raise
+    return SpooledUpload(path=path, filename=filename, size=size, content_hash=digest.hexdigest())
+
+
+def spool_bytes(content: bytes, filename: str) -> SpooledUpload:
+    """Écrit un contenu déjà en mémoire dans un fichier temporaire (appels programmatiques)."""
+    suffix = Path(filename).suffix or ".bin"
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="upload-", dir=_spool_dir())
+    with os.fdopen(fd, "wb") as out:
+        out.write(content)
+    return SpooledUpload(
+        path=path, filename=filename, size=len(content), content_hash=hashlib.sha256(content).hexdigest()
+    )
+
+
+def _member_filename(name: str) -> Optional[str]:
+    """Nom de fichier retenu pour un membre d'archive, None si le membre est à ignorer."""
+    path = PurePosixPath(name.replace("\\", "/"))
+    if path.is_absolute() or ".." in path.parts or not path.name:
+        return None
+    if "__MACOSX" in path.parts or path.name in _IGNORED_NAMES or path.name.startswith("._"):
+        return None
+    return path.name
+
+
+def _spool_stream(source: IO[bytes], filename: str, max_bytes: Optional[int]) -> SpooledUpload:
+    """Version synchrone de spool_upload pour un flux lu dans une archive."""
+    suffix = Path(filename).suffix or ".bin"
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="upload-", dir=_spool_dir())
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = source.read(_CHUNK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if max_bytes is not None and size > max_bytes:
+                    raise FileTooLargeError(max_bytes)
+                digest.update(block)
+                out.write(block)
+    except BaseException:
+        Path(path).unlink(missing_ok=True)
+        raise
+    return SpooledUpload(path=path, filename=filename, size=size, content_hash=digest.hexdigest())
+
+
+def _iter_archive_members(path: str, archive_name: str):
+    """Yield (nom, ouvreur du flux) des fichiers réguliers de l'archive."""
+    if archive_name.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, lambda info=info: archive.open(info)
+        return
+    with tarfile.open(path, mode="r:*") as archive:
+        for member in archive:
+            # Liens, dossiers, périphériques : ignorés
+            if member.isfile():
+                yield member.name, lambda member=member: archive.extractfile(member)
+
+
+def expand_archive(
+    upload: SpooledUpload,
+    max_member_bytes: Optional[int] = None,
+    max_members: int = _DEFAULT_MAX_ARCHIVE_MEMBERS,
+    max_total_bytes: Optional[int] = None,
+) -> List[SpooledUpload]:
+    """
+    Déplie une archive reçue (zip, tar, tar.gz/bz2/xz) en fichiers temporaires, un par membre.
+    Les dossiers, liens, chemins absolus ou remontants (..) et métadonnées système sont ignorés.
+    Lève FileTooLargeError si un membre dépasse max_member_bytes (défaut 256 Mo) ou si le total
+    déplié dépasse max_total_bytes (défaut max_expanded_bytes()), ValueError si l'archive est
+    illisible ou compte plus de max_members fichiers. En cas d'erreur, rien ne reste sur disque.
+    """
+    if max_member_bytes is None:
+        max_member_bytes = _DEFAULT_MAX_MEMBER_MB * 1024 * 1024
+    if max_total_bytes is None:
+        max_total_bytes = max_expanded_bytes()
+    spooled: List[SpooledUpload] = []
+    expanded = 0
+    try:
+        for name, opener in _iter_archive_members(upload.path, upload.filename):
+            filename = _member_filename(name)
+            if filename is None:
+                _log.debug("Membre d'archive ignoré: %s", name)
+                continue
+            if len(spooled) >= max_members:
+                raise ValueError(f"Archive trop volumineuse (maximum {max_members} fichiers)")
+            source = opener()
+            if source is None:
+                continue
+            remaining = max_total_bytes - expanded
+            with source:
+                try:
+                    member = _spool_stream(source, filename, min(max_member_bytes, remaining))
+                except FileTooLargeError:
+                    # Limite atteinte : celle du membre, ou le budget total de l'archive
+                    raise FileTooLargeError(max_total_bytes if remaining < max_member_bytes else max_member_bytes)
+            spooled.append(member)
+            expanded += member.size
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        for item in spooled:
+            item.cleanup()
+        raise ValueError(f"Archive illisible: {upload.filename}") from e
+    except BaseException:
+        for item in spooled:
+            item.cleanup()
+        raise
+    return spooled
@@ -0,0 +1,495 @@
+"""
+Carte 2D des vecteurs (chunks) précalculée en tâche de fond.
+La disposition est calculée hors requête après chaque ingestion / suppression et persistée
+(data/vector_map.npz : coordonnées float32 + métadonnées des points, version du corpus).
+L'endpoint sert immédiatement la dernière carte connue, avec un indicateur "stale".
+
+Mise à jour :
+- complète (première carte, ou trop de nouveaux chunks) : IncrementalPCA (50 composantes)
+  ajustée page par page, puis t-SNE sur les vecteurs réduits ;
+- incrémentale : chaque nouveau chunk est placé à la moyenne (pondérée par la distance)
+  des coordonnées de ses plus proches voisins déjà placés (index HNSW de Chroma) ; les
+  chunks supprimés sont retirés.
+
+Lecture : index spatial en grille (requêtes par bbox), regroupement des zones denses selon
+le zoom, extraits de texte à la demande, sortie JSON, colonnes ou binaire (float32).
+"""
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+try:
+    import numpy as np
+    from sklearn.decomposition import IncrementalPCA
+    from sklearn.manifold import TSNE
+    _HAS_LAYOUT = True
+except ImportError:
+    np = None  # type: ignore
+    IncrementalPCA = None  # type: ignore
+    TSNE = None  # type: ignore
+    _HAS_LAYOUT = False
+
+from app.services import vector_store
+
+_log = logging.getLogger(__name__)
+
+_LAYOUT_FILE = "vector_map.npz"
+_SNIPPET_MAX_LEN = 150
+_PAGE_SIZE = 500
+_PCA_COMPONENTS = 50
+_NEIGHBOURS = 5
+_MAX_EXTRA_NEIGHBOURS = 50
+# Au-delà de cette part de nouveaux chunks, la carte est recalculée entièrement
+_INCREMENTAL_MAX_RATIO = 0.25
+
+
+@dataclass
+class Layout:
+    """Disposition 2D des chunks pour une version du corpus."""
+
+    version: int
+    ids: List[str]
+    coords: Any  # np.ndarray float32 (n, 2)
+    doc_ids: List[str]
+    filenames: List[str]
+    chunk_indexes: List[int]
+    snippets: List[str]
+
+
+_layout: Optional[Layout] = None
+_layout_loaded_from: Optional[str] = None
+_lock = threading.Lock()
+_dirty = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+
+def is_available() -> bool:
+    return _HAS_LAYOUT and vector_store.is_available()
+
+
+def _layout_path() -> str:
+    return os.path.join(vector_store.get_data_directory(), _LAYOUT_FILE)
+
+
+def _snippet(text: str) -> str:
+    return (text[:_SNIPPET_MAX_LEN] + "…") if len(text) > _SNIPPET_MAX_LEN else text
+
+
+def _save(layout: Layout, path: str) -> None:
+    """Écriture atomique (fichier temporaire du même dossier puis renommage)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".vector_map.", suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                version=np.int64(layout.version),
+                ids=np.array(layout.ids, dtype=np.str_),
+                coords=np.asarray(layout.coords, dtype=np.float32).reshape(-1, 2),
+                doc_ids=np.array(layout.doc_ids, dtype=np.str_),
+                filenames=np.array(layout.filenames, dtype=np.str_),
+                chunk_indexes=np.array(layout.chunk_indexes, dtype=np.int32),
+                snippets=np.array(layout.snippets, dtype=np.str_),
+            )
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _load(path: str) -> Optional[Layout]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return Layout(
+                version=int(data["version"]),
+                ids=data["ids"].tolist(),
+                coords=data["coords"].astype(np.float32),
+                doc_ids=data["doc_ids"].tolist(),
+                filenames=data["filenames"].tolist(),
+                chunk_indexes=data["chunk_indexes"].tolist(),
+                snippets=data["snippets"].tolist(),
+            )
+    except Exception as e:
+        _log.warning("Carte des vecteurs illisible (%s), elle sera recalculée: %s", path, e)
+        return None
+
+
+def _current_layout() -> Optional[Layout]:
+    """Carte en mémoire, chargée depuis le disque au premier appel (par répertoire de données)."""
+    global _layout, _layout_loaded_from
+    path = _layout_path()
+    with _lock:
+        if _layout_loaded_from != path:
+            _layout = _load(path)
+            _layout_loaded_from = path
+        return _layout
+
+
+def _set_layout(layout: Layout, path: str) -> None:
+    global _layout, _layout_loaded_from
+    _save(layout, path)
+    with _lock:
+        _layout, _layout_loaded_from = layout, path
+
+
+def _compute_full(version: int) -> Layout:
+    """Disposition complète : PCA incrémentale page par page puis t-SNE (mémoire bornée)."""
+    pca: Any = None
+    for _, matrix, _, _ in vector_store.iter_embedding_pages(_PAGE_SIZE):
+        if pca is None:
+            n_components = min(_PCA_COMPONENTS, matrix.shape[1])
+            pca = IncrementalPCA(n_components=n_components)
+        # partial_fit exige au moins n_components lignes par lot
+        if matrix.shape[0] >= pca.n_components:
+            pca.partial_fit(matrix)
+    ids_all: List[str] = []
+    doc_ids: List[str] = []
+    filenames: List[str] = []
+    chunk_indexes: List[int] = []
+    snippets: List[str] = []
+    reduced_pages = []
+    for ids, matrix, metas, docs in vector_store.iter_embedding_pages(_PAGE_SIZE):
+        fitted = pca is not None and hasattr(pca, "components_")
+        reduced_pages.append(pca.transform(matrix) if fitted else matrix)
+        ids_all.extend(ids)
+        doc_ids.extend(m.get("doc_id", "") for m in metas)
+        filenames.extend(m.get("filename", "") for m in metas)
+        chunk_indexes.extend(int(m.get("chunk_index", 0)) for m in metas)
+        snippets.extend(_snippet(d or "") for d in docs)
+    n = len(ids_all)
+    if n == 0:
+        coords = np.zeros((0, 2), dtype=np.float32)
+    elif n < 3:
+        coords = np.array([[float(i), 0.0] for i in range(n)], dtype=np.float32)
+    else:
+        reduced = np.vstack(reduced_pages).astype(np.float32)
+        perplexity = min(30, max(1, n - 1))
+        coords = TSNE(n_components=2, random_state=42, perplexity=perplexity, init="pca").fit_transform(reduced)
+    return Layout(version, ids_all, np.asarray(coords, dtype=np.float32), doc_ids, filenames, chunk_indexes, snippets)
+
+
+def _place_new(layout: Layout, new_ids: List[str]) -> Layout:
+    """Place les nouveaux chunks près de leurs voisins déjà placés (moyenne pondérée)."""
+    positions = {chunk_id: i for i, chunk_id in enumerate(layout.ids)}
+    coords = [layout.coords]
+    ids, doc_ids, filenames = list(layout.ids), list(layout.doc_ids), list(layout.filenames)
+    chunk_indexes, snippets = list(layout.chunk_indexes), list(layout.snippets)
+    center = layout.coords.mean(axis=0) if len(layout.coords) else np.zeros(2, dtype=np.float32)
+    rng = np.random.default_rng(len(ids))
+    for page_ids, matrix, metas, docs in vector_store.iter_embedding_pages(_PAGE_SIZE, ids=new_ids):
+        # Voisins demandés en surnombre : certains peuvent être eux-mêmes nouveaux
+        neighbours = vector_store.query_neighbours(matrix, _NEIGHBOURS + min(len(new_ids), _MAX_EXTRA_NEIGHBOURS))
+        page_coords = np.zeros((len(page_ids), 2), dtype=np.float32)
+        for i, hits in enumerate(neighbours):
+            placed = [(positions[h], d) for h, d in hits if h in positions][:_NEIGHBOURS]
+            if placed:
+                weights = np.array([1.0 / (d + 1e-6) for _, d in placed], dtype=np.float32)
+                points = layout.coords[[p for p, _ in placed]]
+                page_coords[i] = (points * weights[:, None]).sum(axis=0) / weights.sum()
+            else:
+                page_coords[i] = center
+            # Léger décalage pour ne pas superposer des chunks identiques
+            page_coords[i] += rng.normal(0.0, 0.05, size=2).astype(np.float32)
+        coords.append(page_coords)
+        ids.extend(page_ids)
+        doc_ids.extend(m.get("doc_id", "") for m in metas)
+        filenames.extend(m.get("filename", "") for m in metas)
+        chunk_indexes.extend(int(m.get("chunk_index", 0)) for m in metas)
+        snippets.extend(_snippet(d or "") for d in docs)
+    return Layout(layout.version, ids, np.vstack(coords).astype(np.float32), doc_ids, filenames, chunk_indexes, snippets)
+
+
+def _without(layout: Layout, removed: set) -> Layout:
+    keep = [i for i, chunk_id in enumerate(layout.ids) if chunk_id not in removed]
+    return Layout(
+        layout.version,
+        [layout.ids[i] for i in keep],
+        layout.coords[keep] if keep else np.zeros((0, 2), dtype=np.float32),
+        [layout.doc_ids[i] for i in keep],
+        [layout.filenames[i] for i in keep],
+        [layout.chunk_indexes[i] for i in keep],
+        [layout.snippets[i] for i in keep],
+    )
+
+
+def refresh() -> Optional[Layout]:
+    """
+    Met la carte à jour pour la version courante du corpus (bloquant : tâche de fond).
+    Incrémental si la carte existante couvre l'essentiel du corpus, complet sinon.
+    """
+    from app.services.document_store import corpus_version
+
+    if not is_available():
+        return None
+    version = corpus_version()
+    path = _layout_path()
+    layout = _current_layout()
+    if layout is not None and layout.version == version:
+        return layout
+    # Un chunk ré-ingéré sous le même id mais au contenu différent compte comme nouveau
+    placed = dict(zip(layout.ids, layout.snippets)) if layout is not None else {}
+    current_ids: List[str] = []
+    changed: set = set()
+    for chunk in vector_store.iter_chunks(page_size=_PAGE_SIZE):
+        current_ids.append(chunk["id"])
+        if chunk["id"] in placed and placed[chunk["id"]] != _snippet(chunk["text"] or ""):
+            changed.add(chunk["id"])
+    if layout is not None and layout.ids:
+        current = set(current_ids)
+        # Chunks dont la position reste valable (toujours présents, contenu inchangé)
+        known = (set(layout.ids) & current) - changed
+        new_ids = [chunk_id for chunk_id in current_ids if chunk_id not in known]
+        if len(new_ids) <= _INCREMENTAL_MAX_RATIO * max(1, len(current)):
+            updated = _without(layout, set(layout.ids) - known)
+            if new_ids and updated.ids:
+                updated = _place_new(updated, new_ids)
+            if not new_ids or updated.ids:
+                updated.version = version
+                _set_layout(updated, path)
+                _log.info(
+                    "Carte des vecteurs mise à jour (+%d / -%d chunks)",
+                    len(new_ids), len(set(layout.ids) - current),
+                )
+                return updated
+    updated = _compute_full(version)
+    _set_layout(updated, path)
+    _log.info("Carte des vecteurs recalculée (%d chunks)", len(updated.ids))
+    return updated
+
+
+def _run_worker() -> None:
+    global _worker
+    while True:
+        _dirty.wait()
+        _dirty.clear()
+        try:
+            refresh()
+        except Exception as e:
+            _log.exception("Calcul de la carte des vecteurs échoué: %s", e)
+        with _lock:
+            if not _dirty.is_set():
+                _worker = None
+                return
+
+
+def schedule_refresh() -> None:
+    """Demande une mise à jour en tâche de fond (les demandes rapprochées sont regroupées)."""
+    global _worker
+    if not _HAS_LAYOUT:
+        return
+    _dirty.set()
+    with _lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run_worker, name="vector-map", daemon=True)
+            _worker.start()
+
+
+def is_computing() -> bool:
+    return _worker is not None
+
+
+# --- Lecture : index spatial en grille, niveaux de détail ---------------------------
+
+_GRID_CELLS = 64  # cellules par côté de l'index spatial
+_LOD_BASE_CELLS = 16  # cellules par côté au zoom 0 pour le regroupement
+DEFAULT_MAX_POINTS = 5000
+
+
+class _LayoutIndex:
+    """Index spatial en grille uniforme et codes de documents d'une carte (immuable)."""
+
+    def __init__(self, layout: Layout):
+        coords = np.asarray(layout.coords, dtype=np.float32).reshape(-1, 2)
+        self.x = coords[:, 0]
+        self.y = coords[:, 1]
+        if len(coords):
+            self.bounds = (float(self.x.min()), float(self.y.min()), float(self.x.max()), float(self.y.max()))
+        else:
+            self.bounds = (0.0, 0.0, 0.0, 0.0)
+        # Documents numérotés dans l'ordre d'apparition
+        self.docs: List[dict[str, str]] = []
+        codes: dict[str, int] = {}
+        doc_codes = np.zeros(len(layout.ids), dtype=np.uint32)
+        for i, (doc_id, filename) in enumerate(zip(layout.doc_ids, layout.filenames)):
+            if doc_id not in codes:
+                codes[doc_id] = len(self.docs)
+                self.docs.append({"doc_id": doc_id, "filename": filename})
+            doc_codes[i] = codes[doc_id]
+        self.doc_codes = doc_codes
+        # Grille : indices des points triés par cellule + début de chaque cellule (CSR)
+        cx, cy = self._cells(self.x, self.y, _GRID_CELLS)
+        cell = cy * _GRID_CELLS + cx
+        self.order = np.argsort(cell, kind="stable").astype(np.int64)
+        self.cell_starts = np.searchsorted(cell[self.order], np.arange(_GRID_CELLS * _GRID_CELLS + 1))
+
+    def _cells(self, x: Any, y: Any, n_cells: int) -> tuple:
+        xmin, ymin, xmax, ymax = self.bounds
+        width = max(xmax - xmin, 1e-9)
+        height = max(ymax - ymin, 1e-9)
+        cx = np.clip(((x - xmin) / width * n_cells).astype(np.int64), 0, n_cells - 1)
+        cy = np.clip(((y - ymin) / height * n_cells).astype(np.int64), 0, n_cells - 1)
+        return cx, cy
+
+    def select(self, bbox: Optional[tuple]) -> Any:
+        """Indices des points dans bbox (xmin, ymin, xmax, ymax) ; tous si bbox est None."""
+        if bbox is None:
+            return np.arange(len(self.x), dtype=np.int64)
+        xmin, ymin, xmax, ymax = bbox
+        # Cellules de la grille qui recouvrent bbox, puis filtrage exact des points
+        (cx0, cx1), (cy0, cy1) = self._cells(np.array([xmin, xmax]), np.array([ymin, ymax]), _GRID_CELLS)
+        chunks = []
+        for cy in range(int(cy0), int(cy1) + 1):
+            row = cy * _GRID_CELLS
+            start, end = self.cell_starts[row + int(cx0)], self.cell_starts[row + int(cx1) + 1]
+            chunks.append(self.order[start:end])
+        candidates = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64)
+        inside = (
+            (self.x[candidates] >= xmin) & (self.x[candidates] <= xmax)
+            & (self.y[candidates] >= ymin) & (self.y[candidates] <= ymax)
+        )
+        return np.sort(candidates[inside])
+
+    def view(self, bbox: Optional[tuple], zoom: int, max_points: int) -> dict[str, Any]:
+        """
+        Points visibles (colonnes numpy index, x, y, count, doc). Au-delà de max_points,
+        les points sont regroupés par cellule d'une grille de _LOD_BASE_CELLS * 2^zoom
+        cellules par côté : un agrégat est placé au barycentre, count = nombre de points,
+        index = un point représentatif (doc de ce point).
+        """
+        selected = self.select(bbox)
+        if len(selected) <= max_points:
+            return {
+                "index": selected.astype(np.uint32),
+                "x": self.x[selected],
+                "y": self.y[selected],
+                "count": np.ones(len(selected), dtype=np.uint32),
+                "doc": self.doc_codes[selected],
+                "total": int(len(selected)),
+            }
+        n_cells = _LOD_BASE_CELLS * (2 ** max(0, min(zoom, 12)))
+        cx, cy = self._cells(self.x[selected], self.y[selected], n_cells)
+        keys = cy * n_cells + cx
+        _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+        sum_x = np.bincount(inverse, weights=self.x[selected])
+        sum_y = np.bincount(inverse, weights=self.y[selected])
+        representative = selected[first]
+        return {
+            "index": representative.astype(np.uint32),
+            "x": (sum_x / counts).astype(np.float32),
+            "y": (sum_y / counts).astype(np.float32),
+            "count": counts.astype(np.uint32),
+            "doc": self.doc_codes[representative],
+            "total": int(len(selected)),
+        }
+
+
+_index_cache: Optional[tuple] = None  # (layout, _LayoutIndex)
+
+
+def _layout_index(layout: Layout) -> _LayoutIndex:
+    global _index_cache
+    cached = _index_cache
+    if cached is not None and cached[0] is layout:
+        return cached[1]
+    index = _LayoutIndex(layout)
+    _index_cache = (layout, index)
+    return index
+
+
+def get_map(
+    bbox: Optional[tuple] = None,
+    zoom: int = 0,
+    max_points: int = DEFAULT_MAX_POINTS,
+    snippets: bool = False,
+    columnar: bool = False,
+) -> dict[str, Any]:
+    """
+    Dernière carte connue, sans calcul : { available, version, stale, computing, bounds,
+    total, points } (ou "docs" + "columns" si columnar). Restreinte à bbox, agrégée selon
+    zoom au-delà de max_points ; extraits de texte seulement si snippets.
+    Une carte absente ou en retard sur le corpus déclenche une mise à jour en tâche de fond.
+    """
+    from app.services.document_store import corpus_version
+
+    if not is_available():
+        return {"available": False, "points": [], "version": None, "stale": False, "computing": False}
+    layout = _current_layout()
+    stale = layout is None or layout.version != corpus_version()
+    if stale:
+        schedule_refresh()
+    result: dict[str, Any] = {
+        "available": True,
+        "version": layout.version if layout is not None else None,
+        "stale": stale,
+        "computing": is_computing(),
+    }
+    if layout is None:
+        return {**result, "bounds": None, "total": 0, "points": []}
+    index = _layout_index(layout)
+    view = index.view(bbox, zoom, max_points)
+    result["bounds"] = list(index.bounds)
+    result["total"] = view["total"]
+    if columnar:
+        result["docs"] = index.docs
+        result["columns"] = {key: view[key].tolist() for key in ("index", "x", "y", "count", "doc")}
+        return result
+    points = []
+    for i, x, y, count in zip(view["index"].tolist(), view["x"].tolist(), view["y"].tolist(), view["count"].tolist()):
+        point: dict[str, Any] = {
+            "index": i,
+            "id": layout.ids[i],
+            "doc_id": layout.doc_ids[i],
+            "filename": layout.filenames[i],
+            "chunk_index": layout.chunk_indexes[i],
+            "x": x,
+            "y": y,
+            "count": count,
+        }
+        if snippets and count == 1:
+            point["text_snippet"] = layout.snippets[i]
+        points.append(point)
+    result["points"] = points
+    return result
+
+
+def encode_binary(view: dict[str, Any]) -> bytes:
+    """
+    Format binaire de get_map(columnar=True) : uint32 LE (taille de l'en-tête), en-tête JSON
+    UTF-8 (version, stale, computing, bounds, total, docs, n) complété par des espaces à un
+    multiple de 4 octets, puis les colonnes little-endian de n valeurs :
+    index uint32, x float32, y float32, count uint32, doc uint32.
+    """
+    columns = view.get("columns") or {"index": [], "x": [], "y": [], "count": [], "doc": []}
+    header = {k: v for k, v in view.items() if k != "columns"}
+    header["n"] = len(columns["index"])
+    raw = json.dumps(header).encode("utf-8")
+    raw += b" " * (-(4 + len(raw)) % 4)
+    parts = [struct.pack("<I", len(raw)), raw]
+    for key, dtype in (("index", "<u4"), ("x", "<f4"), ("y", "<f4"), ("count", "<u4"), ("doc", "<u4")):
+        parts.append(np.asarray(columns[key], dtype=dtype).tobytes())
+    return b"".join(parts)
+
+
+def get_point(index: int, version: Optional[int] = None) -> Optional[dict[str, Any]]:
+    """Détail d'un point (extrait de texte compris), None si inconnu ou si la carte a changé."""
+    layout = _current_layout()
+    if layout is None or not 0 <= index < len(layout.ids):
+        return None
+    if version is not None and version != layout.version:
+        return None
+    return {
+        "index": index,
+        "id": layout.ids[index],
+        "doc_id": layout.doc_ids[index],
+        "filename": layout.filenames[index],
+        "chunk_index": layout.chunk_indexes[index],
+        "text_snippet": layout.snippets[index],
+    }
@@ -1,36 +1,58 @@
 """
 Stockage vectoriel Chroma pour les chunks et embeddings.
 Fonctionne en local (persist_directory) et en production (même répertoire ou Chroma distant).
+
+Le client Chroma et l'embedding function sont ouverts une seule fois par processus
+(open_store au démarrage FastAPI, close_store à l'arrêt) puis réutilisés ; ils ne sont
+reconstruits que si la configuration (fournisseur et modèle d'embeddings, clé API,
+répertoire de persistance) change. Fournisseurs : voir embedding_providers (OpenAI ou
+modèle local hors ligne), une collection par fournisseur et modèle.
 """
+import asyncio
+import hashlib
 import logging
 import os
-from typing import Any, List, Optional
+import threading
+import uuid
+from collections import Counter
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
 
-# Import conditionnel pour ne pas casser le démarrage sans clé API
+# Import conditionnel pour ne pas casser le démarrage sans Chroma
 try:
+    import chromadb
     from langchain_chroma import Chroma
-    from langchain_core.documents import Document
-    from langchain_openai import OpenAIEmbeddings
     _HAS_CHROMA = True
 except ImportError:
     _HAS_CHROMA = False
 
-# t-SNE pour la carte 2D des vecteurs (import en tête pour éviter latence au premier appel)
+from app.services import embedding_providers
+from app.services.embedding_cache import CachedEmbeddings, EmbeddingCache
+from app.services.embedding_pipeline import embed_batches, iter_batches
+from app.services.settings_service import get_settings
+
 try:
     import numpy as np
-    from sklearn.manifold import TSNE
-    _HAS_TSNE = True
 except ImportError:
     np = None  # type: ignore
-    TSNE = None  # type: ignore
-    _HAS_TSNE = False
 
-_COLLECTION_NAME = "rag_chunks"
 # Chemin absolu par défaut (relatif au package api) pour éviter les écarts de cwd
 _BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 _DEFAULT_PERSIST_DIR = os.path.join(_BASE_DIR, "data", "chroma")
+_EMBEDDING_CACHE_FILE = "embedding_cache.sqlite3"
+_DEFAULT_EMBEDDING_CACHE_MAX_MB = 512
 _log = logging.getLogger(__name__)
 
+# Progression de l'écriture des embeddings : (chunks embeddés, total)
+ProgressCallback = Callable[[int, int], None]
+
+# Métadonnée de version des chunks : chaque écriture d'un document (ajout ou remplacement)
+# marque ses nouveaux chunks d'une génération, masquée des recherches tant que l'écriture
+# n'est pas terminée ; les chunks retirés passent sous une génération masquée avant leur
+# suppression. Une recherche voit ainsi l'ancienne ou la nouvelle version, jamais les deux.
+_GENERATION_KEY = "generation"
+_hidden_generations: set[str] = set()
+_generations_lock = threading.Lock()
+
 
 def _get_persist_directory() -> str:
     raw = os.getenv("CHROMA_PERSIST_DIR", "").strip()
@@ -39,6 +61,24 @@ def _get_persist_directory() -> str:
     return _DEFAULT_PERSIST_DIR
 
 
+def _data_directory_for(persist_dir: str) -> str:
+    return os.path.dirname(persist_dir.rstrip(os.sep)) or "."
+
+
+def get_data_directory() -> str:
+    """Répertoire de données partagé (parent de data/chroma) pour les fichiers annexes."""
+    return _data_directory_for(_get_persist_directory())
+
+
+def _embedding_cache_max_bytes() -> int:
+    raw = os.getenv("EMBEDDING_CACHE_MAX_MB", "").strip()
+    try:
+        max_mb = int(raw) if raw else _DEFAULT_EMBEDDING_CACHE_MAX_MB
+    except ValueError:
+        max_mb = _DEFAULT_EMBEDDING_CACHE_MAX_MB
+    return max_mb * 1024 * 1024
+
+
 def _coll_get(data: Any, key: str, default: Any = None) -> Any:
     """
     Lit un champ du résultat Chroma (dict ou objet avec attributs).
@@ -57,62 +97,478 @@ def _get_collection(store: Any) -> Any:
     return store._collection
 
 
-def _get_embedding_function():
-    """Retourne l'embedding function OpenAI ou None si indisponible."""
-    if not _HAS_CHROMA:
-        return None
-    if not os.getenv("OPENAI_API_KEY"):
-        return None
-    return OpenAIEmbeddings(model="text-embedding-3-small")
+# Store partagé par le processus : (clé de configuration, client Chroma, store langchain)
+_store_lock = threading.Lock()
+_store_key: Optional[Tuple[str, ...]] = None
+_store_client: Any = None
+_store: Any = None
+_embedding_cache: Optional[EmbeddingCache] = None
+# Embedding function du fournisseur (sans le cache), fermée avec le store
+_embedder: Any = None
+# Configuration dont la dernière ouverture a échoué (évite de réessayer à chaque appel)
+_failed_key: Optional[Tuple[str, ...]] = None
 
 
-def _get_vector_store():
-    """Retourne l'instance Chroma ou None si désactivé (pas de clé API / import)."""
+def _store_config_key() -> Optional[Tuple[str, ...]]:
+    """
+    Clé identifiant la configuration du store (fournisseur, modèle, clé API, répertoire).
+    None si le store ne peut pas être utilisé (imports absents, fournisseur inconnu ou
+    indisponible, par exemple OpenAI sans clé API).
+    """
     if not _HAS_CHROMA:
         return None
-    emb = _get_embedding_function()
-    if emb is None:
+    provider, model = embedding_providers.configured()
+    if provider is None or not provider.available():
         return None
-    persist_dir = _get_persist_directory()
+    return (provider.name, model, provider.credential(), _get_persist_directory())
+
+
+def _build_embedding_function(persist_dir: str, provider: str, model: str) -> Any:
+    """Crée l'embedding function du fournisseur, enveloppée par le cache persistant si possible."""
+    global _embedding_cache, _embedder
+    data_dir = _data_directory_for(persist_dir)
+    emb = embedding_providers.build_embeddings(provider, model, data_dir)
+    _embedder = emb
+    cache_path = os.path.join(data_dir, _EMBEDDING_CACHE_FILE)
     try:
-        return Chroma(
-            collection_name=_COLLECTION_NAME,
-            embedding_function=emb,
-            persist_directory=persist_dir,
+        os.makedirs(data_dir, exist_ok=True)
+        _embedding_cache = EmbeddingCache(cache_path, _embedding_cache_max_bytes())
+    except Exception as e:
+        _log.warning("Cache d'embeddings indisponible (%s): %s", cache_path, e)
+        _embedding_cache = None
+        return emb
+    return CachedEmbeddings(emb, _embedding_cache, model=embedding_providers.cache_model_key(provider, model))
+
+
+def _close_embedding_cache() -> None:
+    global _embedding_cache, _embedder
+    if _embedding_cache is not None:
+        _embedding_cache.close()
+        _embedding_cache = None
+    # Modèle local : libère son pool de threads
+    close = getattr(_embedder, "close", None)
+    if callable(close):
+        close()
+    _embedder = None
+
+
+def _close_client(client: Any) -> None:
+    """Ferme un client Chroma (best effort, selon la version de chromadb)."""
+    close = getattr(client, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception as e:
+            _log.debug("Fermeture du client Chroma: %s", e)
+
+
+def _open_store_locked(key: Tuple[str, ...]) -> Any:
+    """Ouvre client + store pour la configuration `key`. Appelé sous _store_lock."""
+    global _store_key, _store_client, _store, _failed_key
+    if _store_client is not None:
+        _close_client(_store_client)
+    _close_embedding_cache()
+    _store_key, _store_client, _store = None, None, None
+    provider, model, persist_dir = key[0], key[1], key[-1]
+    try:
+        client = chromadb.PersistentClient(path=persist_dir)
+        store = Chroma(
+            collection_name=embedding_providers.collection_name(provider, model),
+            embedding_function=_build_embedding_function(persist_dir, provider, model),
+            client=client,
         )
-    except Exception:
+    except Exception as e:
+        _log.warning("Ouverture du vector store impossible (%s): %s", persist_dir, e)
+        _close_embedding_cache()
+        _failed_key = key
+        return None
+    _store_key, _store_client, _store, _failed_key = key, client, store, None
+    _log.info("Vector store ouvert: %s (embeddings %s / %s)", persist_dir, provider, model)
+    return store
+
+
+def _get_vector_store():
+    """
+    Retourne l'instance Chroma partagée, ou None si désactivé (fournisseur indisponible / import)
+    ou si l'ouverture a échoué pour la configuration courante.
+    """
+    key = _store_config_key()
+    if key is None:
         return None
+    store = _store
+    if store is not None and _store_key == key:
+        return store
+    with _store_lock:
+        if _store is not None and _store_key == key:
+            return _store
+        if _failed_key == key:
+            return None
+        return _open_store_locked(key)
+
+
+def open_store() -> bool:
+    """
+    Ouvre (ou rouvre) le vector store pour la configuration courante.
+    Appelé au démarrage de l'application ; réessaie même après un échec précédent.
+    """
+    key = _store_config_key()
+    if key is None:
+        return False
+    with _store_lock:
+        if _store is not None and _store_key == key:
+            return True
+        return _open_store_locked(key) is not None
+
+
+def close_store() -> None:
+    """Ferme le client Chroma partagé (arrêt de l'application)."""
+    global _store_key, _store_client, _store, _failed_key
+    with _store_lock:
+        if _store_client is not None:
+            _close_client(_store_client)
+        _close_embedding_cache()
+        _store_key, _store_client, _store, _failed_key = None, None, None, None
 
 
 def is_available() -> bool:
-    """True si le vector store est utilisable (Chroma + OpenAI embeddings)."""
-    return _get_vector_store() is not None
+    """
+    True si le vector store est utilisable (Chroma + fournisseur d'embeddings disponible).
+    Sonde légère : n'ouvre pas le store, vérifie seulement la configuration
+    et qu'une ouverture précédente n'a pas échoué.
+    """
+    key = _store_config_key()
+    return key is not None and key != _failed_key
 
 
-def add_chunks(doc_id: str, filename: str, chunks: List[str]) -> bool:
+def add_chunks(
+    doc_id: str,
+    filename: str,
+    chunks: List[str],
+    on_progress: Optional[ProgressCallback] = None,
+) -> bool:
     """
     Ajoute les chunks au vector store avec métadonnées doc_id, filename, chunk_index.
-    Retourne True en cas de succès, False sinon.
+    Les embeddings sont calculés par lots concurrents et chaque lot est écrit dès qu'il est prêt.
+    Retourne True en cas de succès, False sinon (aucun chunk du document ne reste écrit).
     """
     store = _get_vector_store()
     if store is None or not chunks:
         return False
     try:
-        documents = [
-            Document(
-                page_content=chunk,
-                metadata={"doc_id": doc_id, "filename": filename, "chunk_index": i},
-            )
-            for i, chunk in enumerate(chunks)
-        ]
-        ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
-        store.add_documents(documents=documents, ids=ids)
+        collection = _get_collection(store)
+        _embed_and_write(
+            store,
+            collection,
+            make_chunk_ids(doc_id, chunks),
+            chunks,
+            _chunk_metadatas(doc_id, filename, chunks),
+            on_progress,
+            write_each_batch=True,
+        )
         return True
     except Exception as e:
         _log.exception("add_chunks failed for doc_id=%s: %s", doc_id, e)
         return False
 
 
+def replace_chunks(
+    doc_id: str,
+    filename: str,
+    chunks: List[str],
+    on_progress: Optional[ProgressCallback] = None,
+    chunk_metadatas: Optional[List[dict[str, Any]]] = None,
+) -> bool:
+    """
+    Remplace les chunks d'un document (ou les ajoute s'il n'existe pas).
+    Les ids dérivent du contenu (make_chunk_ids) : la nouvelle version est comparée aux
+    chunks stockés et seuls les chunks nouveaux sont embeddés et écrits ; les chunks
+    inchangés gardent leur vecteur (métadonnées mises à jour si leur position a changé) et
+    seuls les chunks disparus sont supprimés, après l'écriture des nouveaux.
+    Les recherches voient l'ancienne ou la nouvelle version, jamais un mélange : les
+    nouveaux chunks restent masqués (génération) jusqu'à la bascule, qui masque en même
+    temps les chunks disparus. Le document n'est donc jamais absent ; en cas d'échec,
+    l'ancienne version reste. on_progress(done, total) compte les chunks à embedder. Un
+    nouveau document est écrit lot par lot, au fil des embeddings, et retiré en cas d'échec.
+    chunk_metadatas : métadonnées supplémentaires par chunk (section, pages du découpage structuré).
+    """
+    store = _get_vector_store()
+    if store is None or not chunks:
+        return False
+    ids = make_chunk_ids(doc_id, chunks)
+    metadatas = _chunk_metadatas(doc_id, filename, chunks, chunk_metadatas)
+    generation, retired = _new_generation(), _new_generation()
+    _hide_generation(generation)
+    try:
+        collection = _get_collection(store)
+        data = collection.get(where={"doc_id": doc_id}, include=["metadatas"])
+        existing = dict(zip(_coll_get(data, "ids") or [], _coll_get(data, "metadatas") or []))
+        added = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+        moved = [
+            i for i, chunk_id in enumerate(ids)
+            if chunk_id in existing and _without_generation(existing[chunk_id]) != metadatas[i]
+        ]
+        stale = sorted(set(existing) - set(ids))
+        _embed_and_write(
+            store,
+            collection,
+            [ids[i] for i in added],
+            [chunks[i] for i in added],
+            [_with_generation(metadatas[i], generation) for i in added],
+            on_progress,
+            write_each_batch=not existing,
+        )
+        if moved:
+            # Chunks communs aux deux versions : leur génération (visible) est conservée
+            collection.update(
+                ids=[ids[i] for i in moved],
+                metadatas=[
+                    _with_generation(metadatas[i], (existing[ids[i]] or {}).get(_GENERATION_KEY)) for i in moved
+                ],
+            )
+        if stale:
+            collection.update(ids=stale, metadatas=[_with_generation(existing[i], retired) for i in stale])
+    except Exception as e:
+        _log.exception("replace_chunks failed for doc_id=%s: %s", doc_id, e)
+        _drop_generation(store, generation)
+        return False
+    _switch_generation(generation, retired if stale else None)
+    if stale:
+        try:
+            collection.delete(ids=stale)
+            _show_generation(retired)
+        except Exception as e:
+            # Chunks retirés restés dans la collection : masqués jusqu'au prochain redémarrage
+            _log.warning("Suppression des anciens chunks de %s échouée: %s", doc_id, e)
+    _log.info(
+        "Document %s : %d chunk(s) embeddé(s), %d conservé(s), %d supprimé(s)",
+        doc_id, len(added), len(ids) - len(added), len(stale),
+    )
+    return True
+
+
+def add_chunk_stream(
+    doc_id: str,
+    filename: str,
+    items: Iterable[Tuple[str, dict[str, Any]]],
+    on_progress: Optional[ProgressCallback] = None,
+) -> Optional[List[str]]:
+    """
+    Ajoute un nouveau document dont les chunks (texte, métadonnées) sont produits au fil du
+    découpage : chaque lot est embeddé puis écrit dès qu'il est formé, pendant que le
+    découpage continue. Sans version précédente à comparer, la liste complète n'est pas
+    attendue ; le document reste masqué des recherches jusqu'à la fin de l'écriture. Les chunks restés sous ce doc_id (ingestion interrompue) sont retirés d'abord.
+    on_progress(done, total) : total croît avec le découpage. Retourne les chunks écrits,
+    ou None en cas d'échec (aucun chunk du document ne reste écrit).
+    """
+    store = _get_vector_store()
+    if store is None:
+        return None
+    ids: List[str] = []
+    chunks: List[str] = []
+    metadatas: List[dict[str, Any]] = []
+    occurrences: Counter = Counter()
+    generation = _new_generation()
+
+    def source() -> Iterator[str]:
+        for text, extra in items:
+            ids.append(make_chunk_id(doc_id, text, occurrences[text]))
+            occurrences[text] += 1
+            metadatas.append(_with_generation(_chunk_metadata(doc_id, filename, len(chunks), extra), generation))
+            chunks.append(text)
+            yield text
+
+    _hide_generation(generation)
+    try:
+        collection = _get_collection(store)
+        collection.delete(where={"doc_id": doc_id})
+        _embed_and_write(store, collection, ids, chunks, metadatas, on_progress, write_each_batch=True, source=source())
+    except Exception as e:
+        _log.exception("add_chunk_stream failed for doc_id=%s: %s", doc_id, e)
+        _drop_generation(store, generation)
+        return None
+    _show_generation(generation)
+    return chunks or None
+
+
+def _embed_and_write(
+    store: Any,
+    collection: Any,
+    ids: List[str],
+    chunks: List[str],
+    metadatas: List[dict],
+    on_progress: Optional[ProgressCallback],
+    write_each_batch: bool,
+    source: Optional[Iterable[str]] = None,
+) -> None:
+    """
+    Embedde les chunks par lots (budget en tokens, concurrence bornée, retry) puis les
+    écrit dans la collection sous `ids` : lot par lot si `write_each_batch`, sinon en un
+    seul upsert à la fin (bascule d'un document existant). En cas d'échec d'une écriture
+    lot par lot, les chunks déjà écrits sont supprimés avant de relever l'exception : un
+    document à moitié indexé ne doit pas rester dans les résultats.
+    source : chunks produits au fil de l'eau (écriture lot par lot) ; chaque texte émis doit
+    déjà avoir été ajouté à chunks, ids et metadatas. Les lots sont formés pendant les embeddings.
+    """
+    if not chunks and source is None:
+        return
+    cfg = get_settings().get("ingestion", {})
+    batches = iter_batches(
+        chunks if source is None else source,
+        max_tokens=int(cfg.get("embed_batch_tokens", 8000)),
+        max_items=int(cfg.get("embed_batch_size", 256)),
+    )
+    done = 0
+    vectors: List[Any] = [None] * len(chunks)
+    written: List[str] = []
+
+    def write(indices: List[int], batch_vectors: List[List[float]]) -> None:
+        # Ids notés avant l'upsert : un lot découpé peut échouer après une écriture partielle
+        if write_each_batch:
+            written.extend(ids[i] for i in indices)
+        _upsert(
+            collection,
+            ids=[ids[i] for i in indices],
+            embeddings=batch_vectors,
+            documents=[chunks[i] for i in indices],
+            metadatas=[metadatas[i] for i in indices],
+        )
+
+    def on_batch(indices: List[int], batch_vectors: List[List[float]]) -> None:
+        nonlocal done
+        if write_each_batch:
+            write(indices, batch_vectors)
+        else:
+            for i, vec in zip(indices, batch_vectors):
+                vectors[i] = vec
+        done += len(indices)
+        if on_progress is not None:
+            on_progress(done, len(chunks))
+
+    try:
+        embed_batches(
+            store.embeddings.embed_documents,
+            chunks,
+            batches,
+            on_batch,
+            concurrency=int(cfg.get("embed_concurrency", 4)),
+            max_retries=int(cfg.get("embed_max_retries", 3)),
+        )
+    except Exception:
+        if written:
+            try:
+                collection.delete(ids=written)
+            except Exception as e:
+                _log.warning("Suppression des chunks partiellement écrits échouée: %s", e)
+        raise
+    if not write_each_batch:
+        write(list(range(len(chunks))), vectors)
+
+
+def _upsert(collection: Any, ids: List[str], embeddings: List[Any], documents: List[str], metadatas: List[dict]) -> None:
+    """Upsert en respectant la taille de lot maximale du client Chroma."""
+    max_batch = len(ids)
+    get_max = getattr(getattr(collection, "_client", None), "get_max_batch_size", None)
+    if callable(get_max):
+        try:
+            max_batch = max(1, int(get_max()))
+        except Exception:
+            pass
+    for start in range(0, len(ids), max_batch):
+        end = start + max_batch
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=embeddings[start:end],
+            documents=documents[start:end],
+            metadatas=metadatas[start:end],
+        )
+
+
+def _new_generation() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def _with_generation(metadata: dict[str, Any], generation: Optional[str]) -> dict[str, Any]:
+    metadata = _without_generation(metadata)
+    if generation is not None:
+        metadata[_GENERATION_KEY] = generation
+    return metadata
+
+
+def _without_generation(metadata: dict[str, Any]) -> dict[str, Any]:
+    return {k: v for k, v in (metadata or {}).items() if k != _GENERATION_KEY}
+
+
+def _hide_generation(generation: str) -> None:
+    with _generations_lock:
+        _hidden_generations.add(generation)
+
+
+def _show_generation(generation: str) -> None:
+    with _generations_lock:
+        _hidden_generations.discard(generation)
+
+
+def _switch_generation(shown: str, hidden: Optional[str]) -> None:
+    """Bascule atomique pour les recherches : `shown` devient visible et `hidden` masquée."""
+    with _generations_lock:
+        _hidden_generations.discard(shown)
+        if hidden is not None:
+            _hidden_generations.add(hidden)
+
+
+def _drop_generation(store: Any, generation: str) -> None:
+    """Écriture abandonnée : retire les chunks de la génération (masquée tant qu'il en reste)."""
+    try:
+        _get_collection(store).delete(where={_GENERATION_KEY: generation})
+    except Exception as e:
+        _log.warning("Suppression des chunks de la génération %s échouée: %s", generation, e)
+        return
+    _show_generation(generation)
+
+
+def _search_filter() -> Optional[dict[str, Any]]:
+    """Filtre Chroma excluant les générations masquées (None s'il n'y en a pas)."""
+    with _generations_lock:
+        hidden = sorted(_hidden_generations)
+    return {_GENERATION_KEY: {"$nin": hidden}} if hidden else None
+
+
+def make_chunk_id(doc_id: str, text: str, occurrence: int = 0) -> str:
+    """Id d'un chunk dérivé de son contenu : {doc_id}_{sha256[:16]}, suffixé _n pour la n-ième répétition."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    return f"{doc_id}_{digest}" if occurrence == 0 else f"{doc_id}_{digest}_{occurrence}"
+
+
+def make_chunk_ids(doc_id: str, chunks: List[str]) -> List[str]:
+    """
+    Ids des chunks d'un document, partagés avec l'index mots-clés. Dérivés du contenu :
+    un chunk inchangé garde son id d'une ingestion à l'autre, quelle que soit sa position.
+    """
+    occurrences: Counter = Counter()
+    ids = []
+    for text in chunks:
+        ids.append(make_chunk_id(doc_id, text, occurrences[text]))
+        occurrences[text] += 1
+    return ids
+
+
+def _chunk_metadatas(
+    doc_id: str, filename: str, chunks: List[str], extra: Optional[List[dict[str, Any]]] = None
+) -> List[dict[str, Any]]:
+    return [
+        _chunk_metadata(doc_id, filename, i, extra[i] if extra is not None and i < len(extra) else None)
+        for i in range(len(chunks))
+    ]
+
+
+def _chunk_metadata(doc_id: str, filename: str, index: int, extra: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+    metadata: dict[str, Any] = {"doc_id": doc_id, "filename": filename, "chunk_index": index}
+    if extra:
+        # Chroma refuse les valeurs None
+        metadata.update({k: v for k, v in extra.items() if v is not None and k not in metadata})
+    return metadata
+
+
 def similarity_search(question: str, k: int = 5) -> List[str]:
     """
     Recherche sémantique : retourne les textes des k chunks les plus pertinents.
@@ -122,28 +578,100 @@ def similarity_search(question: str, k: int = 5) -> List[str]:
     if store is None or not question.strip():
         return []
     try:
-        docs = store.similarity_search(question.strip(), k=k)
+        docs = store.similarity_search(question.strip(), k=k, filter=_search_filter())
         return [d.page_content for d in docs]
     except Exception:
         return []
 
 
+def _scored_chunk(doc: Any, score: float) -> dict[str, Any]:
+    """
+    Résultat de recherche : texte, score et identité du chunk (id, doc_id, chunk_index),
+    plus section / page_start / page_end si le document a été découpé par structure.
+    """
+    meta = doc.metadata or {}
+    doc_id = meta.get("doc_id", "")
+    chunk_index = meta.get("chunk_index")
+    chunk_id = getattr(doc, "id", None) or (make_chunk_id(doc_id, doc.page_content) if doc_id else None)
+    result = {
+        "id": chunk_id,
+        "doc_id": doc_id,
+        "chunk_index": chunk_index,
+        "text": doc.page_content,
+        "score": float(score),
+    }
+    for key in ("section", "page_start", "page_end"):
+        if key in meta:
+            result[key] = meta[key]
+    return result
+
+
 def similarity_search_with_scores(question: str, k: int = 5) -> List[dict[str, Any]]:
     """
-    Recherche sémantique avec scores. Retourne une liste de { "text", "score" }.
+    Recherche sémantique avec scores. Retourne une liste de
+    { "id", "doc_id", "chunk_index", "text", "score" }.
     Score = distance (plus bas = plus similaire). Liste vide si indisponible.
     """
     store = _get_vector_store()
     if store is None or not question.strip():
         return []
     try:
-        pairs = store.similarity_search_with_score(question.strip(), k=k)
-        return [{"text": doc.page_content, "score": float(score)} for doc, score in pairs]
+        pairs = store.similarity_search_with_score(question.strip(), k=k, filter=_search_filter())
+        return [_scored_chunk(doc, score) for doc, score in pairs]
     except Exception as e:
         _log.debug("similarity_search_with_scores failed: %s", e)
         return []
 
 
+async def _aget_store() -> Any:
+    """Store courant ; première ouverture (bloquante) hors de la boucle d'événements."""
+    if _store_config_key() is None:
+        return None
+    store = _store if _store is not None and _store_key == _store_config_key() else None
+    if store is None:
+        store = await asyncio.to_thread(_get_vector_store)
+    return store
+
+
+async def aembed_query(question: str) -> Optional[List[float]]:
+    """Embedding de la question (API async, derrière le cache) ; None si indisponible."""
+    if not question.strip():
+        return None
+    store = await _aget_store()
+    if store is None:
+        return None
+    try:
+        return await store.embeddings.aembed_query(question.strip())
+    except Exception as e:
+        _log.debug("aembed_query failed: %s", e)
+        return None
+
+
+async def asimilarity_search_with_scores(
+    question: str, k: int = 5, embedding: Optional[List[float]] = None
+) -> List[dict[str, Any]]:
+    """
+    Variante asynchrone de similarity_search_with_scores : embedding de la question
+    via l'API async (derrière le cache), requête Chroma déportée dans un thread.
+    `embedding` évite de recalculer un embedding déjà connu de l'appelant.
+    """
+    if not question.strip():
+        return []
+    store = await _aget_store()
+    if store is None:
+        return []
+    try:
+        if embedding is None:
+            embedding = await store.embeddings.aembed_query(question.strip())
+        pairs = await asyncio.to_thread(
+            store.similarity_search_by_vector_with_relevance_scores, embedding, k, _search_filter()
+        )
+        return [_scored_chunk(doc, score) for doc, score in pairs]
+    except Exception as e:
+        _log.debug("asimilarity_search_with_scores failed: %s", e)
+        return []
+
+
 def delete_by_doc_id(doc_id: str) -> bool:
     """Supprime tous les chunks dont la métadonnée doc_id correspond."""
     store = _get_vector_store()
@@ -228,64 +756,105 @@ def get_chunks_by_doc_id(doc_id: str) -> Optional[List[str]]:
         return None
 
 
-def _to_list(v: Any) -> Any:
-    """Éviter 'x or []' avec des numpy arrays (ValueError: truth value ambiguous)."""
-    return [] if v is None else v
+_ITER_PAGE_SIZE = 500
 
 
-def get_vector_map_points(snippet_max_len: int = 150) -> List[dict[str, Any]]:
+def iter_chunks(page_size: int = _ITER_PAGE_SIZE) -> Iterator[dict[str, Any]]:
     """
-    Retourne les points pour la carte 2D des vecteurs (t-SNE sur les embeddings).
-    Chaque point : id, doc_id, filename, chunk_index, text_snippet, x, y.
-    Liste vide si store indisponible ou collection vide.
+    Parcourt tous les chunks de la collection par pages (collection.get avec limit / offset),
+    sans charger les embeddings : { "id", "doc_id", "chunk_index", "text" }.
+    La mémoire reste bornée par la taille de page. Ordre de stockage Chroma ; une écriture
+    concurrente peut décaler les pages (parcours non transactionnel).
     """
     store = _get_vector_store()
-    if store is None or not _HAS_TSNE or np is None or TSNE is None:
-        return []
-    try:
-        collection = _get_collection(store)
-        data = collection.get(
-            include=["embeddings", "documents", "metadatas"],
-        )
-        ids_raw = _to_list(_coll_get(data, "ids"))
-        embeddings = _to_list(_coll_get(data, "embeddings"))
-        documents = _to_list(_coll_get(data, "documents"))
-        metadatas = _to_list(_coll_get(data, "metadatas"))
-
-        if len(embeddings) == 0:
-            _log.debug("get_vector_map_points: no embeddings")
-            return []
-
-        n = len(embeddings)
-        docs = list(documents or [])
-        docs = (docs + [""] * n)[:n]
-        metas = list(metadatas or [])
-        metas = (metas + [{}] * n)[:n]
-        base_ids = list(ids_raw) if ids_raw else []
-        ids_list = [base_ids[i] if i < len(base_ids) else f"chunk_{i}" for i in range(n)]
-
-        X = np.array(embeddings, dtype=np.float64)
-        # perplexity doit être < n_samples (défaut 30)
-        n_samples = X.shape[0]
-        perplexity = min(30, max(1, n_samples - 1))
-        tsne = TSNE(n_components=2, random_state=42, perplexity=perplexity)
-        coords = tsne.fit_transform(X)
-
-        points: List[dict[str, Any]] = []
-        for i in range(n):
-            text = docs[i] if i < len(docs) else ""
-            meta = metas[i] if i < len(metas) else {}
-            snippet = (text[:snippet_max_len] + "…") if len(text) > snippet_max_len else text
-            points.append({
-                "id": ids_list[i],
+    if store is None:
+        return
+    collection = _get_collection(store)
+    offset = 0
+    while True:
+        try:
+            data = collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+        except Exception as e:
+            _log.debug("iter_chunks failed at offset %d: %s", offset, e)
+            return
+        ids = _coll_get(data, "ids") or []
+        docs = _coll_get(data, "documents") or []
+        metadatas = _coll_get(data, "metadatas") or []
+        for i, chunk_id in enumerate(ids):
+            meta = (metadatas[i] if i < len(metadatas) else None) or {}
+            yield {
+                "id": chunk_id,
                 "doc_id": meta.get("doc_id", ""),
-                "filename": meta.get("filename", ""),
-                "chunk_index": meta.get("chunk_index", i),
-                "text_snippet": snippet,
-                "x": float(coords[i, 0]),
-                "y": float(coords[i, 1]),
-            })
-        return points
-    except Exception as e:
-        _log.exception("get_vector_map_points failed: %s", e)
+                "chunk_index": meta.get("chunk_index", 0),
+                "text": docs[i] if i < len(docs) else "",
+            }
+        if len(ids) < page_size:
+            return
+        offset += len(ids)
+
+
+def _to_list(v: Any) -> Any:
+    """Convertit un tableau numpy (ou None) en liste."""
+    if v is None:
         return []
+    return v.tolist() if hasattr(v, "tolist") else list(v)
+
+
+def iter_embedding_pages(
+    page_size: int = _ITER_PAGE_SIZE, ids: Optional[List[str]] = None
+) -> Iterator[Tuple[List[str], Any, List[dict], List[str]]]:
+    """
+    Parcourt les embeddings par pages : (ids, matrice float32 n x d, métadonnées, textes).
+    `ids` restreint le parcours à ces chunks. Nécessite numpy.
+    """
+    store = _get_vector_store()
+    if store is None or np is None:
+        return
+    collection = _get_collection(store)
+    include = ["embeddings", "documents", "metadatas"]
+    if ids is not None:
+        for start in range(0, len(ids), page_size):
+            data = collection.get(ids=ids[start : start + page_size], include=include)
+            yield _embedding_page(data)
+        return
+    offset = 0
+    while True:
+        data = collection.get(limit=page_size, offset=offset, include=include)
+        page = _embedding_page(data)
+        if page[0]:
+            yield page
+        if len(page[0]) < page_size:
+            return
+        offset += len(page[0])
+
+
+def _embedding_page(data: Any) -> Tuple[List[str], Any, List[dict], List[str]]:
+    page_ids = _to_list(_coll_get(data, "ids"))
+    n = len(page_ids)
+    embeddings = _coll_get(data, "embeddings")
+    matrix = np.asarray(embeddings if embeddings is not None and n else np.zeros((0, 0)), dtype=np.float32)
+    metadatas = [m or {} for m in _to_list(_coll_get(data, "metadatas"))]
+    documents = _to_list(_coll_get(data, "documents"))
+    return page_ids, matrix, (metadatas + [{}] * n)[:n], (documents + [""] * n)[:n]
+
+
+def query_neighbours(embeddings: Any, n_results: int) -> List[List[Tuple[str, float]]]:
+    """
+    Plus proches voisins (index HNSW de Chroma) de chaque embedding : liste de (id, distance)
+    par requête, distance croissante. Listes vides si indisponible.
+    """
+    store = _get_vector_store()
+    if store is None or len(embeddings) == 0:
+        return [[] for _ in range(len(embeddings))]
+    collection = _get_collection(store)
+    result = collection.query(
+        query_embeddings=[list(map(float, e)) for e in embeddings],
+        n_results=max(1, n_results),
+        include=["distances"],
+    )
+    all_ids = _coll_get(result, "ids") or []
+    all_distances = _coll_get(result, "distances") or []
+    return [
+        list(zip(_to_list(ids), [float(d) for d in _to_list(distances)]))
+        for ids, distances in zip(all_ids, all_distances)
+    ]
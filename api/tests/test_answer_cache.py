@@ -0,0 +1,48 @@
+"""Tests du cache sémantique des réponses (seuil, version du corpus, TTL, LRU)."""
+from unittest.mock import patch
+
+from app.services.answer_cache import AnswerCache
+
+_RESULT = {"answer": "42", "sources": [], "retrieved_chunks": [], "retrieval_method": "similarity"}
+
+
+def test_near_duplicate_question_hits():
+    """Une question assez proche (cosinus >= seuil) réutilise la réponse."""
+    cache = AnswerCache(threshold=0.95)
+    cache.store("q", [1.0, 0.0], _RESULT, ["d1_0"], corpus_version=1)
+    hit = cache.lookup([0.99, 0.05], corpus_version=1)
+    assert hit is not None and hit.result == _RESULT and hit.chunk_ids == ["d1_0"]
+    assert cache.lookup([0.0, 1.0], corpus_version=1) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_other_corpus_version_misses():
+    """Une entrée d'une autre version du corpus n'est jamais servie."""
+    cache = AnswerCache()
+    cache.store("q", [1.0, 0.0], _RESULT, [], corpus_version=1)
+    assert cache.lookup([1.0, 0.0], corpus_version=2) is None
+
+
+def test_ttl_and_lru_eviction():
+    """Les entrées expirent après le TTL ; au-delà de max_entries, la moins récente part."""
+    cache = AnswerCache(ttl_seconds=10, max_entries=2)
+    with patch("app.services.answer_cache.time.monotonic", return_value=100.0):
+        cache.store("a", [1.0, 0.0, 0.0], _RESULT, [], 1)
+        cache.store("b", [0.0, 1.0, 0.0], _RESULT, [], 1)
+        assert cache.lookup([1.0, 0.0, 0.0], 1) is not None  # "a" devient la plus récente
+        cache.store("c", [0.0, 0.0, 1.0], _RESULT, [], 1)
+        assert cache.lookup([0.0, 1.0, 0.0], 1) is None
+        assert cache.lookup([1.0, 0.0, 0.0], 1) is not None
+    with patch("app.services.answer_cache.time.monotonic", return_value=111.0):
+        assert cache.lookup([1.0, 0.0, 0.0], 1) is None
+
+
+def test_lookup_without_numpy_matches_matrix_search():
+    """Sans numpy, le parcours Python donne le même résultat que le produit matriciel."""
+    cache = AnswerCache(threshold=0.9)
+    cache.store("a", [1.0, 0.0], {**_RESULT, "answer": "a"}, [], 1)
+    cache.store("b", [0.6, 0.8], {**_RESULT, "answer": "b"}, [], 1)
+    assert cache.lookup([0.5, 0.85], 1).question == "b"
+    with patch("app.services.answer_cache.np", None):
+        assert cache.lookup([0.5, 0.85], 1).question == "b"
+        assert cache.lookup([0.0, 1.0], 2) is None
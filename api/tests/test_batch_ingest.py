@@ -0,0 +1,146 @@
+"""Tests de l'ingestion en tâche de fond (file durable, stockage en mémoire, sans Docling)."""
+import asyncio
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+from app.services import batch_ingest, conversion_service, document_store
+from app.services.upload_spool import spool_bytes
+
+
+@pytest.fixture(autouse=True)
+async def memory_backend_without_docling(monkeypatch, tmp_path):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setenv("UPLOAD_SPOOL_DIR", str(spool_dir))
+    monkeypatch.setattr(batch_ingest, "_jobs_directory", lambda: str(tmp_path / "jobs"))
+    batch_ingest.close_queue()
+    with patch.object(document_store, "_uses_vector_store", return_value=False), patch.object(
+        conversion_service, "is_docling_available", return_value=False
+    ):
+        document_store._memory_documents.clear()
+        document_store._keyword_index().clear()
+        document_store._catalog().clear()
+        yield
+        await batch_ingest.shutdown()
+        batch_ingest.close_queue()
+        batch_ingest._feeds.clear()
+
+
+async def test_batch_job_ingests_files_and_reports_per_file_events(tmp_path):
+    """Chaque fichier est ingéré ; les événements portent job_id / file_index et le job se termine."""
+    uploads = [
+        spool_bytes(b"premier paragraphe\n\nsecond paragraphe", "a.txt"),
+        spool_bytes(b"", "vide.txt"),
+        spool_bytes(b"un autre document", "b.txt"),
+    ]
+    job_id = await batch_ingest.enqueue(uploads)
+    events = [event async for event in batch_ingest.follow_job(job_id)]
+
+    assert events[0]["step"] == "batch_start" and events[0]["files"] == ["a.txt", "vide.txt", "b.txt"]
+    assert events[-1]["step"] == "batch_done"
+    assert (events[-1]["succeeded"], events[-1]["failed"]) == (2, 1)
+    assert all(e["job_id"] == job_id for e in events)
+    done = {e["filename"]: e for e in events if e["step"] == "done"}
+    assert done["a.txt"]["chunks"] >= 1 and done["a.txt"]["file_index"] == 0
+    assert any(e["step"] == "error" and e["filename"] == "vide.txt" for e in events)
+
+    snapshot = batch_ingest.get_job(job_id)
+    assert snapshot["status"] == "done" and snapshot["done"] == 2 and snapshot["error"] == 1
+    assert [f["stage"] for f in snapshot["files"]] == ["stored", "split", "stored"]
+    assert document_store.count_documents() == 2
+    # Fichiers reçus et résultats intermédiaires supprimés
+    assert list((tmp_path / "spool").iterdir()) == []
+    assert not (tmp_path / "jobs" / job_id).exists()
+
+
+async def test_interrupted_job_resumes_from_last_stage(tmp_path, monkeypatch):
+    """Un fichier « running » d'un processus précédent reprend après le découpage, sans reconvertir."""
+    job_id = "interrompu"
+    job_dir = tmp_path / "jobs" / job_id
+    job_dir.mkdir(parents=True)
+    (job_dir / "0.txt").write_text("source")
+    (job_dir / "0.chunks.json").write_text(json.dumps({"settings_hash": "h", "chunks": ["c1", "c2"]}))
+    queue = batch_ingest._get_queue()
+    queue.create_job(
+        job_id, [{"filename": "long.pdf", "path": str(job_dir / "0.txt"), "doc_id": "doc-long"}]
+    )
+    queue.claim_next()
+    queue.update_file(job_id, 0, stage="split", chunks=2)
+
+    async def no_conversion(path):
+        raise AssertionError("conversion refaite")
+
+    monkeypatch.setattr("app.services.docling_ingest._convert_to_text", no_conversion)
+    batch_ingest.start_workers()
+    events = [event async for event in batch_ingest.follow_job(job_id)]
+
+    assert events[0]["step"] == "split_done" and events[0]["resumed"] is True
+    assert events[-1]["step"] == "batch_done" and events[-1]["succeeded"] == 1
+    assert document_store.get_chunks_by_doc_id("doc-long") == ["c1", "c2"]
+    assert document_store.get_document("doc-long")["settings_hash"] == "h"
+    assert not job_dir.exists()
+
+
+async def test_file_interrupted_too_often_is_abandoned(tmp_path):
+    """Après INGEST_MAX_ATTEMPTS interruptions, le fichier passe en erreur au lieu d'être relancé."""
+    job_id = "plantage"
+    job_dir = tmp_path / "jobs" / job_id
+    job_dir.mkdir(parents=True)
+    (job_dir / "0.txt").write_text("source")
+    queue = batch_ingest._get_queue()
+    queue.create_job(job_id, [{"filename": "piege.pdf", "path": str(job_dir / "0.txt"), "doc_id": "doc-piege"}])
+    for _ in range(batch_ingest._DEFAULT_MAX_ATTEMPTS - 1):
+        queue.claim_next()
+        queue.requeue_running()
+    queue.claim_next()
+
+    batch_ingest.start_workers()
+    events = [event async for event in batch_ingest.follow_job(job_id)]
+
+    assert events[0]["step"] == "error" and "Abandonné" in events[0]["message"]
+    assert events[-1]["step"] == "batch_done" and events[-1]["failed"] == 1
+    snapshot = batch_ingest.get_job(job_id)
+    assert snapshot["status"] == "done" and snapshot["files"][0]["status"] == "error"
+    assert not job_dir.exists()
+
+
+async def test_workers_bound_concurrent_files(monkeypatch):
+    """Pas plus de INGEST_BATCH_CONCURRENCY fichiers en cours à la fois."""
+    monkeypatch.setenv("INGEST_BATCH_CONCURRENCY", "2")
+    running = peak = 0
+
+    async def slow_stream(upload, doc_id=None, store_slots=None, checkpoint=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        yield {"step": "done", "message": "ok", "doc_id": doc_id, "chunks": 1}
+
+    monkeypatch.setattr("app.services.docling_ingest.ingest_file_stream", slow_stream)
+    job_id = await batch_ingest.enqueue([spool_bytes(b"x", f"{i}.txt") for i in range(6)])
+    events = [event async for event in batch_ingest.follow_job(job_id)]
+    assert peak == 2
+    assert events[-1]["succeeded"] == 6
+
+
+async def test_identical_upload_is_short_circuited(monkeypatch):
+    """Un fichier identique (mêmes paramètres) n'est ni reconverti ni ré-embeddé."""
+    content = b"contenu stable\n\nsecond bloc"
+    first = await batch_ingest.enqueue([spool_bytes(content, "a.txt")])
+    events = [event async for event in batch_ingest.follow_job(first)]
+    (stored,) = [e for e in events if e["step"] == "done"]
+
+    async def no_conversion(path):
+        raise AssertionError("conversion refaite")
+
+    monkeypatch.setattr("app.services.docling_ingest._convert_to_text", no_conversion)
+    second = await batch_ingest.enqueue([spool_bytes(content, "copie.txt")])
+    events = [event async for event in batch_ingest.follow_job(second)]
+    (done,) = [e for e in events if e["step"] == "done"]
+    assert done["unchanged"] is True and done["doc_id"] == stored["doc_id"]
+    assert batch_ingest.get_job(second)["files"][0]["doc_id"] == stored["doc_id"]
+    assert document_store.count_documents() == 1
@@ -0,0 +1,53 @@
+"""Tests de l'assemblage du contexte (fusion des chunks voisins, budget de tokens)."""
+from app.services.context_packer import context_text, merge_neighbours, overlap_length, pack_context
+from app.services.embedding_pipeline import estimate_tokens
+
+
+def _hit(doc_id, index, text):
+    return {"id": f"{doc_id}_{index}", "doc_id": doc_id, "chunk_index": index, "text": text}
+
+
+def test_overlap_length_ignores_short_coincidences():
+    assert overlap_length("le budget de la ville augmente", "la ville augmente encore") == len("la ville augmente")
+    assert overlap_length("fin.", ". Début") == 0
+
+
+def test_zero_overlap_setting_disables_overlap_search():
+    """chunk_overlap = 0 : les chunks voisins sont juxtaposés, jamais rognés."""
+    assert overlap_length("le budget de la ville augmente", "la ville augmente encore", max_overlap=0) == 0
+    hits = [_hit("d1", 0, "Les recettes de la ville"), _hit("d1", 1, "recettes de la ville augmentent.")]
+    assert [p.text for p in merge_neighbours(hits, max_overlap=0)] == [
+        "Les recettes de la ville\n\nrecettes de la ville augmentent."
+    ]
+
+
+def test_neighbours_merged_without_overlap_in_document_order():
+    hits = [
+        _hit("d1", 1, "recettes prévues en 2024. Les dépenses baissent."),
+        _hit("d2", 0, "Autre document."),
+        _hit("d1", 0, "Le budget présente les recettes prévues en 2024."),
+        _hit("d1", 5, "Annexe lointaine."),
+    ]
+    passages = merge_neighbours(hits)
+    assert [p.text for p in passages] == [
+        "Le budget présente les recettes prévues en 2024. Les dépenses baissent.",
+        "Autre document.",
+        "Annexe lointaine.",
+    ]
+    assert passages[0].chunk_indexes == [0, 1] and passages[0].rank == 0
+
+
+def test_pack_context_fills_budget_in_score_order():
+    long_text = "mot " * 400
+    hits = [_hit("d1", 0, "Premier passage."), _hit("d2", 0, long_text), _hit("d3", 0, "Troisième passage.")]
+    budget = estimate_tokens("Premier passage.") + estimate_tokens("Troisième passage.") + 10
+    passages = pack_context(hits, max_tokens=budget)
+    # Le passage trop long est sauté, les suivants restent
+    assert context_text(passages) == "Premier passage.\n\nTroisième passage."
+    assert sum(p.tokens for p in passages) <= budget
+
+
+def test_pack_context_truncates_single_oversized_passage():
+    passages = pack_context([_hit("d1", 0, "mot " * 400)], max_tokens=20)
+    assert len(passages) == 1
+    assert 0 < passages[0].tokens <= 20
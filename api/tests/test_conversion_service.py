@@ -0,0 +1,147 @@
+"""Tests du service de conversion (limite de concurrence, métriques)."""
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.services import conversion_service
+
+
+@pytest.fixture(autouse=True)
+def thread_mode(monkeypatch):
+    """Conversions dans un thread (pas de pool de processus), état réinitialisé."""
+    monkeypatch.setenv("DOCLING_WORKERS", "0")
+    monkeypatch.setenv("DOCLING_MAX_IN_FLIGHT", "1")
+    monkeypatch.setattr(conversion_service, "_semaphore", None)
+    monkeypatch.setattr(
+        conversion_service, "_stats", {"queued": 0, "in_flight": 0, "completed": 0, "failed": 0}
+    )
+    yield
+
+
+@pytest.mark.asyncio
+async def test_convert_limits_in_flight_and_counts_queue():
+    """Au-delà de DOCLING_MAX_IN_FLIGHT, les conversions attendent en file."""
+    def slow_convert(path, cfg, page_range=None, structured=False):
+        time.sleep(0.1)
+        return f"md:{path}"
+
+    with patch.object(conversion_service, "convert_file", side_effect=slow_convert):
+        tasks = [asyncio.create_task(conversion_service.convert(f"f{i}", {})) for i in range(3)]
+        await asyncio.sleep(0.05)
+        stats = conversion_service.stats()
+        assert stats["in_flight"] == 1
+        assert stats["queued"] == 2
+        results = await asyncio.gather(*tasks)
+    assert results == ["md:f0", "md:f1", "md:f2"]
+    assert conversion_service.stats()["completed"] == 3
+    assert conversion_service.stats()["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_convert_failure_is_counted_and_raised():
+    """Une conversion en erreur est comptée et l'exception propagée."""
+    with patch.object(conversion_service, "convert_file", side_effect=ValueError("bad pdf")):
+        with pytest.raises(ValueError):
+            await conversion_service.convert("f", {})
+    stats = conversion_service.stats()
+    assert stats["failed"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_converter_cached_by_pipeline_options(monkeypatch):
+    """Le converter est réutilisé tant que les options de pipeline ne changent pas."""
+    monkeypatch.setattr(conversion_service, "_converter", None)
+    monkeypatch.setattr(conversion_service, "_converter_hash", None)
+    with patch.object(conversion_service, "_build_document_converter", side_effect=lambda cfg: object()) as build:
+        first = conversion_service._get_converter({"table_former_mode": "FAST"})
+        # max_num_pages n'est qu'un paramètre d'appel : pas de reconstruction
+        assert conversion_service._get_converter({"table_former_mode": "FAST", "max_num_pages": 3}) is first
+        second = conversion_service._get_converter({"table_former_mode": "ACCURATE"})
+    assert second is not first
+    assert build.call_count == 2
+
+
+def test_update_settings_invalidates_converter_on_docling_change(tmp_path):
+    """Seule une modification des options Docling invalide le converter."""
+    from app.services import settings_service
+
+    with patch.object(settings_service, "_SETTINGS_DIR", tmp_path), \
+         patch.object(settings_service, "_SETTINGS_FILE", tmp_path / "settings.json"):
+        settings_service.get_settings()
+        with patch.object(conversion_service, "invalidate_converters") as invalidate:
+            settings_service.update_settings({"retriever": {"k": 3}})
+            invalidate.assert_not_called()
+            settings_service.update_settings({"docling": {"table_former_mode": "FAST"}})
+            invalidate.assert_called_once()
+
+
+def test_plan_page_ranges_covers_document_and_respects_max_pages():
+    assert conversion_service.plan_page_ranges(70, 32) == [(1, 32), (33, 64), (65, 70)]
+    assert conversion_service.plan_page_ranges(70, 32, max_num_pages=40) == [(1, 32), (33, 40)]
+
+
+def test_stitch_markdown_rejoins_tables_and_sentences():
+    """Tableau et phrase coupés à la jonction sont rejoints ; un titre reste en début de ligne."""
+    parts = [
+        "# Rapport\n\n| a | b |\n|---|---|\n| 1 | 2 |",
+        "| 3 | 4 |\n|---|---|\n| 5 | 6 |\n\nLa phrase commence ici et",
+        "continue sur la page suivante.",
+        "## Annexe\n\nTexte.",
+    ]
+    assert conversion_service.stitch_markdown(parts) == (
+        "# Rapport\n\n| a | b |\n|---|---|\n| 1 | 2 |\n| 3 | 4 |\n| 5 | 6 |\n\n"
+        "La phrase commence ici et continue sur la page suivante.\n\n## Annexe\n\nTexte."
+    )
+    # Largeurs différentes : deux tableaux distincts
+    assert conversion_service.stitch_markdown(["| a |\n|---|", "| x | y |\n|---|---|"]) == (
+        "| a |\n|---|\n\n| x | y |\n|---|---|"
+    )
+
+
+@pytest.mark.asyncio
+async def test_large_pdf_converted_by_page_ranges_in_parallel(monkeypatch):
+    """Un gros PDF est converti par plages en parallèle, recousu dans l'ordre, avec progression."""
+    monkeypatch.setenv("DOCLING_MAX_IN_FLIGHT", "4")
+    monkeypatch.setattr(conversion_service, "_page_ranges_supported", lambda: True)
+    monkeypatch.setattr(conversion_service, "pdf_page_count", lambda path: 100)
+    cfg = {"parallel_min_pages": 64, "page_range_size": 40}
+
+    def convert_range(path, docling_cfg, page_range=None, structured=False):
+        # Les plages finissent dans le désordre
+        time.sleep(0.02 * (4 - page_range[0] // 40))
+        return f"Pages {page_range[0]}-{page_range[1]}."
+
+    progress = []
+    with patch.object(conversion_service, "convert_file", side_effect=convert_range) as convert_file:
+        text = await conversion_service.convert("big.pdf", cfg, on_pages=lambda d, t: progress.append((d, t)))
+    assert text == "Pages 1-40.\n\nPages 41-80.\n\nPages 81-100."
+    assert convert_file.call_count == 3
+    assert progress[-1] == (100, 100) and len(progress) == 3
+    assert conversion_service.stats()["completed"] == 3
+
+
+def test_export_structured_marks_pages_and_headings():
+    """Export élément par élément : titres hiérarchisés, listes, tableaux et marqueurs de page."""
+    from types import SimpleNamespace
+
+    def item(label, page, **fields):
+        return SimpleNamespace(label=label, prov=[SimpleNamespace(page_no=page)], **fields)
+
+    class FakeTable(SimpleNamespace):
+        def export_to_markdown(self, doc=None):
+            return "| a | b |\n|---|---|\n| 1 | 2 |"
+
+    items = [
+        item("section_header", 1, text="Budget", level=1),
+        item("text", 1, text="Introduction."),
+        item("list_item", 2, text="premier point"),
+        FakeTable(label="table", prov=[SimpleNamespace(page_no=2)]),
+        item("page_footer", 2, text="Page 2"),
+    ]
+    doc = SimpleNamespace(iterate_items=lambda: [(i, 1) for i in items])
+    assert conversion_service.export_structured(doc) == (
+        "<!-- page 1 -->\n\n## Budget\n\nIntroduction.\n\n<!-- page 2 -->\n\n- premier point\n\n"
+        "| a | b |\n|---|---|\n| 1 | 2 |"
+    )
@@ -0,0 +1,54 @@
+"""Tests du catalogue de documents (SQLite)."""
+import pytest
+
+from app.services.document_catalog import DocumentCatalog
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    c = DocumentCatalog(str(tmp_path / "documents.sqlite3"))
+    yield c
+    c.close()
+
+
+def test_upsert_replace_and_delete(catalog):
+    """Un remplacement met à jour la fiche ; chaque modification incrémente la version."""
+    catalog.upsert("d1", "v1.pdf", 3, settings_hash="s", content_hash="c1", ingested_at=1.0)
+    catalog.upsert("d1", "v2.pdf", 5, settings_hash="s", content_hash="c2", ingested_at=2.0)
+    entry = catalog.get("d1")
+    assert entry["filename"] == "v2.pdf" and entry["chunk_count"] == 5 and entry["content_hash"] == "c2"
+    assert (catalog.count(), catalog.chunk_total(), catalog.version()) == (1, 5, 2)
+    assert catalog.delete("d1") is True
+    assert catalog.delete("d1") is False
+    assert (catalog.count(), catalog.chunk_total(), catalog.version()) == (0, 0, 3)
+
+
+def test_list_sort_and_pagination(catalog):
+    for i, name in enumerate(["c.pdf", "A.pdf", "b.pdf"]):
+        catalog.upsert(f"d{i}", name, i + 1, ingested_at=float(i))
+    assert [e["id"] for e in catalog.list()] == ["d0", "d1", "d2"]
+    assert [e["filename"] for e in catalog.list(sort="filename")] == ["A.pdf", "b.pdf", "c.pdf"]
+    assert [e["id"] for e in catalog.list(offset=1, limit=1, descending=True)] == ["d1"]
+    with pytest.raises(ValueError):
+        catalog.list(sort="text")
+
+
+def test_state_persists_across_reopen(tmp_path):
+    """Fiches et version du corpus survivent à un redémarrage."""
+    path = str(tmp_path / "documents.sqlite3")
+    first = DocumentCatalog(path)
+    first.upsert("d1", "f.pdf", 2)
+    first.close()
+    second = DocumentCatalog(path)
+    assert second.get("d1")["chunk_count"] == 2
+    assert second.version() == 1 and second.chunk_total() == 2
+    second.close()
+
+
+def test_find_by_content_matches_hash_and_settings():
+    catalog = DocumentCatalog(":memory:")
+    catalog.upsert("d1", "a.pdf", 2, settings_hash="s1", content_hash="c1", ingested_at=1.0)
+    catalog.upsert("d2", "b.pdf", 2, settings_hash="s1", content_hash="c1", ingested_at=2.0)
+    assert catalog.find_by_content("c1", "s1")["id"] == "d2"
+    assert catalog.find_by_content("c1", "s2") is None
+    assert catalog.find_by_content("c2", "s1") is None
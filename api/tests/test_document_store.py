@@ -3,15 +3,17 @@ from unittest.mock import patch, MagicMock
 
 import pytest
 
-from app.services import document_store
+from app.services import document_store, vector_store
 
 
 @pytest.fixture(autouse=True)
 def force_memory_backend():
     """Force l'utilisation du stockage en mémoire (pas de Chroma)."""
     with patch.object(document_store, "_uses_vector_store", return_value=False):
-        # Réinitialiser la liste en mémoire entre tests
+        # Réinitialiser la liste en mémoire et son index mots-clés entre tests
         document_store._memory_documents.clear()
+        document_store._keyword_index().clear()
+        document_store._catalog().clear()
         yield
 
 
@@ -68,3 +70,51 @@ def test_add_document_empty_chunks_returns_false():
     """add_document avec chunks vide retourne False."""
     assert document_store.add_document("d1", "f", []) is False
     assert document_store.list_documents() == []
+
+
+def test_keyword_search_follows_add_and_delete():
+    """L'index mots-clés suit les ajouts, remplacements et suppressions."""
+    document_store.add_document("d1", "f1", ["Le contrat de location", "Annexe technique"])
+    document_store.add_document("d2", "f2", ["Facture du mois"])
+    hits = document_store.keyword_search("contrat", k=5)
+    assert [h["id"] for h in hits] == [vector_store.make_chunk_id("d1", "Le contrat de location")]
+    assert hits[0]["score"] > 0
+    document_store.add_document("d1", "f1", ["Nouvelle version sans le mot"])
+    assert document_store.keyword_search("contrat") == []
+    document_store.delete_document("d2")
+    assert document_store.keyword_search("facture") == []
+
+
+def test_add_and_delete_invalidate_answer_cache():
+    """Ajout et suppression changent la version du corpus et vident le cache de réponses."""
+    version = document_store.corpus_version()
+    with patch.object(document_store.answer_cache, "invalidate") as invalidate:
+        document_store.add_document("d1", "f.txt", ["a"])
+        document_store.delete_document("d1")
+    assert document_store.corpus_version() == version + 2
+    assert invalidate.call_count == 2
+
+
+def test_list_documents_paginated_and_sorted():
+    """list_documents lit le catalogue : pagination, tri et total sans parcourir les chunks."""
+    document_store.add_document("a", "b.pdf", ["x"])
+    document_store.add_document("b", "a.pdf", ["x", "y", "z"])
+    document_store.add_document("c", "c.pdf", ["x", "y"])
+    page = document_store.list_documents(offset=1, limit=1, sort="filename")
+    assert [d["id"] for d in page] == ["a"]
+    by_size = document_store.list_documents(sort="chunk_count", descending=True)
+    assert [d["chunk_count"] for d in by_size] == [3, 2, 1]
+    assert document_store.count_documents() == 3
+    assert document_store.document_exists("b") and not document_store.document_exists("z")
+
+
+def test_iter_chunks_and_corpus_stats():
+    """iter_chunks parcourt les chunks avec leurs ids ; corpus_stats compte sans les lire."""
+    document_store.add_document("d1", "a.txt", ["c1", "c2"])
+    document_store.add_document("d2", "b.txt", ["c3"])
+    chunks = list(document_store.iter_chunks())
+    assert [(c["doc_id"], c["chunk_index"], c["text"]) for c in chunks] == [
+        ("d1", 0, "c1"), ("d1", 1, "c2"), ("d2", 0, "c3"),
+    ]
+    assert chunks[0]["id"] == vector_store.make_chunk_id("d1", "c1")
+    assert document_store.corpus_stats() == {"documents": 2, "chunks": 3}
@@ -0,0 +1,89 @@
+"""Tests du cache d'embeddings adressé par contenu."""
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.services.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=10 * 1024 * 1024)
+    yield c
+    c.close()
+
+
+def _fake_provider():
+    inner = MagicMock()
+    inner.embed_documents.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+    inner.embed_query.side_effect = lambda text: [float(len(text)), 1.0]
+    return inner
+
+
+def test_repeated_texts_are_not_reembedded(cache):
+    """Un texte déjà vu est servi par le cache, sans appel au fournisseur."""
+    inner = _fake_provider()
+    emb = CachedEmbeddings(inner, cache, model="m")
+    first = emb.embed_documents(["abc", "de"])
+    second = emb.embed_documents(["de", "abc", "fghi"])
+    assert second[:2] == [first[1], first[0]]
+    assert inner.embed_documents.call_count == 2
+    assert inner.embed_documents.call_args_list[1].args[0] == ["fghi"]
+
+
+def test_query_and_document_vectors_kept_apart(cache):
+    """Même texte : le vecteur de question (préfixé par e5 / bge) n'est jamais servi comme document, ni l'inverse."""
+    inner = _fake_provider()
+    inner.embed_query.side_effect = lambda text: [-float(len(text)), 1.0]
+    emb = CachedEmbeddings(inner, cache, model="m")
+    doc = emb.embed_documents(["question"])[0]
+    query = emb.embed_query("question")
+    assert query != doc
+    assert emb.embed_query("question") == query and emb.embed_documents(["question"]) == [doc]
+    assert inner.embed_query.call_count == 1 and inner.embed_documents.call_count == 1
+
+
+async def test_async_query_uses_cache_off_the_event_loop(cache):
+    """aembed_query lit et écrit le cache SQLite dans un thread, comme aembed_documents."""
+    import threading
+
+    inner = _fake_provider()
+    inner.aembed_query = AsyncMock(side_effect=lambda text: [float(len(text)), 1.0])
+    emb = CachedEmbeddings(inner, cache, model="m")
+    loop_thread = threading.get_ident()
+    lookup_threads = []
+    lookup = emb._lookup
+    emb._lookup = lambda texts, model: lookup_threads.append(threading.get_ident()) or lookup(texts, model)
+    first = await emb.aembed_query("question")
+    assert await emb.aembed_query("question") == first
+    inner.aembed_query.assert_awaited_once()
+    assert lookup_threads and loop_thread not in lookup_threads
+
+
+def test_cache_is_keyed_by_model(cache):
+    """Le même texte avec un autre modèle est un défaut de cache."""
+    cache.put_many("m1", ["t"], [[1.0, 2.0]])
+    assert cache.get_many("m1", ["t"]) == [[1.0, 2.0]]
+    assert cache.get_many("m2", ["t"]) == [None]
+
+
+def test_cache_persists_on_disk(tmp_path):
+    """Les entrées survivent à la réouverture du fichier."""
+    path = str(tmp_path / "c.sqlite3")
+    c1 = EmbeddingCache(path, max_bytes=1024 * 1024)
+    c1.put_many("m", ["a"], [[0.5]])
+    c1.close()
+    c2 = EmbeddingCache(path, max_bytes=1024 * 1024)
+    assert c2.get_many("m", ["a"]) == [[0.5]]
+    c2.close()
+
+
+def test_eviction_respects_max_size(tmp_path):
+    """Au-delà de la taille maximale, les entrées les plus anciennes sont évincées."""
+    c = EmbeddingCache(str(tmp_path / "c.sqlite3"), max_bytes=4 * 100 * 10)
+    for i in range(30):
+        c.put_many("m", [f"t{i}"], [[float(i)] * 100])
+    assert c.size_bytes() <= 4 * 100 * 10
+    assert c.get_many("m", ["t29"]) == [[29.0] * 100]
+    assert c.get_many("m", ["t0"]) == [None]
+    c.close()
@@ -0,0 +1,118 @@
+"""Tests du pipeline d'embedding par lots (découpage, concurrence, retry)."""
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.services import embedding_pipeline
+from app.services.embedding_pipeline import embed_batches, iter_batches, make_batches
+
+# Version réelle, la fixture ci-dessous remplace _get_encoding dans le module
+_get_encoding = embedding_pipeline._get_encoding
+
+
+@pytest.fixture(autouse=True)
+def approximate_tokens():
+    """Estimation déterministe (~4 caractères par token), sans tiktoken."""
+    with patch.object(embedding_pipeline, "_get_encoding", return_value=None):
+        yield
+
+
+def test_make_batches_respects_token_and_item_limits():
+    """Les lots respectent le budget en tokens et le nombre maximal de textes."""
+    texts = ["x" * 40] * 10  # 10 tokens chacun
+    assert make_batches(texts, max_tokens=30, max_items=100) == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+    assert make_batches(texts, max_tokens=1000, max_items=4) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_make_batches_oversized_text_alone():
+    """Un texte plus long que le budget forme un lot à lui seul."""
+    assert make_batches(["a" * 400, "b"], max_tokens=10, max_items=10) == [[0], [1]]
+
+
+def test_embed_batches_runs_concurrently_and_reports_all():
+    """Les lots s'exécutent en parallèle et chaque lot est remis une fois."""
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def embed(texts):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+        return [[float(len(t))] for t in texts]
+
+    texts = [f"t{i}" for i in range(8)]
+    received = {}
+    embed_batches(embed, texts, [[i] for i in range(8)], lambda idx, vecs: received.update(zip(idx, vecs)), concurrency=4)
+    assert peak == 4
+    assert received == {i: [2.0] for i in range(8)}
+
+
+def test_embed_batches_starts_before_texts_are_all_produced():
+    """Lots formés au fil d'un générateur : le premier lot est embeddé avant la fin du découpage."""
+    texts: list[str] = []
+    log: list[str] = []
+
+    def produce():
+        for i in range(6):
+            log.append(f"split {i}")
+            texts.append(f"t{i}")
+            yield texts[-1]
+
+    def embed(batch):
+        log.append(f"embed {batch[0]}")
+        return [[1.0] for _ in batch]
+
+    received = []
+    embed_batches(embed, texts, iter_batches(produce(), max_tokens=1000, max_items=2),
+                  lambda idx, vecs: received.extend(idx), concurrency=1)
+    assert sorted(received) == list(range(6))
+    assert log.index("embed t0") < log.index("split 5")
+
+
+def test_embed_batches_retries_then_fails():
+    """Une erreur transitoire est réessayée ; au-delà de max_retries elle est levée."""
+    calls = {"n": 0}
+
+    def flaky(texts):
+        calls["n"] += 1
+        if calls["n"] < 2:
+            raise RuntimeError("429")
+        return [[1.0] for _ in texts]
+
+    with patch.object(embedding_pipeline.time, "sleep"):
+        out = []
+        embed_batches(flaky, ["a"], [[0]], lambda idx, vecs: out.append(vecs), max_retries=2)
+        assert out == [[[1.0]]]
+
+        def always_fail(texts):
+            raise RuntimeError("down")
+
+        with pytest.raises(RuntimeError):
+            embed_batches(always_fail, ["a"], [[0]], lambda idx, vecs: None, max_retries=1)
+
+
+def test_unavailable_encoding_retried_after_delay(monkeypatch):
+    """Un encodage introuvable (hors ligne) n'est pas redemandé à chaque appel, mais retenté plus tard."""
+    calls = []
+
+    class OfflineTiktoken:
+        @staticmethod
+        def get_encoding(name):
+            calls.append(name)
+            raise OSError("réseau indisponible")
+
+    monkeypatch.setattr(embedding_pipeline, "tiktoken", OfflineTiktoken)
+    monkeypatch.setattr(embedding_pipeline, "_encodings", {})
+    monkeypatch.setattr(embedding_pipeline, "_encoding_failures", {})
+    assert _get_encoding() is None and _get_encoding() is None
+    assert len(calls) == 1
+    embedding_pipeline._encoding_failures[None] -= embedding_pipeline._ENCODING_RETRY_SECONDS
+    assert _get_encoding() is None
+    assert len(calls) == 2
@@ -0,0 +1,93 @@
+"""Tests du registre de fournisseurs d'embeddings (OpenAI, modèle local hors ligne)."""
+import pytest
+
+from app.services import embedding_providers, vector_store
+
+
+class _FakeTextEmbedding:
+    """Remplace fastembed.TextEmbedding : vecteurs déterministes, lots enregistrés."""
+
+    instances: list = []
+
+    def __init__(self, model_name, cache_dir=None, threads=None):
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.batches: list = []
+        _FakeTextEmbedding.instances.append(self)
+
+    def embed(self, texts, batch_size=256):
+        np = pytest.importorskip("numpy")
+        texts = list(texts)
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start : start + batch_size]
+            self.batches.append(len(batch))
+            for text in batch:
+                yield np.array([float(len(text)), 1.0, 0.5])
+
+    def query_embed(self, query):
+        return self.embed([query])
+
+
+@pytest.fixture
+def local_provider(monkeypatch, tmp_path):
+    """Fournisseur fastembed (simulé), sans clé OpenAI ni réseau."""
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setattr(embedding_providers, "TextEmbedding", _FakeTextEmbedding)
+    monkeypatch.setattr(
+        embedding_providers, "_embeddings_settings", lambda: {"provider": "fastembed", "batch_size": 2}
+    )
+    _FakeTextEmbedding.instances.clear()
+    vector_store.close_store()
+    yield
+    vector_store.close_store()
+
+
+def test_collection_per_provider_and_model():
+    assert embedding_providers.collection_name("openai", "text-embedding-3-small") == "rag_chunks"
+    local = embedding_providers.collection_name("fastembed", "BAAI/bge-small-en-v1.5")
+    assert local == "rag_chunks_fastembed_baai_bge_small_en_v1_5"
+    assert embedding_providers.collection_name("openai", "text-embedding-3-large") != "rag_chunks"
+    assert len(embedding_providers.collection_name("fastembed", "x" * 200)) <= 63
+
+
+def test_unknown_provider_disables_store(monkeypatch):
+    monkeypatch.setattr(embedding_providers, "_embeddings_settings", lambda: {"provider": "absent"})
+    assert vector_store.is_available() is False
+
+
+@pytest.mark.asyncio
+async def test_local_provider_works_offline(local_provider):
+    """Sans clé API : ingestion par lots et recherche sémantique avec le modèle local."""
+    pytest.importorskip("chromadb")
+    assert vector_store.is_available()
+    assert vector_store.replace_chunks("d1", "a.txt", ["un", "deux mots", "trois mots ici"])
+    model = _FakeTextEmbedding.instances[0]
+    assert model.model_name == embedding_providers._FASTEMBED_MODEL
+    assert model.batches and max(model.batches) <= 2
+    hits = await vector_store.asimilarity_search_with_scores("deux mots", k=1)
+    assert hits[0]["text"] == "deux mots"
+
+
+def test_registered_provider_is_accepted_by_settings():
+    """Un fournisseur enregistré est une valeur valide de embeddings.provider (plus de liste figée)."""
+    from app.schemas.settings import EmbeddingsSettings
+
+    embedding_providers.register_provider(
+        embedding_providers.EmbeddingProvider(
+            name="maison", default_model="m", build=lambda *args: None, available=lambda: True
+        )
+    )
+    try:
+        assert "maison" in embedding_providers.provider_names()
+        assert EmbeddingsSettings(provider="maison").provider == "maison"
+    finally:
+        embedding_providers._PROVIDERS.pop("maison")
+
+
+def test_provider_without_dependency_is_unavailable(monkeypatch):
+    """Sans le paquet fastembed, le fournisseur est connu mais indisponible (refusé par PUT /settings)."""
+    monkeypatch.setattr(embedding_providers, "TextEmbedding", None)
+    assert "fastembed" in embedding_providers.provider_names()
+    assert embedding_providers.is_available("fastembed") is False
+    assert embedding_providers.is_available("inconnu") is False
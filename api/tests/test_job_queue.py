@@ -0,0 +1,65 @@
+"""Tests de la file durable des jobs d'ingestion."""
+from app.services.job_queue import JobQueue
+
+
+def _files(n: int):
+    return [{"filename": f"{i}.pdf", "path": f"/jobs/{i}.pdf", "doc_id": f"d{i}"} for i in range(n)]
+
+
+def test_claim_in_order_and_finish():
+    queue = JobQueue(":memory:")
+    queue.create_job("j1", _files(2))
+    first, second = queue.claim_next(), queue.claim_next()
+    assert (first["index"], second["index"]) == (0, 1)
+    assert queue.claim_next() is None
+    queue.update_file("j1", 0, status="done", stage="stored", chunks=3)
+    assert queue.finish_job_if_complete("j1") is False
+    queue.update_file("j1", 1, status="error", message="boom")
+    assert queue.finish_job_if_complete("j1") is True
+    job = queue.get_job("j1")
+    assert (job["status"], job["done"], job["error"]) == ("done", 1, 1)
+    assert job["files"][0]["chunks"] == 3 and job["files"][1]["message"] == "boom"
+
+
+def test_requeue_running_after_restart(tmp_path):
+    """L'état survit à la réouverture ; les fichiers « running » sont remis en file avec leur étape."""
+    path = str(tmp_path / "jobs.sqlite3")
+    queue = JobQueue(path)
+    queue.create_job("j1", _files(1))
+    queue.claim_next()
+    queue.update_file("j1", 0, stage="split", embedded=128)
+    queue.close()
+
+    reopened = JobQueue(path)
+    assert reopened.claim_next() is None
+    assert reopened.requeue_running() == 1
+    resumed = reopened.claim_next()
+    assert (resumed["stage"], resumed["embedded"], resumed["attempts"]) == ("split", 128, 2)
+    reopened.close()
+
+
+def test_abandon_running_after_max_attempts():
+    """Un fichier interrompu à chaque tentative passe en erreur ; les autres sont remis en file."""
+    queue = JobQueue(":memory:")
+    queue.create_job("j1", _files(2))
+    queue.claim_next()
+    queue.requeue_running()
+    queue.claim_next()
+    queue.claim_next()
+    abandoned = queue.abandon_running(max_attempts=2)
+    assert [(f["index"], f["status"], f["attempts"]) for f in abandoned] == [(0, "error", 2)]
+    assert queue.requeue_running() == 1
+    job = queue.get_job("j1")
+    assert [f["status"] for f in job["files"]] == ["error", "queued"]
+    assert "2 tentative" in job["files"][0]["message"]
+
+
+def test_forget_finished_keeps_most_recent():
+    queue = JobQueue(":memory:")
+    for job_id in ("a", "b", "c"):
+        queue.create_job(job_id, _files(1))
+        queue.claim_next()
+        queue.update_file(job_id, 0, status="done")
+        queue.finish_job_if_complete(job_id)
+    assert sorted(queue.forget_finished(keep=1)) == ["a", "b"]
+    assert queue.get_job("a") is None and queue.get_job("c") is not None
@@ -0,0 +1,50 @@
+"""Tests de l'index inversé BM25."""
+import pytest
+
+from app.services.keyword_index import KeywordIndex, tokenize
+
+
+@pytest.fixture
+def index():
+    idx = KeywordIndex(":memory:")
+    yield idx
+    idx.close()
+
+
+def test_tokenize_french_english():
+    """Accents, mots vides et pluriels sont normalisés."""
+    assert tokenize("Les Électeurs votent à l'école") == ["electeur", "votent", "ecole"]
+    assert tokenize("The contracts of the company") == ["contract", "company"]
+
+
+def test_search_ranks_by_bm25(index):
+    """Le chunk le plus pertinent (terme rare, fréquent dans le chunk) arrive en tête."""
+    index.add_document("d1", ["d1_0", "d1_1"], ["budget annuel", "budget budget prévisionnel"])
+    index.add_document("d2", ["d2_0"], ["rapport de sécurité"])
+    hits = index.search("budget prévisionnel", k=5)
+    assert [h["id"] for h in hits] == ["d1_1", "d1_0"]
+    assert hits[0]["score"] > hits[1]["score"]
+    assert hits[0]["doc_id"] == "d1"
+    assert hits[0]["chunk_index"] == 1
+
+
+def test_replace_and_delete_keep_stats_consistent(index):
+    """Remplacer puis supprimer un document met à jour postings et statistiques."""
+    index.add_document("d1", ["d1_0"], ["alpha beta"])
+    index.add_document("d1", ["d1_0", "d1_1"], ["gamma", "delta"])
+    assert index.chunk_count() == 2
+    assert index.search("alpha") == []
+    assert index.delete_document("d1") is True
+    assert index.chunk_count() == 0
+    assert index.delete_document("d1") is False
+
+
+def test_index_persists(tmp_path):
+    """L'index sur disque survit à la réouverture."""
+    path = str(tmp_path / "kw.sqlite3")
+    idx = KeywordIndex(path)
+    idx.add_document("d1", ["d1_0"], ["persistance des données"])
+    idx.close()
+    idx = KeywordIndex(path)
+    assert [h["id"] for h in idx.search("données")] == ["d1_0"]
+    idx.close()
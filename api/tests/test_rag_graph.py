@@ -1,5 +1,5 @@
 """Tests du pipeline RAG (retrieve + generate) avec mocks."""
-from unittest.mock import patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
@@ -11,7 +11,7 @@ async def test_query_rag_returns_keys():
     """query_rag retourne answer, sources, retrieved_chunks, retrieval_method."""
     with patch.object(rag_graph, "vector_store") as vs:
         vs.is_available.return_value = False
-    with patch.object(rag_graph, "get_all_chunks", return_value=[]):
+    with patch.object(rag_graph, "corpus_stats", return_value={"documents": 0, "chunks": 0}):
         with patch.object(rag_graph, "_get_llm", return_value=None):
             result = await rag_graph.query_rag("Une question ?")
     assert "answer" in result
@@ -26,20 +26,100 @@ async def test_query_rag_no_documents_message():
     """Sans document ingéré, la réponse indique d'uploader un document."""
     with patch.object(rag_graph, "vector_store") as vs:
         vs.is_available.return_value = False
-    with patch.object(rag_graph, "get_all_chunks", return_value=[]):
+    with patch.object(rag_graph, "corpus_stats", return_value={"documents": 0, "chunks": 0}):
         with patch.object(rag_graph, "_get_llm", return_value=None):
             result = await rag_graph.query_rag("Question")
     assert "Aucun document ingéré" in result["answer"] or "Uploadez" in result["answer"]
 
 
 @pytest.mark.asyncio
-async def test_query_rag_keyword_fallback_uses_chunks():
-    """Sans vector store, le retrieval mot-clé utilise get_all_chunks."""
-    with patch.object(rag_graph, "vector_store") as vs:
-        vs.is_available.return_value = False
-    with patch.object(rag_graph, "get_all_chunks", return_value=["contenu pertinent"]) as gac:
-        with patch.object(rag_graph, "_get_llm", return_value=None):
-            result = await rag_graph.query_rag("pertinent")
-    gac.assert_called()
+async def test_query_rag_keyword_fallback_uses_index():
+    """Sans vector store, le retrieval mot-clé interroge l'index BM25 et renvoie ses scores."""
+    hits = [{"id": "d1_0", "doc_id": "d1", "chunk_index": 0, "text": "contenu pertinent", "score": 1.5}]
+    with patch.object(rag_graph, "corpus_stats", return_value={"documents": 1, "chunks": 1}):
+        with patch.object(rag_graph, "keyword_search", return_value=hits) as ks:
+            with patch.object(rag_graph, "_get_llm", return_value=None):
+                result = await rag_graph.query_rag("pertinent")
+    ks.assert_called_once()
     assert result["retrieval_method"] == "keyword"
-    assert len(result["retrieved_chunks"]) >= 0
+    assert result["retrieved_chunks"][0]["score"] == 1.5
+
+
+@pytest.mark.asyncio
+async def test_hybrid_mode_fuses_vector_and_keyword_results():
+    """En mode hybride, les deux sources sont fusionnées (RRF) avec leurs scores respectifs."""
+    vector_hits = [
+        {"id": "d1_0", "doc_id": "d1", "chunk_index": 0, "text": "A", "score": 0.2},
+        {"id": "d1_1", "doc_id": "d1", "chunk_index": 1, "text": "B", "score": 0.4},
+    ]
+    keyword_hits = [
+        {"id": "d1_1", "doc_id": "d1", "chunk_index": 1, "text": "B", "score": 3.0},
+        {"id": "d2_0", "doc_id": "d2", "chunk_index": 0, "text": "C", "score": 1.0},
+    ]
+    settings = {"retriever": {"k": 3, "mode": "hybrid"}, "chat": {}}
+    with patch.object(rag_graph, "get_settings", return_value=settings), \
+         patch.object(rag_graph.vector_store, "is_available", return_value=True), \
+         patch.object(rag_graph.vector_store, "asimilarity_search_with_scores", AsyncMock(return_value=vector_hits)), \
+         patch.object(rag_graph, "keyword_search", return_value=keyword_hits), \
+         patch.object(rag_graph, "corpus_stats", return_value={"documents": 0, "chunks": 0}), \
+         patch.object(rag_graph, "_get_llm", return_value=None):
+        result = await rag_graph.query_rag("question")
+    chunks = result["retrieved_chunks"]
+    assert result["retrieval_method"] == "hybrid"
+    assert [c["id"] for c in chunks] == ["d1_1", "d1_0", "d2_0"]
+    assert chunks[0]["vector_score"] == 0.4
+    assert chunks[0]["keyword_score"] == 3.0
+    assert chunks[2]["vector_score"] is None
+
+
+@pytest.mark.asyncio
+async def test_generate_uses_async_llm():
+    """La génération passe par llm.ainvoke (pas d'appel bloquant dans la boucle)."""
+    llm = MagicMock()
+    llm.ainvoke = AsyncMock(return_value=MagicMock(content="Réponse"))
+    with patch.object(rag_graph, "keyword_search", return_value=[]), \
+         patch.object(rag_graph, "_get_llm", return_value=llm):
+        result = await rag_graph.query_rag("Question ?")
+    assert result["answer"] == "Réponse"
+    llm.ainvoke.assert_awaited_once()
+    llm.invoke.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_stream_rag_emits_retrieved_tokens_done():
+    """Le stream émet retrieved, puis les tokens du LLM, puis done avec la réponse complète."""
+    hits = [{"id": "d1_0", "doc_id": "d1", "chunk_index": 0, "text": "ctx", "score": 2.0}]
+
+    async def astream(messages):
+        for token in ("Bon", "jour"):
+            yield MagicMock(content=token)
+
+    llm = MagicMock()
+    llm.astream = astream
+    with patch.object(rag_graph, "keyword_search", return_value=hits), \
+         patch.object(rag_graph, "_get_llm", return_value=llm):
+        events = [e async for e in rag_graph.stream_rag("Question ?")]
+    assert [e["step"] for e in events] == ["retrieved", "token", "token", "done"]
+    assert events[0]["retrieved_chunks"] == hits
+    assert events[-1]["answer"] == "Bonjour"
+    assert events[-1]["sources"] == ["ctx"]
+
+
+@pytest.mark.asyncio
+async def test_query_rag_cache_hit_skips_llm():
+    """Une question déjà posée est servie par le cache, sans retrieval ni LLM."""
+    rag_graph.answer_cache.invalidate()
+    hits = [{"id": "d1_0", "doc_id": "d1", "chunk_index": 0, "text": "ctx", "score": 0.1}]
+    llm = MagicMock()
+    llm.ainvoke = AsyncMock(return_value=MagicMock(content="Réponse"))
+    with patch.object(rag_graph.vector_store, "aembed_query", AsyncMock(return_value=[1.0, 0.0])), \
+         patch.object(rag_graph.vector_store, "is_available", return_value=True), \
+         patch.object(rag_graph.vector_store, "asimilarity_search_with_scores", AsyncMock(return_value=hits)) as search, \
+         patch.object(rag_graph, "_get_llm", return_value=llm):
+        first = await rag_graph.query_rag("Question ?")
+        second = await rag_graph.query_rag("Question ?")
+    assert first["cached"] is False and second["cached"] is True
+    assert second["answer"] == "Réponse" and second["retrieved_chunks"] == hits
+    assert search.await_count == 1 and llm.ainvoke.await_count == 1
+    assert search.await_args.kwargs["embedding"] == [1.0, 0.0]
+    rag_graph.answer_cache.invalidate()
@@ -0,0 +1,96 @@
+"""Tests du second étage de retrieval (rerank par lots, cache, limite de temps)."""
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.services import rag_graph, reranker
+
+
+@pytest.fixture(autouse=True)
+def fresh_reranker(monkeypatch):
+    monkeypatch.setattr(reranker, "_reranker", None)
+    reranker._cache.clear()
+    yield
+    reranker._BACKENDS.pop("fake", None)
+
+
+def _hits(*texts):
+    return [{"id": f"c{i}", "doc_id": "d1", "chunk_index": i, "text": t, "score": 0.1 * i} for i, t in enumerate(texts)]
+
+
+class _FakeReranker:
+    """Score = longueur du texte ; compte les textes scorés et peut être lent."""
+
+    name = "fake"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.scored: list[str] = []
+
+    def score(self, query, texts):
+        time.sleep(self.delay)
+        self.scored.extend(texts)
+        return [float(len(t)) for t in texts]
+
+
+@pytest.mark.asyncio
+async def test_lexical_rerank_keeps_best_k():
+    hits = _hits("météo du jour", "le budget municipal 2024", "budget")
+    ranked, info = await reranker.rerank("budget municipal", hits, 2, {"backend": "lexical"})
+    assert [h["id"] for h in ranked] == ["c1", "c2"]
+    assert ranked[0]["rerank_score"] > ranked[1]["rerank_score"]
+    assert ranked[0]["score"] == hits[1]["score"]
+    assert info == {"backend": "lexical", "candidates": 3, "scored": 3, "timed_out": False}
+
+
+@pytest.mark.asyncio
+async def test_scores_cached_per_query_and_chunk():
+    fake = _FakeReranker()
+    reranker.register_backend("fake", lambda cfg: fake)
+    cfg = {"backend": "fake", "batch_size": 2}
+    hits = _hits("a", "bbb", "cc")
+    ranked, _ = await reranker.rerank("q", hits, 3, cfg)
+    assert [h["id"] for h in ranked] == ["c1", "c2", "c0"]
+    await reranker.rerank("q", hits, 3, cfg)
+    assert len(fake.scored) == 3
+
+
+@pytest.mark.asyncio
+async def test_rerank_time_boxed_keeps_first_stage_order_for_unscored():
+    fake = _FakeReranker(delay=0.06)
+    reranker.register_backend("fake", lambda cfg: fake)
+    hits = _hits("a", "bb", "ccc", "dddd", "eeeee")
+    ranked, info = await reranker.rerank("q", hits, 5, {"backend": "fake", "batch_size": 1, "timeout_ms": 100})
+    assert info["timed_out"] and 0 < info["scored"] < 5
+    scored = [h for h in ranked if "rerank_score" in h]
+    assert ranked[: len(scored)] == scored
+    unscored = [h["id"] for h in ranked[len(scored):]]
+    assert unscored == sorted(unscored)
+
+
+@pytest.mark.asyncio
+async def test_retrieve_oversamples_then_reranks_with_timings():
+    candidates = _hits(*[f"texte {i}" for i in range(10)] + ["budget municipal"])
+    settings = {
+        "retriever": {"k": 2, "mode": "keyword"},
+        "rerank": {"enabled": True, "backend": "lexical", "candidates": 11},
+        "chat": {},
+    }
+    with patch.object(rag_graph, "get_settings", return_value=settings), \
+         patch.object(rag_graph, "keyword_search", return_value=candidates) as ks:
+        state = await rag_graph._retrieve({"question": "budget municipal"})
+    assert ks.call_args[0][1] == 11
+    assert len(state["retrieved_chunks"]) == 2
+    assert state["retrieved_chunks"][0]["text"] == "budget municipal"
+    assert set(state["timings"]) == {"retrieve_ms", "rerank_ms"}
+    assert state["rerank"]["candidates"] == 11
+
+
+def test_registered_backend_is_accepted_by_settings():
+    """Un backend enregistré est une valeur valide de rerank.backend (plus de liste figée)."""
+    from app.schemas.settings import RerankSettings
+
+    reranker.register_backend("maison", lambda cfg: reranker.LexicalReranker())
+    assert "maison" in reranker.backend_names() and "auto" in reranker.backend_names()
+    assert RerankSettings(backend="maison").backend == "maison"
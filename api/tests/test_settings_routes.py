@@ -0,0 +1,41 @@
+"""Tests des routes de paramètres (vérification des backends et fournisseurs choisis)."""
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routes import settings as settings_routes
+from app.services import embedding_providers, settings_service
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Client sur les seules routes de paramètres, settings.json dans un répertoire temporaire."""
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+    settings_dir = tmp_path / "data"
+    settings_dir.mkdir()
+    app = FastAPI()
+    app.include_router(settings_routes.router, prefix="/api/settings")
+    with patch.object(settings_service, "_SETTINGS_DIR", settings_dir), patch.object(
+        settings_service, "_SETTINGS_FILE", settings_dir / "settings.json"
+    ):
+        yield TestClient(app)
+
+
+def test_unchanged_unavailable_provider_does_not_block_saving(client):
+    """Sans clé API, renvoyer les paramètres lus (fournisseur openai inchangé) reste possible."""
+    current = client.get("/api/settings").json()
+    assert current["embeddings"]["provider"] == "openai"
+    current["chunks"]["chunk_size"] = 800
+    response = client.put("/api/settings", json=current)
+    assert response.status_code == 200
+    assert response.json()["chunks"]["chunk_size"] == 800
+
+
+def test_switching_to_unavailable_or_unknown_provider_is_refused(client, monkeypatch):
+    monkeypatch.setattr(embedding_providers, "TextEmbedding", None)
+    response = client.put("/api/settings", json={"embeddings": {"provider": "fastembed"}})
+    assert response.status_code == 422 and "indisponible" in response.json()["detail"]
+    response = client.put("/api/settings", json={"rerank": {"backend": "inconnu"}})
+    assert response.status_code == 422 and "inconnu" in response.json()["detail"]
@@ -1,5 +1,6 @@
 """Tests du service de paramètres (validation, merge, lecture/écriture)."""
 import json
+import os
 import tempfile
 from pathlib import Path
 from unittest.mock import patch
@@ -90,3 +91,45 @@ def test_update_settings_merge_partial(temp_settings_dir):
     result = settings_service.update_settings({"chunks": {"chunk_size": 600}})
     assert result["chunks"]["chunk_size"] == 600
     assert result["retriever"]["k"] == 5
+
+
+def test_get_settings_uses_snapshot_until_file_changes(temp_settings_dir):
+    """Le fichier n'est relu que si sa date de modification change."""
+    temp_settings_dir.write_text('{"retriever": {"k": 3}}', encoding="utf-8")
+    with patch.object(settings_service, "_STAT_INTERVAL_SECONDS", 0):
+        first = settings_service.get_snapshot()
+        with patch.object(settings_service, "_load", wraps=settings_service._load) as load:
+            assert settings_service.get_settings()["retriever"]["k"] == 3
+            load.assert_not_called()
+            temp_settings_dir.write_text('{"retriever": {"k": 7}}', encoding="utf-8")
+            os.utime(temp_settings_dir, ns=(1, 1))
+            assert settings_service.get_settings()["retriever"]["k"] == 7
+            load.assert_called_once()
+    assert settings_service.get_snapshot().version == first.version + 1
+
+
+def test_get_settings_returns_copy(temp_settings_dir):
+    """Modifier le dict retourné ne modifie pas l'instantané."""
+    out = settings_service.get_settings()
+    out["retriever"]["k"] = 99
+    assert settings_service.get_settings()["retriever"]["k"] == 5
+
+
+def test_subscribers_notified_on_update(temp_settings_dir):
+    """Les abonnés reçoivent (anciens, nouveaux) paramètres lors d'un changement."""
+    settings_service.get_settings()
+    calls = []
+    listener = lambda old, new: calls.append((old["retriever"]["k"], new["retriever"]["k"]))
+    settings_service.subscribe(listener)
+    try:
+        settings_service.update_settings({"retriever": {"k": 4}})
+        settings_service.update_settings({"retriever": {"k": 4}})  # sans changement
+    finally:
+        settings_service.unsubscribe(listener)
+    assert calls == [(5, 4)]
+
+
+def test_save_settings_atomic_leaves_no_temp_file(temp_settings_dir):
+    """La sauvegarde passe par un fichier temporaire renommé."""
+    settings_service.save_settings({"chunks": {"chunk_size": 700}})
+    assert [p.name for p in temp_settings_dir.parent.iterdir()] == ["settings.json"]
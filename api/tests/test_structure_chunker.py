@@ -0,0 +1,67 @@
+"""Tests du découpage structuré (titres, tableaux, pages)."""
+from app.services.structure_chunker import chunk_markdown, iter_blocks
+
+
+def test_headings_start_chunks_and_build_section_path():
+    md = "# Rapport\n\nIntro.\n\n## Budget\n\nDépenses.\n\n## Risques\n\nAucun."
+    chunks = list(chunk_markdown(md, chunk_size=1000, chunk_overlap=0))
+    assert [text for text, _ in chunks] == ["# Rapport\n\nIntro.", "## Budget\n\nDépenses.", "## Risques\n\nAucun."]
+    assert [meta["section"] for _, meta in chunks] == ["Rapport", "Rapport > Budget", "Rapport > Risques"]
+
+
+def test_table_continued_across_page_is_one_block():
+    md = (
+        "<!-- page 1 -->\n\n| a | b |\n|---|---|\n| 1 | 2 |\n\n"
+        "<!-- page 2 -->\n\n| 3 | 4 |\n|---|---|\n| 5 | 6 |\n\nSuite."
+    )
+    blocks = list(iter_blocks(md.splitlines()))
+    assert [b.kind for b in blocks] == ["table", "text"]
+    assert blocks[0].lines == ["| a | b |", "|---|---|", "| 1 | 2 |", "| 3 | 4 |", "| 5 | 6 |"]
+    assert (blocks[0].page_start, blocks[0].page_end) == (1, 2)
+    assert blocks[1].page_start == 2
+
+
+def test_long_table_split_by_rows_with_header_repeated():
+    rows = "\n".join(f"| ligne {i} | valeur {i} |" for i in range(40))
+    md = f"## Données\n\n| nom | valeur |\n|---|---|\n{rows}"
+    chunks = [text for text, _ in chunk_markdown(md, chunk_size=200, chunk_overlap=50)]
+    assert len(chunks) > 1
+    for text in chunks:
+        table = text[text.index("| nom |"):]
+        assert table.startswith("| nom | valeur |\n|---|---|\n| ligne ")
+        assert len(text) <= 200 + len("## Données\n\n")
+    assert sum(text.count("| ligne ") for text in chunks) == 40
+
+
+def test_long_paragraph_split_on_sentences_with_overlap_and_pages():
+    sentences = " ".join(f"Phrase numéro {i} du budget." for i in range(20))
+    md = f"<!-- page 4 -->\n\n## Budget\n\n{sentences}"
+    chunks = list(chunk_markdown(md, chunk_size=300, chunk_overlap=60))
+    assert len(chunks) > 1
+    assert chunks[0][0].startswith("## Budget\n\n")
+    assert all(len(text) <= 300 for text, _ in chunks)
+    # Recouvrement : le chunk suivant reprend la fin du précédent
+    assert chunks[1][0].split(".")[0] in chunks[0][0]
+    assert all(meta == {"section": "Budget", "page_start": 4, "page_end": 4} for _, meta in chunks)
+
+
+def test_long_paragraph_after_headings_keeps_full_size_chunks():
+    """Seul le premier morceau d'un long paragraphe complète le chunk des titres ; les suivants font ~chunk_size."""
+    sentence = "Le budget de fonctionnement de la commune augmente cette année selon le rapport"
+    para = ". ".join(f"{sentence} {i}" for i in range(40)) + "."
+    md = (
+        "# Rapport annuel sur les finances de la commune et de ses établissements rattachés\n\n"
+        "## Budget principal de fonctionnement et d'investissement voté par le conseil\n\n" + para
+    )
+    chunks = [text for text, _ in chunk_markdown(md, chunk_size=300, chunk_overlap=100)]
+    assert all(len(text) <= 300 for text in chunks)
+    assert all(len(text) >= 200 for text in chunks[:-1])
+    assert chunks[0].startswith("# Rapport") and "Le budget" in chunks[0]
+
+
+def test_chunk_markdown_yields_chunks_lazily():
+    """Générateur : le premier chunk est rendu sans découper la suite du document."""
+    md = "# A\n\nUn.\n\n# B\n\nDeux.\n\n| x |\n| y |\n"
+    chunks = chunk_markdown(md, chunk_size=1000, chunk_overlap=0)
+    assert next(chunks) == ("# A\n\nUn.", {"section": "A"})
+    assert [text for text, _ in chunks] == ["# B\n\nDeux.\n\n| x |\n| y |"]
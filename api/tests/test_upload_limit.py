@@ -0,0 +1,67 @@
+"""Tests de la limite de taille des envois appliquée pendant la réception."""
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.middleware.upload_limit import UploadLimitMiddleware
+
+
+def _client(limit):
+    app = FastAPI()
+    received = []
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        received.append(file.filename)
+        return {"size": len(await file.read())}
+
+    app.add_middleware(UploadLimitMiddleware, limits={"/upload": lambda: limit})
+    return TestClient(app), received
+
+
+def test_declared_content_length_rejected_before_route():
+    client, received = _client(1024)
+    response = client.post("/upload", files={"file": ("a.txt", b"x" * 4096)})
+    assert response.status_code == 413
+    assert received == []
+
+
+def test_streamed_body_counted_per_block():
+    """Sans Content-Length (transfert par morceaux), la limite s'applique aux blocs reçus."""
+    client, received = _client(1024)
+
+    def body():
+        yield b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.txt\"\r\n\r\n"
+        for _ in range(8):
+            yield b"x" * 512
+        yield b"\r\n--b--\r\n"
+
+    response = client.post(
+        "/upload", content=body(), headers={"content-type": "multipart/form-data; boundary=b"}
+    )
+    assert response.status_code == 413
+    assert received == []
+
+
+def test_small_upload_and_unlimited_paths_pass():
+    client, _ = _client(1024 * 1024)
+    assert client.post("/upload", files={"file": ("a.txt", b"abc")}).json() == {"size": 3}
+    client, _ = _client(None)
+    assert client.post("/upload", files={"file": ("a.txt", b"x" * 4096)}).json() == {"size": 4096}
+
+
+def test_route_parameters_matched_in_paths():
+    """Les chemins à paramètres (ré-ingestion d'un document) sont limités comme les autres."""
+    app = FastAPI()
+    received = []
+
+    @app.post("/documents/{doc_id}/reingest")
+    async def reingest(doc_id: str, file: UploadFile = File(...)):
+        received.append(doc_id)
+        return {"id": doc_id}
+
+    app.add_middleware(UploadLimitMiddleware, limits={"/documents/{doc_id}/reingest": lambda: 1024})
+    client = TestClient(app)
+    response = client.post("/documents/d1/reingest", files={"file": ("a.txt", b"x" * 4096)})
+    assert response.status_code == 413 and received == []
+    assert client.post("/documents/d1/reingest", files={"file": ("a.txt", b"ok")}).json() == {"id": "d1"}
+    assert client.post("/documents/a/b/reingest", files={"file": ("a.txt", b"x" * 4096)}).status_code == 404
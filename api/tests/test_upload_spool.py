@@ -0,0 +1,150 @@
+"""Tests de la réception des fichiers par blocs (spool sur disque)."""
+import hashlib
+import os
+
+import pytest
+
+from app.services import upload_spool
+from app.services.upload_spool import FileTooLargeError, spool_upload
+
+
+class _FakeUpload:
+    """Envoi simulé : rend le contenu par blocs et compte les tailles demandées."""
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.pos = 0
+        self.requested: list[int] = []
+
+    async def read(self, n: int = -1) -> bytes:
+        self.requested.append(n)
+        block = self.content[self.pos : self.pos + n]
+        self.pos += len(block)
+        return block
+
+
+@pytest.mark.asyncio
+async def test_spool_copies_by_blocks_and_hashes(monkeypatch, tmp_path):
+    """Le fichier est copié par blocs bornés, avec son empreinte SHA-256."""
+    monkeypatch.setattr(upload_spool, "_CHUNK_SIZE", 4)
+    monkeypatch.setenv("UPLOAD_SPOOL_DIR", str(tmp_path))
+    content = b"0123456789abcdef!"
+    fake = _FakeUpload(content)
+    upload = await spool_upload(fake, "doc.pdf")
+    try:
+        assert set(fake.requested) == {4}
+        assert upload.path.endswith(".pdf") and os.path.dirname(upload.path) == str(tmp_path)
+        assert open(upload.path, "rb").read() == content
+        assert upload.size == len(content)
+        assert upload.content_hash == hashlib.sha256(content).hexdigest()
+    finally:
+        upload.cleanup()
+    assert not os.path.exists(upload.path)
+
+
+@pytest.mark.asyncio
+async def test_spool_enforces_size_limit_while_streaming(monkeypatch, tmp_path):
+    """La limite est appliquée pendant la copie : lecture interrompue, fichier partiel supprimé."""
+    monkeypatch.setattr(upload_spool, "_CHUNK_SIZE", 4)
+    monkeypatch.setenv("UPLOAD_SPOOL_DIR", str(tmp_path))
+    fake = _FakeUpload(b"x" * 100)
+    with pytest.raises(FileTooLargeError):
+        await spool_upload(fake, "big.pdf", max_bytes=10)
+    assert fake.pos <= 12
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_max_upload_bytes_from_settings():
+    assert upload_spool.max_upload_bytes({"docling": {"max_file_size": 2}}) == 2 * 1024 * 1024
+    assert upload_spool.max_upload_bytes({"docling": {"max_file_size": None}}) is None
+
+
+def _spooled_archive(tmp_path, name: str, build) -> upload_spool.SpooledUpload:
+    path = tmp_path / name
+    build(path)
+    return upload_spool.SpooledUpload(path=str(path), filename=name, size=path.stat().st_size, content_hash="")
+
+
+def test_expand_zip_skips_unsafe_and_system_entries(monkeypatch, tmp_path):
+    """Chaque membre régulier devient un fichier temporaire ; chemins remontants et métadonnées ignorés."""
+    import zipfile
+
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setenv("UPLOAD_SPOOL_DIR", str(spool_dir))
+
+    def build(path):
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("docs/a.txt", "alpha")
+            archive.writestr("b.pdf", "beta")
+            archive.writestr("../evil.txt", "x")
+            archive.writestr("__MACOSX/docs/._a.txt", "x")
+            archive.writestr("docs/.DS_Store", "x")
+            archive.writestr("empty/", "")
+
+    members = upload_spool.expand_archive(_spooled_archive(tmp_path, "lot.zip", build))
+    try:
+        assert [m.filename for m in members] == ["a.txt", "b.pdf"]
+        assert all(os.path.dirname(m.path) == str(spool_dir) for m in members)
+        assert open(members[0].path, "rb").read() == b"alpha"
+        assert members[0].content_hash == hashlib.sha256(b"alpha").hexdigest()
+    finally:
+        for m in members:
+            m.cleanup()
+    assert not (tmp_path.parent / "evil.txt").exists()
+
+
+def test_expand_tar_ignores_links_and_enforces_member_limit(monkeypatch, tmp_path):
+    """Les liens sont ignorés ; un membre trop gros annule l'import sans rien laisser sur disque."""
+    import io
+    import tarfile
+
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setenv("UPLOAD_SPOOL_DIR", str(spool_dir))
+
+    def build(path):
+        with tarfile.open(path, "w:gz") as archive:
+            for name, data in (("small.txt", b"ok"), ("big.txt", b"y" * 50)):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+            link = tarfile.TarInfo("link.txt")
+            link.type = tarfile.SYMTYPE
+            link.linkname = "/etc/passwd"
+            archive.addfile(link)
+
+    archive = _spooled_archive(tmp_path, "lot.tar.gz", build)
+    assert [m.filename for m in upload_spool.expand_archive(archive)] == ["small.txt", "big.txt"]
+    for path in spool_dir.iterdir():
+        path.unlink()
+    with pytest.raises(FileTooLargeError):
+        upload_spool.expand_archive(archive, max_member_bytes=10)
+    assert list(spool_dir.iterdir()) == []
+
+
+def test_expand_archive_enforces_total_expanded_size(monkeypatch, tmp_path):
+    """Le total déplié est borné même si chaque membre reste sous sa propre limite (zip bomb)."""
+    import zipfile
+
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setenv("UPLOAD_SPOOL_DIR", str(spool_dir))
+
+    def build(path):
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for i in range(4):
+                archive.writestr(f"part{i}.txt", b"0" * 40)
+
+    archive = _spooled_archive(tmp_path, "bombe.zip", build)
+    with pytest.raises(FileTooLargeError):
+        upload_spool.expand_archive(archive, max_member_bytes=50, max_total_bytes=100)
+    assert list(spool_dir.iterdir()) == []
+
+    monkeypatch.setenv("INGEST_MAX_EXPANDED_MB", "3")
+    assert upload_spool.max_expanded_bytes() == 3 * 1024 * 1024
+
+
+def test_is_archive():
+    assert upload_spool.is_archive("Lot.ZIP") and upload_spool.is_archive("lot.tar.gz")
+    assert not upload_spool.is_archive("rapport.pdf")
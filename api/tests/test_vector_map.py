@@ -0,0 +1,135 @@
+"""Tests de la carte 2D des vecteurs précalculée (calcul complet, incrémental, persistance)."""
+from unittest.mock import patch
+
+import pytest
+
+from app.services import document_store, vector_map, vector_store
+
+
+class _Embeddings:
+    """Embeddings déterministes à 4 dimensions."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), float(ord(text[0])), 1.0, float(len(text) % 3)]
+
+
+@pytest.fixture
+def chroma_map(monkeypatch, tmp_path):
+    """Vrai Chroma temporaire, catalogue et carte isolés ; pas de worker en tâche de fond."""
+    pytest.importorskip("chromadb")
+    if not vector_map._HAS_LAYOUT:
+        pytest.skip("numpy / scikit-learn absents")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path / "chroma"))
+    vector_store.close_store()
+    document_store.close_keyword_indexes()
+    monkeypatch.setattr(vector_map, "_layout", None)
+    monkeypatch.setattr(vector_map, "_layout_loaded_from", None)
+    with patch.object(vector_store, "_build_embedding_function", return_value=_Embeddings()), \
+         patch.object(vector_map, "schedule_refresh"):
+        yield
+    document_store.close_keyword_indexes()
+    vector_store.close_store()
+
+
+def test_map_is_served_stale_then_computed(chroma_map):
+    """Sans carte, l'endpoint répond tout de suite (stale) ; après refresh, tous les points."""
+    document_store.add_document("d1", "a.pdf", ["alpha", "beta", "gamma", "delta"])
+    first = vector_map.get_map()
+    assert first["available"] and first["stale"] and first["points"] == []
+    vector_map.refresh()
+    second = vector_map.get_map()
+    assert not second["stale"]
+    expected = vector_store.make_chunk_ids("d1", ["alpha", "beta", "gamma", "delta"])
+    assert sorted(p["id"] for p in second["points"]) == sorted(expected)
+    assert second["version"] == document_store.corpus_version()
+
+
+def test_new_chunks_are_placed_incrementally(chroma_map):
+    """Quelques nouveaux chunks sont placés sans refaire le t-SNE ; les supprimés disparaissent."""
+    document_store.add_document("d1", "a.pdf", [f"texte {i} " * (i + 1) for i in range(12)])
+    document_store.add_document("d2", "b.pdf", ["x", "y"])
+    vector_map.refresh()
+    before = {p["id"]: (p["x"], p["y"]) for p in vector_map.get_map()["points"]}
+    document_store.delete_document("d2")
+    document_store.add_document("d3", "c.pdf", ["texte 1 texte 1 "])
+    with patch.object(vector_map, "TSNE") as tsne:
+        vector_map.refresh()
+    tsne.assert_not_called()
+    after = {p["id"]: (p["x"], p["y"]) for p in vector_map.get_map()["points"]}
+    (new_id,) = vector_store.make_chunk_ids("d3", ["texte 1 texte 1 "])
+    assert new_id in after and not any(k.startswith("d2_") for k in after)
+    assert all(after[k] == before[k] for k in before if k.startswith("d1_"))
+
+
+def test_layout_persists_as_float32(chroma_map):
+    """La carte est rechargée depuis le disque (float32) pour la même version du corpus."""
+    document_store.add_document("d1", "a.pdf", ["alpha", "beta", "gamma"])
+    computed = vector_map.refresh()
+    vector_map._layout, vector_map._layout_loaded_from = None, None
+    loaded = vector_map._current_layout()
+    assert loaded.version == computed.version and loaded.ids == computed.ids
+    assert loaded.coords.dtype.name == "float32"
+
+
+def _synthetic_layout(n=2000):
+    np = pytest.importorskip("numpy")
+    rng = np.random.default_rng(0)
+    coords = rng.normal(0, 10, size=(n, 2)).astype(np.float32)
+    return vector_map.Layout(
+        version=1,
+        ids=[f"c{i}" for i in range(n)],
+        coords=coords,
+        doc_ids=[f"d{i % 3}" for i in range(n)],
+        filenames=[f"f{i % 3}.pdf" for i in range(n)],
+        chunk_indexes=list(range(n)),
+        snippets=[f"texte {i}" for i in range(n)],
+    )
+
+
+def test_bbox_query_matches_full_scan():
+    """La grille renvoie exactement les points de la bbox."""
+    layout = _synthetic_layout()
+    index = vector_map._LayoutIndex(layout)
+    bbox = (-5.0, -3.0, 7.5, 4.0)
+    expected = [
+        i for i, (x, y) in enumerate(layout.coords.tolist())
+        if bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]
+    ]
+    assert index.select(bbox).tolist() == expected
+
+
+def test_dense_regions_are_clustered_by_zoom():
+    """Au-delà de max_points, les agrégats conservent le nombre total de points."""
+    index = vector_map._LayoutIndex(_synthetic_layout())
+    coarse = index.view(None, zoom=0, max_points=100)
+    fine = index.view(None, zoom=3, max_points=100)
+    assert int(coarse["count"].sum()) == int(fine["count"].sum()) == 2000
+    assert len(coarse["index"]) < len(fine["index"]) <= 2000
+    assert len(index.view(None, zoom=0, max_points=5000)["index"]) == 2000
+
+
+def test_binary_encoding_roundtrip():
+    """Le format binaire se relit : en-tête JSON puis colonnes little-endian."""
+    import json
+    import struct
+
+    import numpy as np
+
+    layout = _synthetic_layout(50)
+    with patch.object(vector_map, "is_available", return_value=True), \
+         patch.object(vector_map, "_current_layout", return_value=layout), \
+         patch("app.services.document_store.corpus_version", return_value=1):
+        view = vector_map.get_map(columnar=True)
+    data = vector_map.encode_binary(view)
+    (header_len,) = struct.unpack_from("<I", data)
+    header = json.loads(data[4 : 4 + header_len])
+    n = header["n"]
+    offset = 4 + header_len
+    assert offset % 4 == 0 and n == 50 and header["stale"] is False
+    x = np.frombuffer(data, dtype="<f4", count=n, offset=offset + 4 * n)
+    assert np.allclose(x, layout.coords[:, 0])
+    assert len(data) == offset + 5 * 4 * n
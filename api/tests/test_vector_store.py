@@ -0,0 +1,212 @@
+"""Tests du cycle de vie du vector store (client partagé, reconstruction, fermeture)."""
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services import embedding_providers, vector_store
+
+
+@pytest.fixture
+def fake_chroma(monkeypatch, tmp_path):
+    """Remplace Chroma / client / embeddings par des mocks et isole l'état du module."""
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path / "chroma"))
+    vector_store.close_store()
+    with patch.object(vector_store, "_HAS_CHROMA", True), \
+         patch.object(vector_store, "chromadb", create=True) as chromadb_mock, \
+         patch.object(vector_store, "Chroma", create=True) as chroma_cls, \
+         patch.object(embedding_providers, "OpenAIEmbeddings"):
+        chromadb_mock.PersistentClient.side_effect = lambda path: MagicMock(name=path)
+        chroma_cls.side_effect = lambda **kw: MagicMock(client=kw["client"])
+        yield chromadb_mock
+    vector_store.close_store()
+
+
+def test_store_is_reused_between_calls(fake_chroma):
+    """Le client Chroma n'est créé qu'une fois pour une même configuration."""
+    first = vector_store._get_vector_store()
+    second = vector_store._get_vector_store()
+    assert first is not None
+    assert first is second
+    assert fake_chroma.PersistentClient.call_count == 1
+
+
+def test_store_rebuilt_when_persist_dir_changes(fake_chroma, monkeypatch, tmp_path):
+    """Changer CHROMA_PERSIST_DIR reconstruit le store et ferme l'ancien client."""
+    first = vector_store._get_vector_store()
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path / "other"))
+    second = vector_store._get_vector_store()
+    assert second is not first
+    first.client.close.assert_called_once()
+    assert fake_chroma.PersistentClient.call_count == 2
+
+
+def test_is_available_does_not_open_store(fake_chroma):
+    """is_available est une sonde de configuration, sans ouverture du store."""
+    assert vector_store.is_available() is True
+    fake_chroma.PersistentClient.assert_not_called()
+
+
+def test_failed_open_marks_unavailable(fake_chroma):
+    """Un échec d'ouverture rend le store indisponible jusqu'à open_store()."""
+    fake_chroma.PersistentClient.side_effect = RuntimeError("disk")
+    assert vector_store._get_vector_store() is None
+    assert vector_store.is_available() is False
+    fake_chroma.PersistentClient.side_effect = lambda path: MagicMock(name=path)
+    assert vector_store.open_store() is True
+    assert vector_store.is_available() is True
+
+
+def test_unavailable_without_api_key(monkeypatch):
+    """Sans clé API, le store est indisponible."""
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+    assert vector_store.is_available() is False
+    assert vector_store._get_vector_store() is None
+
+
+class _CountingEmbeddings:
+    """Embeddings déterministes qui comptent les textes embeddés."""
+
+    def __init__(self):
+        self.embedded: list[str] = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 0.5]
+
+
+@pytest.fixture
+def real_chroma(monkeypatch, tmp_path):
+    """Vrai client Chroma dans un répertoire temporaire, embeddings factices."""
+    pytest.importorskip("chromadb")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path / "chroma"))
+    vector_store.close_store()
+    emb = _CountingEmbeddings()
+    with patch.object(vector_store, "_build_embedding_function", return_value=emb):
+        yield emb
+    vector_store.close_store()
+
+
+def test_replace_chunks_embeds_once_and_drops_stale(real_chroma):
+    """Le remplacement embedde chaque chunk une fois et supprime les chunks obsolètes."""
+    assert vector_store.replace_chunks("d1", "v1.pdf", ["a", "b", "c"])
+    real_chroma.embedded.clear()
+    assert vector_store.replace_chunks("d1", "v2.pdf", ["x", "y"])
+    assert real_chroma.embedded == ["x", "y"]
+    assert vector_store.get_chunks_by_doc_id("d1") == ["x", "y"]
+    assert vector_store.list_document_ids() == [("d1", "v2.pdf")]
+
+
+def test_replace_chunks_embeds_only_changed_chunks(real_chroma):
+    """Ids dérivés du contenu : seuls les chunks nouveaux sont embeddés, les disparus supprimés."""
+    assert vector_store.replace_chunks("d1", "v1.pdf", ["a", "b", "c", "d"])
+    real_chroma.embedded.clear()
+    assert vector_store.replace_chunks("d1", "v2.pdf", ["a", "x", "c", "d"])
+    assert real_chroma.embedded == ["x"]
+    assert vector_store.get_chunks_by_doc_id("d1") == ["a", "x", "c", "d"]
+    assert vector_store.list_document_ids() == [("d1", "v2.pdf")]
+    # Chunks simplement déplacés : aucun embedding, positions mises à jour
+    real_chroma.embedded.clear()
+    assert vector_store.replace_chunks("d1", "v2.pdf", ["d", "a", "x", "c"])
+    assert real_chroma.embedded == []
+    assert vector_store.get_chunks_by_doc_id("d1") == ["d", "a", "x", "c"]
+
+
+def test_search_sees_one_version_during_replace(real_chroma):
+    """Pendant un remplacement, la recherche voit l'ancienne version puis la nouvelle, jamais les deux."""
+    assert vector_store.replace_chunks("d1", "v1.pdf", ["alpha", "beta", "gamma"])
+
+    def visible():
+        return sorted(r["text"] for r in vector_store.similarity_search_with_scores("x", k=10))
+
+    seen = []
+    switch = vector_store._switch_generation
+
+    def spy(shown, hidden):
+        # Nouveaux chunks écrits, anciens encore présents (avant et après la bascule)
+        seen.append(visible())
+        switch(shown, hidden)
+        seen.append(visible())
+
+    with patch.object(vector_store, "_switch_generation", side_effect=spy):
+        assert vector_store.replace_chunks("d1", "v2.pdf", ["alpha", "delta"])
+    assert seen == [["alpha", "beta", "gamma"], ["alpha", "delta"]]
+    assert visible() == ["alpha", "delta"] and not vector_store._hidden_generations
+
+    # Échec du remplacement : les nouveaux chunks sont retirés, l'ancienne version reste seule
+    with patch.object(vector_store, "_upsert", side_effect=RuntimeError("disque plein")):
+        assert vector_store.replace_chunks("d1", "v3.pdf", ["alpha", "epsilon"]) is False
+    assert visible() == ["alpha", "delta"] and not vector_store._hidden_generations
+
+
+def test_chunk_ids_follow_content():
+    ids = vector_store.make_chunk_ids("d1", ["a", "b", "a"])
+    assert ids[0] != ids[1] and ids[2] == ids[0] + "_1"
+    assert vector_store.make_chunk_ids("d1", ["z", "b"])[1] == ids[1]
+
+
+def test_iter_chunks_pages_through_collection(real_chroma):
+    """iter_chunks lit la collection par pages et rend chaque chunk une fois."""
+    vector_store.replace_chunks("d1", "a.pdf", ["a", "b", "c"])
+    vector_store.replace_chunks("d2", "b.pdf", ["d", "e"])
+    chunks = list(vector_store.iter_chunks(page_size=2))
+    expected = vector_store.make_chunk_ids("d1", ["a", "b", "c"]) + vector_store.make_chunk_ids("d2", ["d", "e"])
+    assert sorted(c["id"] for c in chunks) == sorted(expected)
+    assert sorted(c["text"] for c in chunks) == ["a", "b", "c", "d", "e"]
+
+
+def test_structure_metadata_reaches_search_results(real_chroma):
+    """Section et pages du découpage structuré sont stockées et rendues par la recherche."""
+    extra = [{"section": "Budget > 2024", "page_start": 3, "page_end": 4}, {"section": None}]
+    assert vector_store.replace_chunks("d1", "a.pdf", ["alpha", "beta"], chunk_metadatas=extra)
+    results = {r["text"]: r for r in vector_store.similarity_search_with_scores("alpha", k=2)}
+    assert results["alpha"]["section"] == "Budget > 2024"
+    assert (results["alpha"]["page_start"], results["alpha"]["page_end"]) == (3, 4)
+    assert "section" not in results["beta"]
+
+
+def test_failed_new_document_leaves_no_partial_chunks(real_chroma):
+    """Un échec au milieu de l'écriture lot par lot retire les chunks déjà écrits."""
+    calls = []
+
+    def flaky(texts):
+        calls.append(texts)
+        if len(calls) > 1:
+            raise RuntimeError("quota")
+        return [[1.0, 1.0, 0.5] for _ in texts]
+
+    ingestion = {"ingestion": {"embed_batch_size": 1, "embed_concurrency": 1, "embed_max_retries": 0}}
+    with patch.object(vector_store, "get_settings", return_value=ingestion), \
+         patch.object(real_chroma, "embed_documents", side_effect=flaky):
+        assert vector_store.replace_chunks("d1", "a.pdf", ["a", "b", "c"]) is False
+    assert len(calls) >= 2
+    assert not vector_store.get_chunks_by_doc_id("d1")
+
+
+def test_chunk_stream_embeds_while_splitting(real_chroma):
+    """Nouveau document : les lots sont embeddés et écrits pendant le découpage, restes retirés."""
+    assert vector_store.replace_chunks("d1", "old.pdf", ["reste"])
+    log = []
+
+    def items():
+        for i in range(4):
+            log.append(f"split {i}")
+            yield f"chunk {i}", {"section": "S", "page_start": i + 1}
+
+    def embed(texts):
+        log.append(f"embed {texts[0]}")
+        return [[1.0, 1.0, 0.5] for _ in texts]
+
+    ingestion = {"ingestion": {"embed_batch_size": 1, "embed_concurrency": 1}}
+    with patch.object(vector_store, "get_settings", return_value=ingestion), \
+         patch.object(real_chroma, "embed_documents", side_effect=embed):
+        chunks = vector_store.add_chunk_stream("d1", "a.pdf", items())
+    assert chunks == [f"chunk {i}" for i in range(4)]
+    assert log.index("embed chunk 0") < log.index("split 3")
+    assert vector_store.get_chunks_by_doc_id("d1") == chunks
+    results = {r["text"]: r for r in vector_store.similarity_search_with_scores("chunk", k=4)}
+    assert results["chunk 2"]["section"] == "S" and results["chunk 2"]["page_start"] == 3
@@ -17,13 +17,29 @@ export async function healthCheck(): Promise<{ status: string }> {
   return res.json();
 }
 
-export type RetrievedChunk = { text: string; score: number | null };
+export type RetrievedChunk = {
+  text: string;
+  score: number | null;
+  /** Scores par source en mode hybride */
+  vector_score?: number | null;
+  keyword_score?: number | null;
+  /** Score du reranker (second étage) */
+  rerank_score?: number | null;
+};
 
 export type QueryRagResponse = {
   answer: string;
   sources: string[];
   retrieved_chunks: RetrievedChunk[];
   retrieval_method: string;
+  /** Tokens du contexte envoyé au LLM (chunks voisins fusionnés, budget du modèle) */
+  context_tokens?: number;
+  /** Second étage du retrieval (null si désactivé) */
+  rerank?: { backend: string | null; candidates: number; scored: number; timed_out: boolean } | null;
+  /** Durée de chaque étape (ms) : cache_ms, retrieve_ms, rerank_ms, generate_ms */
+  timings?: Record<string, number>;
+  /** Réponse servie par le cache sémantique (sans appel au LLM) */
+  cached?: boolean;
 };
 
 export async function queryRag(question: string): Promise<QueryRagResponse> {
@@ -39,6 +55,90 @@ export async function queryRag(question: string): Promise<QueryRagResponse> {
   return res.json();
 }
 
+export type QueryStreamHandlers = {
+  /** Chunks récupérés (avant la génération) */
+  onRetrieved?: (chunks: RetrievedChunk[], retrievalMethod: string) => void;
+  /** Fragment de réponse généré */
+  onToken?: (token: string) => void;
+};
+
+/** Pose une question en streamant la réponse (SSE) ; résout avec la réponse complète. */
+export async function queryRagStream(
+  question: string,
+  handlers: QueryStreamHandlers = {},
+  signal?: AbortSignal
+): Promise<QueryRagResponse> {
+  const res = await fetch(`${API_URL}/api/rag/query-stream`, {
+    method: 'POST',
+    headers: defaultHeaders({ 'Content-Type': 'application/json' }),
+    body: JSON.stringify({ question }),
+    signal,
+  });
+  if (!res.ok) {
+    const err = await res.text();
+    throw new Error(err || 'Query failed');
+  }
+  const reader = res.body?.getReader();
+  if (!reader) throw new Error('No response body');
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let retrieved: RetrievedChunk[] = [];
+  let method = '';
+  let rerank: QueryRagResponse['rerank'] = null;
+  let result: QueryRagResponse | null = null;
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop() ?? '';
+    for (const line of lines) {
+      if (!line.startsWith('data: ')) continue;
+      let event: {
+        step: string;
+        content?: string;
+        message?: string;
+        answer?: string;
+        sources?: string[];
+        cached?: boolean;
+        retrieved_chunks?: RetrievedChunk[];
+        retrieval_method?: string;
+        context_tokens?: number;
+        rerank?: QueryRagResponse['rerank'];
+        timings?: Record<string, number>;
+      };
+      try {
+        event = JSON.parse(line.slice(6));
+      } catch {
+        continue;
+      }
+      if (event.step === 'retrieved') {
+        retrieved = event.retrieved_chunks || [];
+        method = event.retrieval_method || '';
+        rerank = event.rerank ?? null;
+        handlers.onRetrieved?.(retrieved, method);
+      } else if (event.step === 'token' && event.content) {
+        handlers.onToken?.(event.content);
+      } else if (event.step === 'done') {
+        result = {
+          answer: event.answer || '',
+          sources: event.sources || [],
+          retrieved_chunks: retrieved,
+          retrieval_method: method,
+          context_tokens: event.context_tokens,
+          rerank,
+          timings: event.timings,
+          cached: event.cached,
+        };
+      } else if (event.step === 'error') {
+        throw new Error(event.message || 'Erreur lors de la requête');
+      }
+    }
+  }
+  if (!result) throw new Error('Réponse incomplète');
+  return result;
+}
+
 export type IngestResponse = { id: string; filename: string; chunks: number };
 
 export type IngestProgressEvent = {
@@ -46,6 +146,11 @@ export type IngestProgressEvent = {
   message: string;
   doc_id?: string;
   chunks?: number;
+  /** Progression des embeddings (step "embed") ou des pages converties (step "convert_pages") */
+  done?: number;
+  total?: number;
+  /** step "done" : fichier identique déjà importé avec les mêmes paramètres (rien refait) */
+  unchanged?: boolean;
 };
 
 export async function ingestFile(file: File): Promise<IngestResponse> {
@@ -116,14 +221,139 @@ export async function ingestFileWithProgress(
   return result;
 }
 
-export type DocumentItem = { id: string; filename: string; chunk_count: number };
+export type BatchIngestEvent = IngestProgressEvent & {
+  job_id: string;
+  /** Index et nom du fichier concerné (absents pour batch_start / batch_done) */
+  file_index?: number;
+  filename?: string;
+  /** batch_start : fichiers du job (archives dépliées) */
+  files?: string[];
+  /** batch_done : bilan du job */
+  succeeded?: number;
+  failed?: number;
+};
 
-export async function listDocuments(): Promise<DocumentItem[]> {
-  const res = await fetch(`${API_URL}/api/rag/documents`, { headers: defaultHeaders() });
-  if (!res.ok) throw new Error('List documents failed');
+export type BatchIngestResult = { job_id: string; succeeded: number; failed: number };
+
+/** Import groupé (plusieurs fichiers et/ou archives zip / tar) avec statuts par fichier. */
+export async function ingestBatchWithProgress(
+  files: File[],
+  onProgress: (event: BatchIngestEvent) => void
+): Promise<BatchIngestResult> {
+  const form = new FormData();
+  for (const file of files) form.append('files', file);
+  const res = await fetch(`${API_URL}/api/rag/ingest-batch`, {
+    method: 'POST',
+    headers: defaultHeaders(),
+    body: form,
+  });
+  if (!res.ok) {
+    const err = await res.text();
+    throw new Error(err || 'Ingest failed');
+  }
+  const reader = res.body?.getReader();
+  if (!reader) throw new Error('No response body');
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result: BatchIngestResult | null = null;
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop() ?? '';
+    for (const line of lines) {
+      if (!line.startsWith('data: ')) continue;
+      let event: BatchIngestEvent;
+      try {
+        event = JSON.parse(line.slice(6)) as BatchIngestEvent;
+      } catch {
+        continue;
+      }
+      onProgress(event);
+      if (event.step === 'batch_done') {
+        result = { job_id: event.job_id, succeeded: event.succeeded ?? 0, failed: event.failed ?? 0 };
+      }
+    }
+  }
+  if (!result) throw new Error('Import incomplet');
+  return result;
+}
+
+export type IngestJobFile = {
+  index: number;
+  filename: string;
+  doc_id: string;
+  status: 'queued' | 'running' | 'done' | 'error';
+  /** Dernière étape terminée (reprise après redémarrage) */
+  stage: 'received' | 'converted' | 'split' | 'stored';
+  message: string;
+  chunks: number | null;
+  /** Chunks déjà embeddés */
+  embedded: number;
+  attempts: number;
+};
+
+export type BatchIngestJob = {
+  job_id: string;
+  status: 'queued' | 'running' | 'done';
+  created_at: number;
+  finished_at: number | null;
+  total: number;
+  queued: number;
+  running: number;
+  done: number;
+  error: number;
+  files: IngestJobFile[];
+};
+
+export async function getIngestJob(jobId: string): Promise<BatchIngestJob> {
+  const res = await fetch(`${API_URL}/api/rag/jobs/${encodeURIComponent(jobId)}`, {
+    headers: defaultHeaders(),
+  });
+  if (!res.ok) throw new Error(await res.text());
   return res.json();
 }
 
+export type DocumentItem = {
+  id: string;
+  filename: string;
+  chunk_count: number;
+  /** Date d'ingestion (ISO 8601, UTC) */
+  ingested_at?: string;
+  settings_hash?: string | null;
+  content_hash?: string | null;
+};
+
+export type ListDocumentsParams = {
+  offset?: number;
+  limit?: number;
+  sort?: 'ingested_at' | 'filename' | 'chunk_count';
+  order?: 'asc' | 'desc';
+};
+
+export async function listDocuments(params: ListDocumentsParams = {}): Promise<DocumentItem[]> {
+  return (await listDocumentsPage(params)).items;
+}
+
+/** Page de documents et nombre total (en-tête X-Total-Count). */
+export async function listDocumentsPage(
+  params: ListDocumentsParams = {}
+): Promise<{ items: DocumentItem[]; total: number }> {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value !== undefined) query.set(key, String(value));
+  });
+  const qs = query.toString();
+  const res = await fetch(`${API_URL}/api/rag/documents${qs ? `?${qs}` : ''}`, {
+    headers: defaultHeaders(),
+  });
+  if (!res.ok) throw new Error('List documents failed');
+  const items: DocumentItem[] = await res.json();
+  const total = Number(res.headers.get('X-Total-Count') ?? items.length);
+  return { items, total };
+}
+
 export async function getDocumentChunks(docId: string): Promise<{ id: string; chunks: string[] }> {
   const res = await fetch(`${API_URL}/api/rag/documents/${encodeURIComponent(docId)}/chunks`, {
     headers: defaultHeaders(),
@@ -133,24 +363,60 @@ export async function getDocumentChunks(docId: string): Promise<{ id: string; ch
 }
 
 export type VectorMapPoint = {
+  /** Position du point dans la carte (pour getVectorMapPoint) */
+  index: number;
   id: string;
   doc_id: string;
   filename: string;
   chunk_index: number;
-  text_snippet: string;
+  /** Présent seulement avec snippets=true (sinon : getVectorMapPoint) */
+  text_snippet?: string;
   x: number;
   y: number;
+  /** Nombre de chunks regroupés (> 1 : agrégat d'une zone dense) */
+  count: number;
+};
+
+export type VectorMapParams = {
+  /** Zone visible [xmin, ymin, xmax, ymax] */
+  bbox?: [number, number, number, number];
+  zoom?: number;
+  max_points?: number;
+  snippets?: boolean;
 };
 
-export async function getVectorMap(): Promise<{
+export async function getVectorMap(params: VectorMapParams = {}): Promise<{
   available: boolean;
   points: VectorMapPoint[];
+  version?: number | null;
+  bounds?: [number, number, number, number] | null;
+  total?: number;
+  /** Carte en retard sur le corpus (mise à jour en tâche de fond) */
+  stale?: boolean;
+  computing?: boolean;
 }> {
-  const res = await fetch(`${API_URL}/api/rag/vector-map`, { headers: defaultHeaders() });
+  const query = new URLSearchParams();
+  if (params.bbox) query.set('bbox', params.bbox.join(','));
+  if (params.zoom !== undefined) query.set('zoom', String(params.zoom));
+  if (params.max_points !== undefined) query.set('max_points', String(params.max_points));
+  if (params.snippets) query.set('snippets', 'true');
+  const qs = query.toString();
+  const res = await fetch(`${API_URL}/api/rag/vector-map${qs ? `?${qs}` : ''}`, { headers: defaultHeaders() });
   if (!res.ok) throw new Error('Vector map failed');
   return res.json();
 }
 
+/** Détail d'un point de la carte (extrait de texte), chargé au survol. */
+export async function getVectorMapPoint(
+  index: number,
+  version?: number | null
+): Promise<VectorMapPoint & { text_snippet: string }> {
+  const qs = version != null ? `?version=${version}` : '';
+  const res = await fetch(`${API_URL}/api/rag/vector-map/points/${index}${qs}`, { headers: defaultHeaders() });
+  if (!res.ok) throw new Error('Vector map point failed');
+  return res.json();
+}
+
 export async function deleteDocument(docId: string): Promise<void> {
   const res = await fetch(`${API_URL}/api/rag/documents/${encodeURIComponent(docId)}`, {
     method: 'DELETE',
@@ -179,6 +445,7 @@ export type Settings = {
     chunk_size: number;
     chunk_overlap: number;
     separators: string[];
+    strategy: 'recursive' | 'structure';
   };
   docling: {
     max_num_pages: number | null;
@@ -188,13 +455,38 @@ export type Settings = {
     table_former_mode: string;
     enable_remote_services: boolean;
     artifacts_path: string | null;
+    /** PDF d'au moins ce nombre de pages : conversion parallèle par plages */
+    parallel_min_pages: number;
+    page_range_size: number;
+  };
+  embeddings?: {
+    provider: 'openai' | 'fastembed';
+    model: string | null;
+    batch_size: number;
+    threads: number | null;
   };
   retriever: {
     k: number;
+    mode?: 'auto' | 'similarity' | 'keyword' | 'hybrid';
+  };
+  rerank?: {
+    enabled: boolean;
+    backend: 'auto' | 'cross_encoder' | 'onnx' | 'lexical';
+    model: string;
+    candidates: number;
+    batch_size: number;
+    timeout_ms: number;
   };
   chat: {
     model: string;
     temperature: number;
+    max_context_tokens: number;
+  };
+  answer_cache?: {
+    enabled: boolean;
+    similarity_threshold: number;
+    ttl_seconds: number;
+    max_entries: number;
   };
 };
 
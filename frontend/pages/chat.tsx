@@ -11,7 +11,7 @@ import ListItemText from '@mui/material/ListItemText';
 import Collapse from '@mui/material/Collapse';
 import Chip from '@mui/material/Chip';
 import type { RetrievedChunk } from '@/lib/api';
-import { queryRag } from '@/lib/api';
+import { queryRagStream } from '@/lib/api';
 
 const PREVIEW_LEN = 120;
 
@@ -21,6 +21,8 @@ export default function ChatPage() {
   const [sources, setSources] = useState<string[]>([]);
   const [retrievedChunks, setRetrievedChunks] = useState<RetrievedChunk[]>([]);
   const [retrievalMethod, setRetrievalMethod] = useState<string>('');
+  const [cached, setCached] = useState(false);
+  const [timings, setTimings] = useState<Record<string, number>>({});
   const [expandedChunk, setExpandedChunk] = useState<number | null>(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
@@ -33,10 +35,20 @@ export default function ChatPage() {
     setSources([]);
     setRetrievedChunks([]);
     setRetrievalMethod('');
+    setCached(false);
+    setTimings({});
     setExpandedChunk(null);
     try {
-      const res = await queryRag(question);
+      const res = await queryRagStream(question, {
+        onRetrieved: (chunks, method) => {
+          setRetrievedChunks(chunks);
+          setRetrievalMethod(method);
+        },
+        onToken: (token) => setAnswer((prev) => prev + token),
+      });
       setAnswer(res.answer);
+      setCached(Boolean(res.cached));
+      setTimings(res.timings || {});
       setSources(res.sources || []);
       setRetrievedChunks(res.retrieved_chunks || []);
       setRetrievalMethod(res.retrieval_method || '');
@@ -92,9 +104,26 @@ export default function ChatPage() {
               Méthode de récupération :{' '}
               <Chip
                 size="small"
-                label={retrievalMethod === 'similarity' ? 'Recherche sémantique (similarité)' : 'Recherche par mots-clés'}
+                label={
+                  retrievalMethod === 'similarity'
+                    ? 'Recherche sémantique (similarité)'
+                    : retrievalMethod === 'hybrid'
+                      ? 'Recherche hybride (sémantique + mots-clés)'
+                      : 'Recherche par mots-clés'
+                }
                 sx={{ verticalAlign: 'middle' }}
               />
+              {cached && (
+                <Chip size="small" label="Réponse en cache" color="success" variant="outlined" sx={{ ml: 1, verticalAlign: 'middle' }} />
+              )}
+            </Typography>
+          )}
+
+          {Object.keys(timings).length > 0 && (
+            <Typography variant="caption" color="text.secondary" component="div" sx={{ mt: 1 }}>
+              {Object.entries(timings)
+                .map(([stage, ms]) => `${stage.replace(/_ms$/, '')} ${Math.round(ms)} ms`)
+                .join(' · ')}
             </Typography>
           )}
 
@@ -117,6 +146,12 @@ export default function ChatPage() {
                         {chunk.score != null && (
                           <Chip size="small" label={`score: ${chunk.score.toFixed(4)}`} variant="outlined" />
                         )}
+                        {chunk.vector_score != null && (
+                          <Chip size="small" label={`vecteur: ${chunk.vector_score.toFixed(4)}`} variant="outlined" />
+                        )}
+                        {chunk.keyword_score != null && (
+                          <Chip size="small" label={`mots-clés: ${chunk.keyword_score.toFixed(4)}`} variant="outlined" />
+                        )}
                         <Button
                           size="small"
                           onClick={() => setExpandedChunk(isExpanded ? null : i)}
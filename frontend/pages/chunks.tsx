@@ -21,8 +21,17 @@ import {
   ResponsiveContainer,
   Cell,
 } from 'recharts';
-import { listDocuments, getDocumentChunks, getVectorMap, type DocumentItem, type VectorMapPoint } from '@/lib/api';
+import {
+  listDocuments,
+  getDocumentChunks,
+  getVectorMap,
+  getVectorMapPoint,
+  type DocumentItem,
+  type VectorMapPoint,
+} from '@/lib/api';
 
+// Intervalle de rafraîchissement tant que la carte est en cours de mise à jour côté serveur
+const VECTOR_MAP_POLL_MS = 5000;
 const VECTOR_MAP_COLORS = ['#1976d2', '#2e7d32', '#ed6c02', '#9c27b0', '#0288d1', '#c62828', '#558b2f', '#6a1b9a'];
 
 export default function ChunksPage() {
@@ -35,6 +44,10 @@ export default function ChunksPage() {
   const [vectorMapLoading, setVectorMapLoading] = useState(true);
   const [vectorMapAvailable, setVectorMapAvailable] = useState(false);
   const [vectorMapPoints, setVectorMapPoints] = useState<VectorMapPoint[]>([]);
+  const [vectorMapStale, setVectorMapStale] = useState(false);
+  const [vectorMapVersion, setVectorMapVersion] = useState<number | null>(null);
+  // Extraits chargés à la demande (survol), par index de point
+  const [snippets, setSnippets] = useState<Record<number, string>>({});
 
   useEffect(() => {
     let cancelled = false;
@@ -54,24 +67,35 @@ export default function ChunksPage() {
 
   useEffect(() => {
     let cancelled = false;
+    let timer: ReturnType<typeof setTimeout> | undefined;
     setVectorMapLoading(true);
-    getVectorMap()
-      .then((res) => {
-        if (!cancelled) {
+    const load = () => {
+      getVectorMap()
+        .then((res) => {
+          if (cancelled) return;
           setVectorMapAvailable(res.available);
           setVectorMapPoints(res.points);
-        }
-      })
-      .catch(() => {
-        if (!cancelled) {
-          setVectorMapAvailable(false);
-          setVectorMapPoints([]);
-        }
-      })
-      .finally(() => {
-        if (!cancelled) setVectorMapLoading(false);
-      });
-    return () => { cancelled = true; };
+          setVectorMapStale(Boolean(res.stale));
+          setVectorMapVersion(res.version ?? null);
+          setSnippets({});
+          // Carte en cours de mise à jour côté serveur : on redemande un peu plus tard
+          if (res.stale) timer = setTimeout(load, VECTOR_MAP_POLL_MS);
+        })
+        .catch(() => {
+          if (!cancelled) {
+            setVectorMapAvailable(false);
+            setVectorMapPoints([]);
+          }
+        })
+        .finally(() => {
+          if (!cancelled) setVectorMapLoading(false);
+        });
+    };
+    load();
+    return () => {
+      cancelled = true;
+      if (timer) clearTimeout(timer);
+    };
   }, []);
 
   useEffect(() => {
@@ -95,6 +119,13 @@ export default function ChunksPage() {
     return () => { cancelled = true; };
   }, [selectedId]);
 
+  const loadSnippet = (point: VectorMapPoint) => {
+    if (point.count > 1 || point.index in snippets) return;
+    getVectorMapPoint(point.index, vectorMapVersion)
+      .then((p) => setSnippets((prev) => ({ ...prev, [point.index]: p.text_snippet })))
+      .catch(() => setSnippets((prev) => ({ ...prev, [point.index]: '' })));
+  };
+
   const selectedDoc = documents.find((d) => d.id === selectedId);
   const docIdToColor = (() => {
     const m = new Map<string, string>();
@@ -115,11 +146,16 @@ export default function ChunksPage() {
         <Typography variant="body2" color="text.secondary" sx={{ mb: 2 }}>
           Projection 2D (t-SNE) des embeddings des chunks. Les points proches sont sémantiquement similaires.
         </Typography>
+        {vectorMapStale && !vectorMapLoading && (
+          <Alert severity="info" sx={{ mb: 2 }}>
+            Carte en cours de mise à jour après les derniers imports ; elle sera rafraîchie automatiquement.
+          </Alert>
+        )}
         {vectorMapLoading ? (
           <Box sx={{ display: 'flex', justifyContent: 'center', py: 4 }}>
             <CircularProgress />
           </Box>
-        ) : !vectorMapAvailable || vectorMapPoints.length === 0 ? (
+        ) : !vectorMapAvailable || (vectorMapPoints.length === 0 && !vectorMapStale) ? (
           <Alert severity="info">
             Activer Chroma (OPENAI_API_KEY) et importer des documents pour afficher la carte des vecteurs.
           </Alert>
@@ -134,19 +170,31 @@ export default function ChunksPage() {
                   content={({ active, payload }) => {
                     if (!active || !payload?.length) return null;
                     const p = payload[0].payload as VectorMapPoint;
+                    if (p.count > 1) {
+                      return (
+                        <Paper sx={{ p: 1.5, maxWidth: 360 }}>
+                          <Typography variant="body2">{p.count} chunks regroupés</Typography>
+                        </Paper>
+                      );
+                    }
+                    const snippet = p.text_snippet ?? snippets[p.index];
                     return (
                       <Paper sx={{ p: 1.5, maxWidth: 360 }}>
                         <Typography variant="caption" color="text.secondary">
                           {p.filename} — chunk #{p.chunk_index + 1}
                         </Typography>
                         <Typography variant="body2" sx={{ mt: 0.5, whiteSpace: 'pre-wrap', wordBreak: 'break-word' }}>
-                          {p.text_snippet || '(vide)'}
+                          {snippet === undefined ? 'Chargement…' : snippet || '(vide)'}
                         </Typography>
                       </Paper>
                     );
                   }}
                 />
-                <Scatter data={vectorMapPoints} name="chunks">
+                <Scatter
+                  data={vectorMapPoints}
+                  name="chunks"
+                  onMouseEnter={(point: { payload?: VectorMapPoint }) => point.payload && loadSnippet(point.payload)}
+                >
                   {vectorMapPoints.map((_, i) => (
                     <Cell key={i} fill={docIdToColor.get(vectorMapPoints[i].doc_id) ?? '#888'} />
                   ))}
@@ -15,6 +15,7 @@ import CircularProgress from '@mui/material/CircularProgress';
 import Paper from '@mui/material/Paper';
 import {
   ingestFileWithProgress,
+  ingestBatchWithProgress,
   listDocuments,
   deleteDocument,
   reingestDocument,
@@ -51,16 +52,68 @@ export default function ImportPage() {
 
   const stepLabels: Record<string, string> = {
     convert: 'Conversion du document',
+    convert_pages: 'Conversion des pages',
     split: 'Découpage en chunks',
     split_done: 'Découpage terminé',
     store: 'Enregistrement des vecteurs',
+    embed: 'Calcul des embeddings',
+    batch_done: 'Import groupé terminé',
     done: 'Terminé',
     error: 'Erreur',
   };
 
+  const isArchive = (name: string) => /\.(zip|tar|tgz|tbz2|txz|tar\.(gz|bz2|xz))$/i.test(name);
+
+  const handleBatchUpload = async (files: File[]) => {
+    setImportStep(null);
+    setImportMessage('');
+    const finished = new Set<number>();
+    try {
+      const res = await ingestBatchWithProgress(files, (event) => {
+        if (event.step === 'batch_start') {
+          setImportingName(`${event.files?.length ?? files.length} fichier(s)`);
+          return;
+        }
+        if (event.file_index != null && (event.step === 'done' || event.step === 'error')) {
+          finished.add(event.file_index);
+        }
+        setImportStep(event.step);
+        setImportMessage(
+          event.filename ? `${event.filename} : ${event.message || ''} (${finished.size} terminé(s))` : event.message || ''
+        );
+      });
+      if (res.failed > 0) {
+        setError(`${res.failed} fichier(s) en échec.`);
+      }
+      setSuccess(`${res.succeeded} fichier(s) importé(s).`);
+      setImportStep('done');
+      setImportMessage('');
+      await fetchDocuments();
+    } catch (e) {
+      setError(e instanceof Error ? e.message : "Erreur lors de l'import");
+      setImportStep('error');
+    }
+  };
+
   const handleFileUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
-    const file = e.target.files?.[0];
+    const files = Array.from(e.target.files ?? []);
+    const file = files[0];
     if (!file) return;
+    if (files.length > 1 || isArchive(file.name)) {
+      setError(null);
+      setSuccess(null);
+      setImporting(true);
+      setImportingName(`${files.length} fichier(s)`);
+      await handleBatchUpload(files);
+      setImporting(false);
+      setImportingName(null);
+      setTimeout(() => {
+        setImportStep(null);
+        setImportMessage('');
+      }, 2000);
+      e.target.value = '';
+      return;
+    }
     setError(null);
     setSuccess(null);
     setImporting(true);
@@ -131,7 +184,8 @@ export default function ImportPage() {
         Import de documents
       </Typography>
       <Typography color="text.secondary" paragraph>
-        Importez des PDF ou fichiers texte. Ils seront convertis en chunks pour le RAG.
+        Importez des PDF ou fichiers texte, un par un ou en lot (plusieurs fichiers ou archive
+        zip / tar). Ils seront convertis en chunks pour le RAG.
       </Typography>
 
       <Box sx={{ mb: 2, display: 'flex', alignItems: 'center', gap: 2, flexWrap: 'wrap' }}>
@@ -141,8 +195,14 @@ export default function ImportPage() {
           startIcon={importing ? <CircularProgress size={20} color="inherit" /> : <CloudUploadIcon />}
           disabled={importing}
         >
-          {importing ? `Import en cours… (${importingName})` : 'Choisir un fichier'}
-          <input type="file" hidden accept=".pdf,.txt" onChange={handleFileUpload} />
+          {importing ? `Import en cours… (${importingName})` : 'Choisir des fichiers'}
+          <input
+            type="file"
+            hidden
+            multiple
+            accept=".pdf,.txt,.zip,.tar,.gz,.tgz,.bz2,.xz"
+            onChange={handleFileUpload}
+          />
         </Button>
         {importing && importStep && (
           <Box sx={{ display: 'flex', flexDirection: 'column', gap: 0.5 }}>
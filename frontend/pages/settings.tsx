@@ -32,7 +32,8 @@ export default function SettingsPage() {
           const full: Settings = {
             ...s,
             retriever: s.retriever ?? { k: 5 },
-            chat: s.chat ?? { model: 'gpt-4o-mini', temperature: 0 },
+            chat: s.chat ?? { model: 'gpt-4o-mini', temperature: 0, max_context_tokens: 3000 },
+            answer_cache: s.answer_cache ?? { enabled: true, similarity_threshold: 0.95, ttl_seconds: 3600, max_entries: 512 },
           };
           setSettings(full);
           setSeparatorsText(JSON.stringify(full.chunks.separators, null, 2));
@@ -71,7 +72,9 @@ export default function SettingsPage() {
         },
         docling: settings.docling,
         retriever: settings.retriever ?? { k: 5 },
-        chat: settings.chat ?? { model: 'gpt-4o-mini', temperature: 0 },
+        ...(settings.rerank ? { rerank: settings.rerank } : {}),
+        ...(settings.embeddings ? { embeddings: settings.embeddings } : {}),
+        chat: settings.chat ?? { model: 'gpt-4o-mini', temperature: 0, max_context_tokens: 3000 },
       });
       setSettings(updated);
       setSeparatorsText(JSON.stringify(updated.chunks.separators, null, 2));
@@ -107,11 +110,35 @@ export default function SettingsPage() {
     });
   };
 
+  const updateEmbeddings = (patch: Partial<NonNullable<Settings['embeddings']>>) => {
+    if (!settings?.embeddings) return;
+    setSettings({
+      ...settings,
+      embeddings: { ...settings.embeddings, ...patch },
+    });
+  };
+
+  const updateRerank = (patch: Partial<NonNullable<Settings['rerank']>>) => {
+    if (!settings?.rerank) return;
+    setSettings({
+      ...settings,
+      rerank: { ...settings.rerank, ...patch },
+    });
+  };
+
+  const updateAnswerCache = (patch: Partial<NonNullable<Settings['answer_cache']>>) => {
+    if (!settings) return;
+    setSettings({
+      ...settings,
+      answer_cache: { ...(settings.answer_cache ?? { enabled: true, similarity_threshold: 0.95, ttl_seconds: 3600, max_entries: 512 }), ...patch },
+    });
+  };
+
   const updateChat = (patch: Partial<Settings['chat']>) => {
     if (!settings) return;
     setSettings({
       ...settings,
-      chat: { ...(settings.chat ?? { model: 'gpt-4o-mini', temperature: 0 }), ...patch },
+      chat: { ...(settings.chat ?? { model: 'gpt-4o-mini', temperature: 0, max_context_tokens: 3000 }), ...patch },
     });
   };
 
@@ -143,6 +170,17 @@ export default function SettingsPage() {
           Paramètres du RecursiveCharacterTextSplitter (LangChain). S&apos;applique aux prochains imports.
         </Typography>
         <Box sx={{ display: 'flex', flexDirection: 'column', gap: 2, maxWidth: 480 }}>
+          <FormControl size="small" sx={{ minWidth: 200 }}>
+            <InputLabel>Stratégie de découpage</InputLabel>
+            <Select
+              value={settings.chunks.strategy ?? 'recursive'}
+              label="Stratégie de découpage"
+              onChange={(e) => updateChunks({ strategy: e.target.value as Settings['chunks']['strategy'] })}
+            >
+              <MenuItem value="recursive">Séparateurs (RecursiveCharacterTextSplitter)</MenuItem>
+              <MenuItem value="structure">Structure du document (titres, tableaux, pages)</MenuItem>
+            </Select>
+          </FormControl>
           <Typography variant="body2">Taille des chunks (caractères) : {settings.chunks.chunk_size}</Typography>
           <Slider
             value={settings.chunks.chunk_size}
@@ -205,6 +243,23 @@ export default function SettingsPage() {
             inputProps={{ min: 1 }}
             size="small"
           />
+          <TextField
+            label="Conversion parallèle à partir de (pages)"
+            type="number"
+            value={settings.docling.parallel_min_pages}
+            onChange={(e) => updateDocling({ parallel_min_pages: parseInt(e.target.value, 10) || 64 })}
+            inputProps={{ min: 2 }}
+            helperText="Les PDF plus longs sont convertis par plages de pages en parallèle"
+            size="small"
+          />
+          <TextField
+            label="Pages par plage"
+            type="number"
+            value={settings.docling.page_range_size}
+            onChange={(e) => updateDocling({ page_range_size: parseInt(e.target.value, 10) || 32 })}
+            inputProps={{ min: 1 }}
+            size="small"
+          />
           <FormControlLabel
             control={
               <Switch
@@ -262,6 +317,53 @@ export default function SettingsPage() {
         </Box>
       </Paper>
 
+      {settings.embeddings && (
+        <Paper variant="outlined" sx={{ p: 3, mb: 3 }}>
+          <Typography variant="h6" gutterBottom>
+            Embeddings
+          </Typography>
+          <Typography variant="body2" color="text.secondary" sx={{ mb: 2 }}>
+            Fournisseur des vecteurs. Chaque modèle a sa propre collection : après un changement, réimportez les documents.
+          </Typography>
+          <Box sx={{ display: 'flex', flexDirection: 'column', gap: 2, maxWidth: 480 }}>
+            <FormControl size="small" sx={{ minWidth: 200 }}>
+              <InputLabel>Fournisseur</InputLabel>
+              <Select
+                value={settings.embeddings.provider}
+                label="Fournisseur"
+                onChange={(e) =>
+                  updateEmbeddings({
+                    provider: e.target.value as NonNullable<Settings['embeddings']>['provider'],
+                    model: null,
+                  })
+                }
+              >
+                <MenuItem value="openai">OpenAI (OPENAI_API_KEY)</MenuItem>
+                <MenuItem value="fastembed">Local (fastembed, CPU, hors ligne)</MenuItem>
+              </Select>
+            </FormControl>
+            <TextField
+              label="Modèle (vide = modèle par défaut)"
+              value={settings.embeddings.model ?? ''}
+              onChange={(e) => updateEmbeddings({ model: e.target.value || null })}
+              size="small"
+            />
+            {settings.embeddings.provider === 'fastembed' && (
+              <TextField
+                label="Threads (vide = tous les cœurs)"
+                type="number"
+                value={settings.embeddings.threads ?? ''}
+                onChange={(e) =>
+                  updateEmbeddings({ threads: e.target.value ? parseInt(e.target.value, 10) : null })
+                }
+                inputProps={{ min: 1 }}
+                size="small"
+              />
+            )}
+          </Box>
+        </Paper>
+      )}
+
       <Paper variant="outlined" sx={{ p: 3, mb: 3 }}>
         <Typography variant="h6" gutterBottom>
           Retriever (RAG)
@@ -279,9 +381,84 @@ export default function SettingsPage() {
             step={1}
             valueLabelDisplay="auto"
           />
+          <FormControl size="small" sx={{ minWidth: 200 }}>
+            <InputLabel>Mode de recherche</InputLabel>
+            <Select
+              value={settings.retriever.mode ?? 'auto'}
+              label="Mode de recherche"
+              onChange={(e) =>
+                updateRetriever({ mode: e.target.value as Settings['retriever']['mode'] })
+              }
+            >
+              <MenuItem value="auto">Auto (sémantique si disponible)</MenuItem>
+              <MenuItem value="similarity">Sémantique (embeddings)</MenuItem>
+              <MenuItem value="keyword">Mots-clés (BM25)</MenuItem>
+              <MenuItem value="hybrid">Hybride (sémantique + mots-clés)</MenuItem>
+            </Select>
+          </FormControl>
         </Box>
       </Paper>
 
+      {settings.rerank && (
+        <Paper variant="outlined" sx={{ p: 3, mb: 3 }}>
+          <Typography variant="h6" gutterBottom>
+            Rerank
+          </Typography>
+          <Typography variant="body2" color="text.secondary" sx={{ mb: 2 }}>
+            Second étage : les meilleurs candidats sont réordonnés par un modèle local (CPU) avant de garder les k premiers.
+          </Typography>
+          <Box sx={{ display: 'flex', flexDirection: 'column', gap: 2, maxWidth: 480 }}>
+            <FormControlLabel
+              control={
+                <Switch
+                  checked={settings.rerank.enabled}
+                  onChange={(e) => updateRerank({ enabled: e.target.checked })}
+                />
+              }
+              label="Activer le rerank"
+            />
+            <FormControl size="small" sx={{ minWidth: 200 }}>
+              <InputLabel>Backend</InputLabel>
+              <Select
+                value={settings.rerank.backend}
+                label="Backend"
+                onChange={(e) =>
+                  updateRerank({ backend: e.target.value as NonNullable<Settings['rerank']>['backend'] })
+                }
+              >
+                <MenuItem value="auto">Auto (cross-encoder si installé)</MenuItem>
+                <MenuItem value="cross_encoder">Cross-encoder (sentence-transformers)</MenuItem>
+                <MenuItem value="onnx">Cross-encoder ONNX</MenuItem>
+                <MenuItem value="lexical">Lexical (BM25 sur les candidats)</MenuItem>
+              </Select>
+            </FormControl>
+            <TextField
+              label="Modèle"
+              value={settings.rerank.model}
+              onChange={(e) => updateRerank({ model: e.target.value })}
+              size="small"
+            />
+            <TextField
+              label="Candidats du premier étage"
+              type="number"
+              value={settings.rerank.candidates}
+              onChange={(e) => updateRerank({ candidates: parseInt(e.target.value, 10) || 30 })}
+              inputProps={{ min: 1, max: 100 }}
+              size="small"
+            />
+            <TextField
+              label="Délai maximal (ms)"
+              type="number"
+              value={settings.rerank.timeout_ms}
+              onChange={(e) => updateRerank({ timeout_ms: parseInt(e.target.value, 10) || 800 })}
+              inputProps={{ min: 50 }}
+              helperText="Au-delà, les candidats non scorés gardent l'ordre du premier étage"
+              size="small"
+            />
+          </Box>
+        </Paper>
+      )}
+
       <Paper variant="outlined" sx={{ p: 3, mb: 3 }}>
         <Typography variant="h6" gutterBottom>
           Chat (LLM)
@@ -306,9 +483,71 @@ export default function SettingsPage() {
             step={0.1}
             valueLabelDisplay="auto"
           />
+          <TextField
+            label="Budget du contexte (tokens)"
+            type="number"
+            value={settings.chat.max_context_tokens ?? 3000}
+            onChange={(e) => updateChat({ max_context_tokens: parseInt(e.target.value, 10) || 3000 })}
+            inputProps={{ min: 100 }}
+            helperText="Passages retrouvés envoyés au modèle, par ordre de pertinence"
+            size="small"
+          />
         </Box>
       </Paper>
 
+      {settings.answer_cache && (
+        <Paper variant="outlined" sx={{ p: 3, mb: 3 }}>
+          <Typography variant="h6" gutterBottom>
+            Cache de réponses
+          </Typography>
+          <Typography variant="body2" color="text.secondary" sx={{ mb: 2 }}>
+            Réutilise la réponse d&apos;une question très proche déjà posée sur le même corpus (sans appel au LLM).
+            Vidé à chaque import ou suppression de document.
+          </Typography>
+          <Box sx={{ display: 'flex', flexDirection: 'column', gap: 2, maxWidth: 480 }}>
+            <FormControlLabel
+              control={
+                <Switch
+                  checked={settings.answer_cache.enabled}
+                  onChange={(e) => updateAnswerCache({ enabled: e.target.checked })}
+                />
+              }
+              label="Activer le cache"
+            />
+            <Typography variant="body2">
+              Seuil de similarité : {settings.answer_cache.similarity_threshold}
+            </Typography>
+            <Slider
+              value={settings.answer_cache.similarity_threshold}
+              onChange={(_, v) => updateAnswerCache({ similarity_threshold: v as number })}
+              min={0.5}
+              max={1}
+              step={0.01}
+              valueLabelDisplay="auto"
+              disabled={!settings.answer_cache.enabled}
+            />
+            <TextField
+              label="Durée de vie (secondes, 0 = illimitée)"
+              type="number"
+              value={settings.answer_cache.ttl_seconds}
+              onChange={(e) => updateAnswerCache({ ttl_seconds: Math.max(0, parseInt(e.target.value, 10) || 0) })}
+              inputProps={{ min: 0 }}
+              size="small"
+              disabled={!settings.answer_cache.enabled}
+            />
+            <TextField
+              label="Nombre maximal d'entrées"
+              type="number"
+              value={settings.answer_cache.max_entries}
+              onChange={(e) => updateAnswerCache({ max_entries: Math.max(1, parseInt(e.target.value, 10) || 1) })}
+              inputProps={{ min: 1 }}
+              size="small"
+              disabled={!settings.answer_cache.enabled}
+            />
+          </Box>
+        </Paper>
+      )}
+
       <Button
         variant="contained"
         onClick={handleSave}